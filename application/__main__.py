@@ -6,6 +6,7 @@ from infrastructure.event_sourced_repos.board_repository import BoardRepository
 from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
 from infrastructure.event_store import EventStore
 from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
 
 from kanban.domain.model.board import start_project
 from kanban.domain.model.workitem import register_new_work_item
@@ -17,15 +18,16 @@ def main():
     es = EventStore("store.events")
     ps = PersistenceSubscriber(es)
 
-    board = start_project("Test", "A test project")
-    board_id = board.id
+    with unit_of_work(ps):
+        board = start_project("Test", "A test project")
+        board_id = board.id
 
-    board.name = "Another name"
-    board.description = "A different description"
+        board.name = "Another name"
+        board.description = "A different description"
 
-    todo_column = board.add_new_column("To do", 20)
-    doing_column = board.add_new_column("Doing", 3)
-    done_column = board.add_new_column("Done", None)
+        todo_column = board.add_new_column("To do", 20)
+        doing_column = board.add_new_column("Doing", 3)
+        done_column = board.add_new_column("Done", None)
 
     #todo_column = board.column_with_name("To do")
     #impeded_column = board.insert_new_column_before(todo_column, "Impeded", 7)
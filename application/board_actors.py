@@ -0,0 +1,209 @@
+"""An asyncio command processor with one in-memory actor per Board.
+
+Each actor owns a mailbox and keeps its Board hot in memory, so commands need not replay the
+Board from the event store. An actor processes its commands sequentially. The events resulting
+from commands processed by all actors during one turn of the event loop are persisted together
+in a single append. If that append fails, the events of each Board are appended separately, so
+that only the commands against a Board whose events cannot be stored, for example because of a
+conflicting append, fail. Actors which have been idle for a while are evicted, and are rehydrated from
+the event store when next needed.
+
+    system = BoardActorSystem(board_repo, work_item_repo, persistence_subscriber)
+    await system.add_new_column(board_id, "To do", 10)
+    await system.schedule_work_item(board_id, work_item_id)
+    await system.close()
+"""
+
+import asyncio
+
+from kanban.domain.model.events import deferred_publication, deliver
+
+
+class BoardActorSystem:
+    """Routes commands to one actor per Board."""
+
+    def __init__(self, board_repository, work_item_repository, persistence_subscriber, idle_timeout=60.0):
+        """Create a BoardActorSystem.
+
+        Must be created, and used, within a running event loop.
+
+        Args:
+            board_repository: A Board Repository from which Boards will be hydrated.
+
+            work_item_repository: A WorkItem Repository from which WorkItems referred to by
+                id in commands will be retrieved.
+
+            persistence_subscriber: The PersistenceSubscriber used to store events.
+
+            idle_timeout: The time in seconds after which an actor with an empty mailbox
+                will be evicted.
+        """
+        self._board_repository = board_repository
+        self._work_item_repository = work_item_repository
+        self._persistence_subscriber = persistence_subscriber
+        self._idle_timeout = idle_timeout
+        self._loop = asyncio.get_running_loop()
+        self._actors = {}
+        self._pending_batches = []
+        self._flush_scheduled = False
+
+    @property
+    def active_board_ids(self):
+        """The ids of Boards which currently have an actor in memory."""
+        return frozenset(self._actors)
+
+    async def execute(self, board_id, command):
+        """Execute a command against a Board.
+
+        Args:
+            board_id: The id of the Board against which the command is to be executed.
+
+            command: A unary callable which accepts the Board. It must not block.
+
+        Returns:
+            The result of the command, once its events have been persisted.
+        """
+        actor = self._actors.get(board_id)
+        if actor is None:
+            actor = _BoardActor(self, board_id)
+            self._actors[board_id] = actor
+        future = self._loop.create_future()
+        actor.mailbox.put_nowait((command, future))
+        return await future
+
+    async def schedule_work_item(self, board_id, work_item):
+        """Schedule a WorkItem, or the WorkItem with the specified id, on a Board."""
+        work_item = await self._work_item(work_item)
+        return await self.execute(board_id, lambda board: board.schedule_work_item(work_item))
+
+    async def advance_work_item(self, board_id, work_item):
+        """Advance a WorkItem, or the WorkItem with the specified id, on a Board."""
+        work_item = await self._work_item(work_item)
+        return await self.execute(board_id, lambda board: board.advance_work_item(work_item))
+
+    async def retire_work_item(self, board_id, work_item):
+        """Retire a WorkItem, or the WorkItem with the specified id, from a Board."""
+        work_item = await self._work_item(work_item)
+        return await self.execute(board_id, lambda board: board.retire_work_item(work_item))
+
+    async def abandon_work_item(self, board_id, work_item):
+        """Abandon a WorkItem, or the WorkItem with the specified id, on a Board."""
+        work_item = await self._work_item(work_item)
+        return await self.execute(board_id, lambda board: board.abandon_work_item(work_item))
+
+    async def add_new_column(self, board_id, name, wip_limit):
+        """Add a new column at the right side of a Board."""
+        return await self.execute(board_id, lambda board: board.add_new_column(name, wip_limit))
+
+    async def insert_new_column_before(self, board_id, succeeding_column_name, name, wip_limit):
+        """Insert a new column to the left of the named column on a Board."""
+        return await self.execute(board_id, lambda board: board.insert_new_column_before(
+            board.column_with_name(succeeding_column_name), name, wip_limit))
+
+    async def remove_column_by_name(self, board_id, name):
+        """Remove the named column from a Board."""
+        return await self.execute(board_id, lambda board: board.remove_column_by_name(name))
+
+    async def close(self):
+        """Wait for all queued commands to complete, then stop all actors."""
+        for actor in list(self._actors.values()):
+            await actor.mailbox.join()
+        for actor in list(self._actors.values()):
+            actor.task.cancel()
+        self._actors.clear()
+
+    async def _work_item(self, work_item):
+        if isinstance(work_item, str):
+            return await self._loop.run_in_executor(None, self._work_item_repository.work_item_with_id, work_item)
+        return work_item
+
+    async def _hydrate(self, board_id):
+        return await self._loop.run_in_executor(None, self._board_repository.board_with_id, board_id)
+
+    def _evict(self, actor):
+        if self._actors.get(actor.board_id) is actor:
+            del self._actors[actor.board_id]
+
+    async def _persist(self, board_id, events):
+        """Persist the events of a Board in the batch for the current turn of the event loop."""
+        future = self._loop.create_future()
+        self._pending_batches.append((board_id, events, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+        await future
+
+    def _flush(self):
+        batches = self._pending_batches
+        self._pending_batches = []
+        self._flush_scheduled = False
+        try:
+            self._store([event for _, batch_events, _ in batches for event in batch_events], batches)
+        except Exception as e:
+            if len({board_id for board_id, _, _ in batches}) == 1:
+                for _, _, future in batches:
+                    future.set_exception(e)
+                return
+            # A failed append stores nothing, so store each Board's events on their own
+            batches_of_board = {}
+            for batch in batches:
+                batches_of_board.setdefault(batch[0], []).append(batch)
+            for board_batches in batches_of_board.values():
+                try:
+                    self._store([event for _, batch_events, _ in board_batches for event in batch_events],
+                                board_batches)
+                except Exception as board_exception:
+                    for _, _, future in board_batches:
+                        future.set_exception(board_exception)
+
+    def _store(self, events, batches):
+        """Append events in a single batch, then resolve the futures of the batches and deliver the events."""
+        self._persistence_subscriber.store_events(events)
+        for _, _, future in batches:
+            future.set_result(None)
+        for event in events:
+            deliver(event, excluded_subscribers={self._persistence_subscriber.store_event})
+
+
+class _BoardActor:
+    """Processes the commands for one Board, sequentially."""
+
+    def __init__(self, system, board_id):
+        self.system = system
+        self.board_id = board_id
+        self.mailbox = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        self._board = None
+
+    async def _run(self):
+        while True:
+            try:
+                command, future = await asyncio.wait_for(self.mailbox.get(), self.system._idle_timeout)
+            except asyncio.TimeoutError:
+                if self.mailbox.empty():
+                    self.system._evict(self)
+                    return
+                continue
+            try:
+                result = await self._process(command)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.mailbox.task_done()
+
+    async def _process(self, command):
+        if self._board is None:
+            self._board = await self.system._hydrate(self.board_id)
+        try:
+            with deferred_publication() as events:
+                result = command(self._board)
+            await self.system._persist(self.board_id, events)
+        except Exception:
+            # The in-memory Board may have diverged from the store, so rehydrate it next time
+            self._board = None
+            raise
+        return result
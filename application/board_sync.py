@@ -0,0 +1,242 @@
+"""Delta synchronization of Boards with clients.
+
+Rather than fetching the whole state of a Board, a client which holds a Board at some version
+asks for only what has changed since: either the Board's subsequent events, or a compact diff
+of its state. Both are served from the per-aggregate index, so the cost depends on the number
+of events since the client's version, not on the size of the event log. A client may also wait,
+by long-polling or with an async iterator, until there is something new.
+
+    board_sync = BoardSync(event_store)
+    version, events = board_sync.wait_for_events(board_id, client_version, timeout=30)
+
+    async for version, events in board_sync.follow(board_id, client_version):
+        ...
+"""
+
+import asyncio
+import threading
+import time
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_sourced_projections.aggregate_index import shared_aggregate_index
+from kanban.domain.model import board
+from kanban.domain.model.entity import Entity
+from kanban.domain.model.events import subscribe, unsubscribe
+
+
+class BoardSync:
+    """Serves the changes to Boards since versions held by clients.
+
+    Waiters are woken as soon as an event for their Board is published in this process. Events
+    appended by other processes are noticed by polling the event store.
+    """
+
+    def __init__(self, event_store, aggregate_index=None, poll_interval=1.0):
+        """Create a BoardSync.
+
+        Args:
+            event_store: The EventStore in which Board events are stored.
+
+            aggregate_index: An optional AggregateIndex. By default the index shared by all
+                users of the event store is used.
+
+            poll_interval: The longest time in seconds for which a waiter sleeps before
+                checking the event store again.
+        """
+        self._event_store = event_store
+        self._aggregate_index = aggregate_index or shared_aggregate_index(event_store)
+        self._poll_interval = poll_interval
+        self._condition = threading.Condition()
+        # For each Board awaited by threads, [number of events published, number of waiting threads]
+        self._generations = {}
+        # For each Board awaited by coroutines, a set of (event loop, asyncio.Event) pairs
+        self._async_waiters = {}
+        subscribe(self._is_awaited, self._notify)
+
+    def close(self):
+        """Stop being notified of published events."""
+        unsubscribe(self._is_awaited, self._notify)
+
+    def version(self, board_id):
+        """The current version of a Board, or None if there is no such Board."""
+        return self._aggregate_index.version(board_id)
+
+    def events_since(self, board_id, originator_version):
+        """Obtain the events of a Board after a version.
+
+        Args:
+            board_id: The id of the Board.
+
+            originator_version: The version of the Board held by the client, or None if the
+                client holds no version, in which case all the Board's events are obtained.
+
+        Returns:
+            A pair of the version of the Board after the events, and a list of the events
+            which take it there from originator_version, which is empty if there are none.
+        """
+        positions = self._aggregate_index.positions(board_id, after_version=originator_version)
+        events = [deserialize_event(stored_event) for stored_event in self._aggregate_index.read(positions)]
+        return (_version_after(events[-1]) if events else originator_version), events
+
+    def diff_since(self, board_id, originator_version):
+        """Obtain a compact diff of the state of a Board since a version.
+
+        Columns are compared by name, WIP limit and work items, so unchanged columns are
+        omitted.
+
+        Args:
+            board_id: The id of the Board.
+
+            originator_version: The version of the Board held by the client, or None if the
+                client holds no version, in which case the whole state is included.
+
+        Returns:
+            None if the Board has not changed since originator_version, otherwise a dictionary
+            with 'board_id', 'from_version' and 'version' keys, and either 'discarded' if the
+            Board has been discarded, or any of 'name', 'description', 'columns' (a list of
+            dictionaries describing new or changed columns, each with 'id', 'name',
+            'wip_limit' and 'work_item_ids' keys), 'removed_column_ids' and 'column_ids' (the
+            new order of all columns, if it has changed).
+
+        Raises:
+            ValueError: If there is no Board with the id.
+        """
+        version = self.version(board_id)
+        if version is None:
+            raise ValueError("No Board with id {}".format(board_id))
+        if version == originator_version:
+            return None
+        diff = dict(board_id=board_id, from_version=originator_version, version=version)
+
+        current = self._aggregate_index.reconstitute(board_id, board.mutate, as_of_version=version)
+        if current.discarded:
+            diff['discarded'] = True
+            return diff
+        previous = None
+        if originator_version is not None:
+            previous = self._aggregate_index.reconstitute(board_id, board.mutate, as_of_version=originator_version)
+
+        for attribute in ('name', 'description'):
+            value = getattr(current, attribute)
+            if previous is None or getattr(previous, attribute) != value:
+                diff[attribute] = value
+
+        previous_columns = {} if previous is None else {column.id: _column_state(column)
+                                                        for column in previous.columns()}
+        current_columns = [(column.id, _column_state(column)) for column in current.columns()]
+        changed_columns = [dict(state, id=column_id) for column_id, state in current_columns
+                           if previous_columns.get(column_id) != state]
+        if changed_columns:
+            diff['columns'] = changed_columns
+        current_column_ids = [column_id for column_id, _ in current_columns]
+        removed_column_ids = [column_id for column_id in previous_columns if column_id not in current_column_ids]
+        if removed_column_ids:
+            diff['removed_column_ids'] = removed_column_ids
+        if list(previous_columns) != current_column_ids:
+            diff['column_ids'] = current_column_ids
+        return diff
+
+    def wait_for_events(self, board_id, originator_version, timeout=None):
+        """Wait until a Board has events after a version, then obtain them.
+
+        Args:
+            board_id: The id of the Board.
+
+            originator_version: The version of the Board held by the client.
+
+            timeout: An optional time in seconds after which to give up waiting.
+
+        Returns:
+            As for events_since(). If the timeout expires first, the list of events is empty.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._generations.setdefault(board_id, [0, 0])[1] += 1
+        try:
+            while True:
+                with self._condition:
+                    generation = self._generations[board_id][0]
+                version, events = self.events_since(board_id, originator_version)
+                if events:
+                    return version, events
+                wait_time = self._poll_interval
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return version, events
+                    wait_time = min(wait_time, remaining)
+                with self._condition:
+                    if self._generations[board_id][0] == generation:
+                        self._condition.wait(wait_time)
+        finally:
+            with self._condition:
+                waiting = self._generations[board_id]
+                waiting[1] -= 1
+                if waiting[1] == 0:
+                    del self._generations[board_id]
+
+    async def follow(self, board_id, originator_version):
+        """Follow the events of a Board after a version, as they occur.
+
+        Must be used within a running event loop. Reads of the event store are made in the
+        loop's default executor.
+
+        Args:
+            board_id: The id of the Board.
+
+            originator_version: The version of the Board held by the client.
+
+        Yields:
+            Pairs of the version of the Board and a non-empty list of the events which took it
+            there, as for events_since().
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        with self._condition:
+            self._async_waiters.setdefault(board_id, set()).add(waiter)
+        try:
+            while True:
+                wakeup.clear()
+                version, events = await loop.run_in_executor(None, self.events_since, board_id, originator_version)
+                if events:
+                    originator_version = version
+                    yield version, events
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                waiters = self._async_waiters[board_id]
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._async_waiters[board_id]
+
+    def _is_awaited(self, event):
+        originator_id = getattr(event, 'originator_id', None)
+        return originator_id in self._generations or originator_id in self._async_waiters
+
+    def _notify(self, event):
+        with self._condition:
+            waiting = self._generations.get(event.originator_id)
+            if waiting is not None:
+                waiting[0] += 1
+                self._condition.notify_all()
+            async_waiters = list(self._async_waiters.get(event.originator_id, ()))
+        for loop, wakeup in async_waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+
+
+def _version_after(event):
+    """The version an originator reaches by applying an event."""
+    if isinstance(event, Entity.Created):
+        return event.originator_version
+    if isinstance(event, Entity.AttributesChanged):
+        return event.originator_version + event.changes
+    return event.originator_version + 1
+
+
+def _column_state(column):
+    return dict(name=column.name, wip_limit=column.wip_limit, work_item_ids=list(column.work_item_ids()))
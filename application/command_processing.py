@@ -0,0 +1,66 @@
+"""Thread-safe execution of commands against Boards."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from infrastructure.locking import StripedLock
+from infrastructure.unit_of_work import unit_of_work
+
+
+class CommandProcessor:
+    """Executes commands against Boards, in parallel for different Boards.
+
+    Each command is executed with the lock for its Board held, against a freshly loaded Board,
+    within a unit of work so that all of the resulting events are persisted in a single append.
+    Commands against the same Board are therefore serialized, while those against different
+    Boards may be executed concurrently by a pool of threads.
+    """
+
+    def __init__(self, board_repository, persistence_subscriber, max_workers=None, stripes=64):
+        """Create a CommandProcessor.
+
+        Args:
+            board_repository: A Board Repository from which Boards will be loaded.
+
+            persistence_subscriber: The PersistenceSubscriber used to store events.
+
+            max_workers: The maximum number of threads used by submit().
+
+            stripes: The number of locks shared between Board ids.
+        """
+        self._board_repository = board_repository
+        self._persistence_subscriber = persistence_subscriber
+        self._locks = StripedLock(stripes)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def execute(self, board_id, command):
+        """Execute a command against a Board in the calling thread.
+
+        Args:
+            board_id: The id of the Board against which the command is to be executed.
+
+            command: A unary callable which accepts the Board.
+
+        Returns:
+            The result of the command.
+        """
+        with self._locks.locked(board_id):
+            board = self._board_repository.board_with_id(board_id)
+            with unit_of_work(self._persistence_subscriber):
+                return command(board)
+
+    def submit(self, board_id, command):
+        """Schedule a command to be executed against a Board by the thread pool.
+
+        Args:
+            board_id: The id of the Board against which the command is to be executed.
+
+            command: A unary callable which accepts the Board.
+
+        Returns:
+            A concurrent.futures.Future for the result of the command.
+        """
+        return self._executor.submit(self.execute, board_id, command)
+
+    def close(self):
+        """Wait for submitted commands to complete, and release the thread pool."""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,228 @@
+"""Replay and append benchmark suite.
+
+Generates a synthetic event log through the domain API, then times append throughput, cold
+replay through the repositories, projection builds, publish fan-out, overdue queries and
+completion forecasts.
+Results are emitted as JSON, so that they can be compared across commits.
+
+    python -m benchmarks --boards 100 --work-items 50 --output results.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.reporting import git_revision
+from benchmarks.workload import generate_workload
+from infrastructure.event_processing import extant_entity_ids
+from infrastructure.event_sourced_projections.board_lead_time_projection import LeadTimeProjection
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import start_project
+from kanban.domain.model.events import publish, subscribe, unsubscribe
+from kanban.domain.services import forecasting
+from kanban.domain.services.overdue import locate_overdue_work_items
+from utility import instrumentation
+
+
+def timed(function, repeat=3):
+    """Time a function of no arguments, returning the best of several runs in seconds, and its result."""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_append(directory, number_of_events):
+    """Time appending Board events, one at a time and in units of work of ten events."""
+    results = {}
+    for mode, batch_size in (('single', 1), ('unit_of_work_10', 10)):
+        event_store = EventStore(os.path.join(directory, 'append-{}.events'.format(mode)))
+        persistence_subscriber = PersistenceSubscriber(event_store)
+        try:
+            board = start_project("Append", "Append benchmark")
+            start_time = time.perf_counter()
+            for batch in range(number_of_events // batch_size):
+                with unit_of_work(persistence_subscriber):
+                    for i in range(batch_size):
+                        board.description = "Description {}-{}".format(batch, i)
+            elapsed = time.perf_counter() - start_time
+        finally:
+            persistence_subscriber.close()
+        results[mode] = dict(events=number_of_events,
+                             seconds=elapsed,
+                             events_per_second=number_of_events / elapsed)
+    return results
+
+
+def benchmark_replay(event_store):
+    """Time cold replay of all aggregates through fresh repositories."""
+    results = {}
+    seconds, board_ids = timed(lambda: extant_entity_ids(event_store, 'Board'))
+    results['extant_board_ids'] = dict(seconds=seconds, count=len(board_ids))
+    seconds, boards = timed(lambda: list(BoardRepository(event_store).all_boards()))
+    results['all_boards'] = dict(seconds=seconds, count=len(boards))
+    seconds, work_items = timed(lambda: list(WorkItemRepository(event_store).all_work_items()))
+    results['all_work_items'] = dict(seconds=seconds, count=len(work_items))
+    seconds, work_items = timed(lambda: list(WorkItemRepository(event_store, streaming=True).all_work_items()))
+    results['all_work_items_streaming'] = dict(seconds=seconds, count=len(work_items))
+    if board_ids:
+        board_id = min(board_ids)
+        seconds, _ = timed(lambda: BoardRepository(event_store).board_with_id(board_id))
+        results['board_with_id'] = dict(seconds=seconds)
+    return results, boards
+
+
+def benchmark_projection(event_store, boards, number_of_projections):
+    """Time building lead time projections for a number of boards."""
+    def build():
+        for board in boards[:number_of_projections]:
+            LeadTimeProjection(board.id, event_store).close()
+    seconds, _ = timed(build)
+    return dict(projections=min(number_of_projections, len(boards)),
+                seconds=seconds,
+                seconds_per_projection=seconds / max(1, min(number_of_projections, len(boards))))
+
+
+def benchmark_publish(number_of_events, number_of_subscribers):
+    """Time publishing events to a number of subscribers, each with its own predicate."""
+    subscriptions = [(_accept_all(), _ignore()) for _ in range(number_of_subscribers)]
+    for predicate, handler in subscriptions:
+        subscribe(predicate, handler)
+    try:
+        board = start_project("Publish", "Publish benchmark")
+        event = board.Discarded(originator_id=board.id, originator_version=board.version)
+        seconds, _ = timed(lambda: [publish(event) for _ in range(number_of_events)])
+    finally:
+        for predicate, handler in subscriptions:
+            unsubscribe(predicate, handler)
+    return dict(events=number_of_events,
+                subscribers=number_of_subscribers,
+                seconds=seconds,
+                events_per_second=number_of_events / seconds)
+
+
+def _accept_all():
+    # A distinct predicate for each subscriber
+    return lambda event: True
+
+
+def _ignore():
+    # A distinct subscriber for each subscription, so that the handlers are not de-duplicated
+    return lambda event: None
+
+
+def benchmark_overdue(event_store, boards, number_of_boards):
+    """Time locating overdue work items on a number of boards."""
+    work_item_repository = WorkItemRepository(event_store)
+
+    def locate():
+        return sum(len(list(locate_overdue_work_items(board, work_item_repository)))
+                   for board in boards[:number_of_boards])
+    seconds, overdue = timed(locate)
+    return dict(boards=min(number_of_boards, len(boards)), seconds=seconds, overdue_work_items=overdue)
+
+
+def benchmark_forecasting(number_of_boards, trials, seed):
+    """Time Monte Carlo completion forecasts for a number of boards with synthetic throughput histories."""
+    generator = random.Random(seed)
+    histories = [([generator.choice((0, 0, 1, 2, 3, 5)) for _ in range(90)], generator.randint(20, 300))
+                 for _ in range(number_of_boards)]
+
+    def forecast():
+        for board_seed, (throughput, remaining_items) in enumerate(histories):
+            forecasting.forecast_completion(throughput, remaining_items, trials, seed=board_seed)
+    seconds, _ = timed(forecast, repeat=1)
+    return dict(boards=number_of_boards,
+                trials=trials,
+                vectorized=forecasting.numpy is not None,
+                seconds=seconds,
+                seconds_per_board=seconds / max(1, number_of_boards))
+
+
+def run_suite(boards, work_items_per_board, seed, store_path=None):
+    """Run the whole benchmark suite.
+
+    Args:
+        boards: The number of boards in the synthetic workload.
+
+        work_items_per_board: The number of work items scheduled on each board.
+
+        seed: The workload seed.
+
+        store_path: An optional path to an existing event log to use instead of generating one.
+
+    Returns:
+        A dictionary of results.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if store_path is None:
+            store_path = os.path.join(directory, 'workload.events')
+            start_time = time.perf_counter()
+            commands = generate_workload(EventStore(store_path), boards, work_items_per_board, seed)
+            generation_seconds = time.perf_counter() - start_time
+        else:
+            commands, generation_seconds = None, None
+        event_store = EventStore(store_path)
+        with open(store_path, 'rb') as store_file:
+            number_of_events = sum(1 for _ in store_file)
+
+        replay, replayed_boards = benchmark_replay(event_store)
+        return dict(
+            revision=git_revision(),
+            python=platform.python_version(),
+            timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            workload=dict(boards=boards,
+                          work_items_per_board=work_items_per_board,
+                          seed=seed,
+                          events=number_of_events,
+                          bytes=os.path.getsize(store_path),
+                          commands=commands,
+                          generation_seconds=generation_seconds),
+            append=benchmark_append(directory, 2000),
+            replay=replay,
+            projection=benchmark_projection(event_store, replayed_boards, 10),
+            publish=benchmark_publish(10000, 10),
+            overdue=benchmark_overdue(event_store, replayed_boards, 10),
+            forecasting=benchmark_forecasting(300, 10000, seed))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--boards', type=int, default=100)
+    parser.add_argument('--work-items', type=int, default=50, help="Work items per board")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--store', help="Use an existing event log rather than generating one")
+    parser.add_argument('--output', help="Write results to this file rather than to stdout")
+    parser.add_argument('--instrument', action='store_true',
+                        help="Record hot-path metrics and include them in the results")
+    arguments = parser.parse_args(args)
+
+    if arguments.instrument:
+        instrumentation.enable()
+    results = run_suite(arguments.boards, arguments.work_items, arguments.seed, arguments.store)
+    if arguments.instrument:
+        results['metrics'] = instrumentation.snapshot()
+    if arguments.output:
+        with open(arguments.output, 'wt') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
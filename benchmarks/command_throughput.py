@@ -0,0 +1,90 @@
+"""Stress benchmark of concurrent command execution with a CommandProcessor.
+
+Commands are executed against a number of Boards by increasing numbers of threads.
+Afterwards every Board is reloaded to check that no command was lost or misapplied.
+Results are printed as JSON.
+
+    python -m benchmarks.command_throughput --boards 16 --commands 20 --threads 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from application.command_processing import CommandProcessor
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import start_project
+
+
+def measure_command_throughput(number_of_boards, commands_per_board, threads):
+    """Measure the rate at which commands are executed by a CommandProcessor.
+
+    Args:
+        number_of_boards: The number of Boards against which commands are executed.
+
+        commands_per_board: The number of commands executed against each Board.
+
+        threads: The number of threads executing commands.
+
+    Returns:
+        A dictionary of results.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        event_store = EventStore(os.path.join(directory, 'store.events'))
+        persistence_subscriber = PersistenceSubscriber(event_store, check_versions=True)
+        try:
+            with unit_of_work(persistence_subscriber):
+                board_ids = [start_project("Board {}".format(i), "A stress test board").id
+                             for i in range(number_of_boards)]
+
+            processor = CommandProcessor(BoardRepository(event_store), persistence_subscriber, max_workers=threads)
+            start_time = time.perf_counter()
+            futures = [processor.submit(board_id, _add_column_command("Column {}".format(j)))
+                       for j in range(commands_per_board)
+                       for board_id in board_ids]
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start_time
+            processor.close()
+
+            boards = BoardRepository(event_store).all_boards()
+            consistent = all(len(list(board.columns())) == commands_per_board for board in boards)
+        finally:
+            persistence_subscriber.close()
+
+    number_of_commands = number_of_boards * commands_per_board
+    return dict(threads=threads,
+                commands=number_of_commands,
+                seconds=elapsed,
+                commands_per_second=number_of_commands / elapsed,
+                consistent=consistent)
+
+
+def _add_column_command(name):
+    def command(board):
+        return board.add_new_column(name, None)
+    return command
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--boards', type=int, default=16)
+    parser.add_argument('--commands', type=int, default=20, help="Commands per board")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    arguments = parser.parse_args(args)
+
+    results = [measure_command_throughput(arguments.boards, arguments.commands, threads)
+               for threads in arguments.threads]
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return 0 if all(result['consistent'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
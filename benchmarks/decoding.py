@@ -0,0 +1,77 @@
+"""Benchmark of event record decoding throughput.
+
+Compares decoding records with ObjectJSONDecoder, which applies an object_hook to every
+JSON object, against EventDecoder. Results are printed as JSON.
+
+    python -m benchmarks.decoding --records 100000
+"""
+
+import argparse
+import datetime
+import json
+import sys
+import time
+
+from infrastructure.transcoders import EventEncoder, EventDecoder, ObjectJSONDecoder
+from kanban.domain.model.board import Board
+from kanban.domain.model.entity import Entity
+from kanban.domain.model.workitem import WorkItem
+
+
+def sample_records(number_of_records):
+    """Generate a representative mix of encoded event records.
+
+    Args:
+        number_of_records: The number of records to generate.
+
+    Returns:
+        A list of UTF-8 encoded JSON records.
+    """
+    encoder = EventEncoder()
+    samples = [
+        WorkItem.Created(originator_id='0' * 32, originator_version=0, name="Feature",
+                         due_date=datetime.date(2014, 8, 13), content="Here's some info about the feature"),
+        Board.WorkItemScheduled(originator_id='1' * 32, originator_version=7, work_item_id='0' * 32),
+        Board.WorkItemAdvanced(originator_id='1' * 32, originator_version=8, work_item_id='0' * 32,
+                               source_column_index=0, priority=3),
+        Entity.AttributeChanged(originator_id='0' * 32, originator_version=1, name='_due_date',
+                                value=datetime.date(2015, 3, 2)),
+    ]
+    return [encoder.encode_event(samples[i % len(samples)]).encode('utf-8') for i in range(number_of_records)]
+
+
+def measure_decoding(records, decode):
+    """Measure the rate at which records are decoded.
+
+    Args:
+        records: A list of encoded records.
+
+        decode: A unary function which decodes one record.
+
+    Returns:
+        The number of records decoded per second.
+    """
+    start_time = time.perf_counter()
+    for record in records:
+        decode(record)
+    return len(records) / (time.perf_counter() - start_time)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    arguments = parser.parse_args(args)
+
+    records = sample_records(arguments.records)
+    event_decoder = EventDecoder()
+    results = dict(records=len(records),
+                   object_json_decoder_records_per_second=measure_decoding(
+                       records, lambda record: json.loads(record.decode('utf-8'), cls=ObjectJSONDecoder)),
+                   event_decoder_records_per_second=measure_decoding(records, event_decoder.decode))
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+"""Memory benchmarks.
+
+Uses tracemalloc to measure the memory retained by each kind of object in the domain model, and
+the peak memory used while replaying synthetic event logs of several sizes. Results are emitted
+as JSON. If any measurement exceeds its threshold the run fails, so that memory regressions can
+be caught in the same way as failing tests.
+
+    python -m benchmarks.memory --output memory.json
+    python -m benchmarks.memory --thresholds thresholds.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+import uuid
+
+from benchmarks.reporting import git_revision
+from benchmarks.workload import generate_workload
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_sourced_projections.board_lead_time_projection import LeadTimeProjection
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.transcoders import EventDecoder
+from kanban.domain.model import board as board_module
+from kanban.domain.model import lead_time
+from kanban.domain.model import workitem as workitem_module
+from kanban.domain.model.board import Board
+from utility.itertools import consume
+
+
+# The maximum acceptable value of each measurement, in bytes. Peak replay thresholds are per
+# event in the replayed log.
+THRESHOLDS = dict(
+    bytes_per_board=600,
+    bytes_per_column=500,
+    bytes_per_work_item_id=130,
+    bytes_per_work_item=800,
+    bytes_per_domain_event=650,
+    bytes_per_lead_time_start_time_entry=200,
+    bytes_per_lead_time_entry=200,
+    peak_bytes_per_event_all_boards=1900,
+    peak_bytes_per_event_all_work_items=750,
+    peak_bytes_per_event_all_work_items_streaming=100,
+)
+
+
+def retained_bytes(function):
+    """Measure the memory retained by the result of a function of no arguments.
+
+    Returns:
+        A pair of the number of bytes allocated by the function and still allocated once it has
+        returned, and the result of the function.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = function()
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return after - before, result
+
+
+def peak_bytes(function):
+    """Measure the peak memory allocated while a function of no arguments runs, in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def _per_object(function, count):
+    """The retained bytes per object for a function returning a list of count objects."""
+    function()  # Warm any caches, so that they are not attributed to the objects
+    size, objects = retained_bytes(function)
+    return (size - sys.getsizeof(objects)) / count
+
+
+def measure_objects(store_path, number_of_ids=10000, work_item_id_storage='list'):
+    """Measure the memory retained by each kind of object in the domain model.
+
+    Boards, Columns, WorkItems and DomainEvents are decoded from the records of an event log,
+    so that their attribute values are realistic. Work item ids in columns and lead time
+    projection entries are synthesized.
+
+    Args:
+        store_path: The path to an event log.
+
+        number_of_ids: The number of work item ids and projection entries to synthesize.
+
+        work_item_id_storage: How columns store the ids of their work items, as for
+            kanban.domain.model.board.mutator().
+
+    Returns:
+        A dictionary of bytes per object.
+    """
+    decoder = EventDecoder()
+    mutate = board_module.mutator(work_item_id_storage)
+    with open(store_path, 'rb') as store_file:
+        lines = store_file.readlines()
+
+    def lines_with_topic(event_class):
+        topic = '"topic":"{}#{}"'.format(event_class.__module__, event_class.__qualname__).encode('ascii')
+        return [line for line in lines if topic in line]
+
+    def replay(lines, obj=None):
+        return [mutate(obj, deserialize_event(decoder.decode(line))) for line in lines]
+
+    results = {}
+
+    board_created_lines = lines_with_topic(Board.Created)
+    results['bytes_per_board'] = _per_object(lambda: replay(board_created_lines), len(board_created_lines))
+
+    # The columns of each board are added immediately after it is created
+    column_lines = {}
+    for line in lines_with_topic(Board.NewColumnAdded):
+        column_lines.setdefault(decoder.decode(line)['attributes']['originator_id'], []).append(line)
+    boards = replay(board_created_lines)
+
+    def add_columns(boards):
+        for board in boards:
+            for line in column_lines.get(board._id, ()):
+                mutate(board, deserialize_event(decoder.decode(line)))
+        return boards
+    add_columns(replay(board_created_lines[:1]))  # Warm any caches
+    number_of_columns = sum(map(len, column_lines.values()))
+    columns_bytes, _ = retained_bytes(lambda: add_columns(boards))
+    # The lists of columns existed before the columns were added, but may have grown
+    columns_bytes -= sum(sys.getsizeof(board._columns) - sys.getsizeof([]) for board in boards)
+    results['bytes_per_column'] = columns_bytes / number_of_columns
+
+    # The cost of an id includes its slot in the list of work item ids
+    board = boards[0]
+    column = board._columns[0]
+
+    def schedule_work_items(count):
+        for _ in range(count):
+            mutate(board, Board.WorkItemScheduled(originator_id=board._id,
+                                                  originator_version=board._version,
+                                                  work_item_id=uuid.uuid4().hex))
+    schedule_work_items(1)  # Warm any caches
+    column._work_item_ids = type(column._work_item_ids)()
+    ids_bytes, _ = retained_bytes(lambda: schedule_work_items(number_of_ids))
+    results['bytes_per_work_item_id'] = ids_bytes / number_of_ids
+
+    work_item_created_lines = lines_with_topic(workitem_module.WorkItem.Created)
+    results['bytes_per_work_item'] = _per_object(
+        lambda: [workitem_module.mutate(None, deserialize_event(decoder.decode(line)))
+                 for line in work_item_created_lines],
+        len(work_item_created_lines))
+
+    results['bytes_per_domain_event'] = _per_object(
+        lambda: [deserialize_event(decoder.decode(line)) for line in lines],
+        len(lines))
+
+    results.update(_measure_lead_time_entries(number_of_ids))
+    return results
+
+
+def _measure_lead_time_entries(number_of_entries):
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, 'empty.events')
+        open(store_path, 'wb').close()
+        board_id = uuid.uuid4().hex
+        projection = LeadTimeProjection(board_id, EventStore(store_path))
+        try:
+            def schedule(work_item_ids):
+                for _ in range(number_of_entries):
+                    work_item_id = uuid.uuid4().hex
+                    work_item_ids.append(work_item_id)
+                    lead_time.mutate(projection, Board.WorkItemScheduled(originator_id=board_id,
+                                                                         originator_version=0,
+                                                                         work_item_id=work_item_id))
+
+            def retire(work_item_ids):
+                for priority, work_item_id in enumerate(work_item_ids):
+                    lead_time.mutate(projection, Board.WorkItemRetired(originator_id=board_id,
+                                                                       originator_version=0,
+                                                                       work_item_id=work_item_id,
+                                                                       priority=priority))
+                # Deleting entries does not shrink a dictionary, so discard the emptied one
+                projection._work_item_start_times = {}
+
+            def reset():
+                projection._work_item_start_times = {}
+                projection._lead_times = {}
+                projection._retirement_times = {}
+
+            # Warm any caches
+            work_item_ids = []
+            schedule(work_item_ids)
+            retire(work_item_ids)
+
+            # Entries retain their work item ids, which the list of ids merely shares
+            reset()
+            work_item_ids = []
+            start_time_bytes, _ = retained_bytes(lambda: schedule(work_item_ids))
+            start_time_bytes -= sys.getsizeof(work_item_ids)
+
+            reset()
+            work_item_ids = []
+            lead_time_bytes, _ = retained_bytes(lambda: (schedule(work_item_ids), retire(work_item_ids)))
+            lead_time_bytes -= sys.getsizeof(work_item_ids)
+        finally:
+            projection.close()
+    return dict(bytes_per_lead_time_start_time_entry=start_time_bytes / number_of_entries,
+                bytes_per_lead_time_entry=lead_time_bytes / number_of_entries)
+
+
+def measure_replay(store_path, work_item_id_storage='list'):
+    """Measure the peak memory used while replaying all the aggregates in an event log.
+
+    Args:
+        store_path: The path to an event log.
+
+        work_item_id_storage: How columns store the ids of their work items, as for
+            kanban.domain.model.board.mutator().
+
+    Returns:
+        A dictionary of peak bytes, and of peak bytes per event, for each kind of replay.
+    """
+    event_store = EventStore(store_path)
+    with open(store_path, 'rb') as store_file:
+        number_of_events = sum(1 for _ in store_file)
+    replays = dict(
+        all_boards=lambda: consume(BoardRepository(event_store,
+                                                   work_item_id_storage=work_item_id_storage).all_boards()),
+        all_work_items=lambda: consume(WorkItemRepository(event_store).all_work_items()),
+        all_work_items_streaming=lambda: consume(WorkItemRepository(event_store, streaming=True).all_work_items()))
+    results = dict(events=number_of_events, bytes=os.path.getsize(store_path))
+    for name, replay in replays.items():
+        replay()  # Warm any caches
+        peak = peak_bytes(replay)
+        results['peak_bytes_' + name] = peak
+        results['peak_bytes_per_event_' + name] = peak / number_of_events
+    return results
+
+
+def check_thresholds(results, thresholds):
+    """Compare measurements with thresholds.
+
+    Args:
+        results: The results of run_suite().
+
+        thresholds: A mapping of measurement names to maximum acceptable values. Per-event peak
+            replay thresholds are applied to the largest log.
+
+    Returns:
+        A list of descriptions of the measurements which exceed their thresholds.
+    """
+    measurements = dict(results['objects'])
+    if results['replay']:
+        measurements.update(results['replay'][-1])
+    return ["{} is {:.1f}, exceeding the threshold of {}".format(name, measurements[name], threshold)
+            for name, threshold in sorted(thresholds.items())
+            if name in measurements and measurements[name] > threshold]
+
+
+def run_suite(boards, work_items_per_board, seed, replay_sizes, work_item_id_storage='list'):
+    """Run all the memory benchmarks.
+
+    Args:
+        boards: The number of boards in the synthetic workload used to measure objects.
+
+        work_items_per_board: The number of work items scheduled on each board, in all workloads.
+
+        seed: The workload seed.
+
+        replay_sizes: The numbers of boards in the synthetic workloads used to measure replay.
+
+        work_item_id_storage: How columns store the ids of their work items, as for
+            kanban.domain.model.board.mutator().
+
+    Returns:
+        A dictionary of results.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, 'objects.events')
+        generate_workload(EventStore(store_path), boards, work_items_per_board, seed)
+        objects = measure_objects(store_path, work_item_id_storage=work_item_id_storage)
+
+        replay = []
+        for replay_size in replay_sizes:
+            store_path = os.path.join(directory, 'replay-{}.events'.format(replay_size))
+            generate_workload(EventStore(store_path), replay_size, work_items_per_board, seed)
+            replay.append(dict(measure_replay(store_path, work_item_id_storage), boards=replay_size))
+            os.remove(store_path)
+
+    return dict(revision=git_revision(),
+                python=sys.version.split()[0],
+                workload=dict(boards=boards, work_items_per_board=work_items_per_board, seed=seed),
+                objects=objects,
+                replay=replay)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--boards', type=int, default=20)
+    parser.add_argument('--work-items', type=int, default=50, help="Work items per board")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay-sizes', type=int, nargs='+', default=[10, 40, 160],
+                        help="Numbers of boards in the logs replayed")
+    parser.add_argument('--thresholds', help="A JSON file of thresholds overriding the defaults")
+    parser.add_argument('--no-check', action='store_true', help="Do not fail if thresholds are exceeded")
+    parser.add_argument('--work-item-id-storage', choices=['list', 'interned', 'compact'], default='list',
+                        help="How columns store the ids of their work items")
+    parser.add_argument('--output', help="Write results to this file rather than to stdout")
+    arguments = parser.parse_args(args)
+
+    thresholds = dict(THRESHOLDS)
+    if arguments.thresholds:
+        with open(arguments.thresholds, 'rt') as thresholds_file:
+            thresholds.update(json.load(thresholds_file))
+
+    results = run_suite(arguments.boards, arguments.work_items, arguments.seed, arguments.replay_sizes,
+                        arguments.work_item_id_storage)
+    results['work_item_id_storage'] = arguments.work_item_id_storage
+    failures = check_thresholds(results, thresholds)
+    results['threshold_failures'] = failures
+    if arguments.output:
+        with open(arguments.output, 'wt') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    for failure in failures:
+        print("Memory regression: {}".format(failure), file=sys.stderr)
+    return 1 if failures and not arguments.no_check else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""Details recorded with benchmark results, so that results can be compared across commits."""
+
+import os
+import subprocess
+
+
+def git_revision():
+    """The git revision of the working tree, or None if it cannot be determined."""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
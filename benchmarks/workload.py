@@ -0,0 +1,200 @@
+"""Generation of synthetic event logs through the domain API.
+
+The sequence of commands issued is determined entirely by the seed, so workloads with the same
+parameters have the same shape: the same numbers of boards, columns, work items and events of
+each type, in the same order. Entity ids and timestamps are generated by the domain model as
+usual, and so differ from run to run.
+"""
+
+import argparse
+from collections import Counter
+import datetime
+import random
+import sys
+
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.exceptions import ConstraintError
+from kanban.domain.model.board import start_project
+from kanban.domain.model.workitem import register_new_work_item
+
+
+# The relative frequencies of the commands issued against a board after it has been set up
+COMMAND_WEIGHTS = dict(schedule=30, advance=45, retire=12, abandon=3, reshape=2, edit=8)
+
+
+def generate_workload(event_store, number_of_boards, work_items_per_board, seed=0, content_length=200):
+    """Populate an event store with a synthetic workload.
+
+    Boards are started, and each given between three and five columns. Commands are then issued
+    against randomly chosen boards, interleaving their events in the log, until every board has
+    had work_items_per_board work items scheduled and every scheduled work item has been retired
+    or abandoned, apart from some left in progress. Commands are drawn from a realistic mix of
+    scheduling, advancing, retiring and abandoning work items, editing work items, and reshaping
+    columns.
+
+    Args:
+        event_store: The EventStore to populate.
+
+        number_of_boards: The number of boards to create.
+
+        work_items_per_board: The number of work items to schedule on each board.
+
+        seed: The seed for the random number generator which chooses the commands.
+
+        content_length: The approximate length of the content of each work item.
+
+    Returns:
+        A Counter of the number of commands of each kind performed. A command which cannot be
+        performed may be replaced by another, such as advancing a work item from the last column
+        by retiring it, in which case the command performed is counted.
+    """
+    rng = random.Random(seed)
+    persistence_subscriber = PersistenceSubscriber(event_store)
+    counts = Counter()
+    try:
+        boards = []
+        for board_index in range(number_of_boards):
+            with unit_of_work(persistence_subscriber):
+                board = start_project("Board {}".format(board_index), "A synthetic board")
+                for column_index in range(rng.randint(3, 5)):
+                    board.add_new_column("Column {}".format(column_index), rng.choice([None, 10, 20]))
+            boards.append(_BoardWorkload(board, work_items_per_board))
+            counts['start_project'] += 1
+
+        active = list(boards)
+        while active:
+            workload = rng.choice(active)
+            command = rng.choices(list(COMMAND_WEIGHTS), weights=list(COMMAND_WEIGHTS.values()))[0]
+            with unit_of_work(persistence_subscriber):
+                performed = getattr(workload, command)(rng, content_length)
+            if performed is not None:
+                counts[performed] += 1
+            if workload.finished():
+                active.remove(workload)
+    finally:
+        persistence_subscriber.close()
+    return counts
+
+
+class _BoardWorkload:
+    """Issues commands against one board, tracking the work items on it.
+
+    Each command returns the name of the command actually performed, or None if none was.
+    """
+
+    def __init__(self, board, work_items_to_schedule):
+        self.board = board
+        self.remaining_to_schedule = work_items_to_schedule
+        self.work_items = {}
+        self.reshapes = 0
+
+    def finished(self):
+        # Leave a few work items in progress on each board, as on a real board
+        return self.remaining_to_schedule == 0 and len(self.work_items) <= 2
+
+    def schedule(self, rng, content_length):
+        if self.remaining_to_schedule == 0:
+            return self.advance(rng, content_length)
+        today = datetime.date.today()
+        due_date = rng.choice([None, today + datetime.timedelta(days=rng.randint(-60, 120))])
+        content = _content(rng, content_length)
+        # Check the capacity before registering, so that no unscheduled work items are created
+        if not list(self.board.columns())[0].can_accept_work_item():
+            return None
+        work_item = register_new_work_item(name="Work item {}".format(self.remaining_to_schedule),
+                                           due_date=due_date,
+                                           content=content)
+        self.board.schedule_work_item(work_item)
+        self.work_items[work_item.id] = work_item
+        self.remaining_to_schedule -= 1
+        return 'schedule'
+
+    def advance(self, rng, content_length):
+        work_item = self._random_work_item(rng)
+        if work_item is None:
+            return None
+        try:
+            self.board.advance_work_item(work_item)
+        except ConstraintError:
+            # Either in the last column, or the next column is at its limit
+            return self.retire(rng, content_length)
+        return 'advance'
+
+    def retire(self, rng, content_length):
+        last_column = list(self.board.columns())[-1]
+        work_item_ids = list(last_column.work_item_ids())
+        if not work_item_ids:
+            return None
+        work_item = self.work_items.pop(rng.choice(work_item_ids))
+        self.board.retire_work_item(work_item)
+        return 'retire'
+
+    def abandon(self, rng, content_length):
+        work_item = self._random_work_item(rng)
+        if work_item is None:
+            return None
+        self.board.abandon_work_item(work_item)
+        del self.work_items[work_item.id]
+        return 'abandon'
+
+    def edit(self, rng, content_length):
+        work_item = self._random_work_item(rng)
+        if work_item is None:
+            return None
+        if rng.random() < 0.5:
+            work_item.content = _content(rng, content_length)
+        else:
+            work_item.due_date = datetime.date.today() + datetime.timedelta(days=rng.randint(-30, 60))
+        return 'edit'
+
+    def reshape(self, rng, content_length):
+        self.reshapes += 1
+        columns = list(self.board.columns())
+        empty_columns = [column for column in columns[1:] if column.number_of_work_items == 0]
+        if empty_columns and len(columns) > 3 and rng.random() < 0.5:
+            self.board.remove_column(rng.choice(empty_columns))
+        else:
+            self.board.insert_new_column_before(rng.choice(columns[1:]),
+                                                "Reshaped column {}".format(self.reshapes),
+                                                None)
+        return 'reshape'
+
+    def _random_work_item(self, rng):
+        if not self.work_items:
+            return None
+        return self.work_items[rng.choice(list(self.work_items))]
+
+
+_WORDS = ("the", "feature", "should", "support", "users", "when", "data", "is", "loaded", "from",
+          "a", "remote", "service", "and", "displayed", "in", "report", "with", "filters", "export")
+
+
+def _content(rng, content_length):
+    words = []
+    length = 0
+    while length < content_length:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic event log")
+    parser.add_argument('store_path')
+    parser.add_argument('--boards', type=int, default=100)
+    parser.add_argument('--work-items', type=int, default=50, help="Work items per board")
+    parser.add_argument('--seed', type=int, default=0)
+    arguments = parser.parse_args(args)
+
+    counts = generate_workload(EventStore(arguments.store_path), arguments.boards, arguments.work_items,
+                               arguments.seed)
+    for command, count in sorted(counts.items()):
+        print("{}: {}".format(command, count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""A content-addressed store for large values, such as the content of work items.
+
+Each blob is stored once, in a file named by the SHA-256 digest of its bytes, so storing the
+same content again costs nothing. Events refer to blobs with a BlobReference, which is small
+to store and replay, and which is resolved to the content only when the content is read.
+
+The BlobStore is passed explicitly to whatever stores or reads events which refer to it, so
+that references are always resolved against the store which holds them:
+
+    blob_store = BlobStore('kanban.blobs')
+    persistence_subscriber = PersistenceSubscriber(event_store, blob_store=blob_store)
+    work_item_repository = WorkItemRepository(event_store, blob_store=blob_store)
+"""
+
+import hashlib
+import os
+import tempfile
+
+from utility.deferred import Deferred
+
+
+class BlobNotFoundError(KeyError):
+    """Raised when a blob cannot be found."""
+    pass
+
+
+class BlobStore:
+    """A directory of immutable blobs, each named by the SHA-256 digest of its bytes."""
+
+    def __init__(self, directory):
+        """Open, creating if necessary, a blob store.
+
+        Args:
+            directory: The path of the directory in which blobs are stored.
+        """
+        self._directory = os.path.abspath(directory)
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def _path(self, digest):
+        # Fan out over subdirectories, to keep directories small
+        return os.path.join(self._directory, digest[:2], digest[2:])
+
+    def __contains__(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def put(self, data):
+        """Store a blob, unless an identical blob is already stored.
+
+        Args:
+            data: The bytes to store.
+
+        Returns:
+            The hexadecimal SHA-256 digest of the data, by which it can be retrieved.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as blob_file:
+                blob_file.write(data)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+        return digest
+
+    def get(self, digest):
+        """Retrieve a blob.
+
+        Raises:
+            BlobNotFoundError: If there is no blob with the digest.
+        """
+        try:
+            with open(self._path(digest), 'rb') as blob_file:
+                return blob_file.read()
+        except FileNotFoundError:
+            raise BlobNotFoundError(digest) from None
+
+    def reference(self, text):
+        """Store text as a blob, returning a reference to it."""
+        data = text.encode('utf-8')
+        return BlobReference(digest=self.put(data), size=len(data))
+
+    def text(self, reference):
+        """Fetch the text to which a BlobReference refers.
+
+        Raises:
+            BlobNotFoundError: If this store does not hold the blob.
+        """
+        return self.get(reference.digest).decode('utf-8')
+
+    def bind(self, event):
+        """Obtain an event in which any BlobReferences can be resolved against this store.
+
+        Args:
+            event: A domain event, as deserialized from an event store.
+
+        Returns:
+            The event itself if it holds no BlobReferences, otherwise a copy of the event in
+            which each BlobReference, whether an attribute or within a dictionary attribute such
+            as the values of an AttributesChanged event, is replaced by a Deferred value which
+            fetches the text from this store when resolved.
+        """
+        attributes = vars(event)
+        bound_attributes = {name: self._bound(value) for name, value in attributes.items()}
+        if all(bound_attributes[name] is value for name, value in attributes.items()):
+            return event
+        return type(event)(**bound_attributes)
+
+    def _bound(self, value):
+        if isinstance(value, BlobReference):
+            return _BoundBlobReference(self, value)
+        if isinstance(value, dict):
+            bound_value = {key: self._bound(item) for key, item in value.items()}
+            if any(bound_value[key] is not item for key, item in value.items()):
+                return bound_value
+        return value
+
+
+class BlobReference(Deferred):
+    """A reference to text stored in a BlobStore, as recorded in events."""
+
+    def __init__(self, digest, size):
+        """
+        Args:
+            digest: The hexadecimal SHA-256 digest of the UTF-8 encoded text.
+
+            size: The length of the encoded text in bytes.
+        """
+        self.digest = digest
+        self.size = size
+
+    def __repr__(self):
+        return "BlobReference(digest={!r}, size={!r})".format(self.digest, self.size)
+
+    def __eq__(self, rhs):
+        if not isinstance(rhs, BlobReference):
+            return NotImplemented
+        return self.digest == rhs.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def resolve(self):
+        """A reference alone cannot be resolved. Use BlobStore.text(), or BlobStore.bind() the event.
+
+        Raises:
+            BlobNotFoundError: Always, since the BlobStore holding the blob is not known.
+        """
+        raise BlobNotFoundError("Blob {} cannot be resolved without its BlobStore".format(self.digest))
+
+
+class _BoundBlobReference(Deferred):
+    """A BlobReference together with the BlobStore against which it is resolved."""
+
+    def __init__(self, blob_store, reference):
+        self.blob_store = blob_store
+        self.reference = reference
+
+    def __repr__(self):
+        return "{!r} in {!r}".format(self.reference, self.blob_store.directory)
+
+    def resolve(self):
+        return self.blob_store.text(self.reference)
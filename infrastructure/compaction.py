@@ -0,0 +1,217 @@
+"""Offline compaction of an event log.
+
+Compaction rewrites a log without the events of aggregates which are no longer needed, moving
+them to an archive log: the events of discarded Boards and of their Columns, and of WorkItems
+which have been discarded, or which have been scheduled on a Board but are no longer on any
+extant Board. WorkItems which have never been scheduled are kept. Optionally, each run of
+consecutive AttributeChanged events for one originator is collapsed into a single
+AttributesChanged event recording the final values, which advances the originator's version by
+the number of events it replaces. The collapsed event is written where the last event of the
+run stood, so it follows every event which preceded any event of the run.
+
+Both the compacted log and the archive preserve the order of the events they receive, and the
+versions of every aggregate which remains. Events are streamed, in two passes, or three when
+collapsing runs, so memory use depends on the number of aggregates, and on the number of runs,
+rather than on the number of events.
+
+The log must not be written to while it is compacted.
+
+    python -m infrastructure.compaction kanban.events kanban.archive --collapse-attribute-changes
+"""
+
+import argparse
+from array import array
+from collections import Counter
+import os
+import sys
+
+from infrastructure.event_store import ATTRIBUTES_CHANGED_TOPIC, EventView
+from infrastructure.transcoders import EventEncoder
+
+
+_BOARD = 'kanban.domain.model.board#Board.'
+_WORK_ITEM_CREATED = 'kanban.domain.model.workitem#WorkItem.Created'
+_ATTRIBUTE_CHANGED = 'kanban.domain.model.entity#Entity.AttributeChanged'
+
+
+def compact(store_path, compacted_path, archive_path, collapse_attribute_changes=False):
+    """Compact an event log.
+
+    Args:
+        store_path: The path of the event log to compact, which is not modified.
+
+        compacted_path: The path at which to write the compacted log, replacing any existing file.
+
+        archive_path: The path of the archive log, to which archived events are appended.
+
+        collapse_attribute_changes: If True, collapse runs of AttributeChanged events.
+
+    Returns:
+        A Counter of the numbers of events read, kept, archived, and collapsed, and of the
+        AttributesChanged events written in place of collapsed runs.
+    """
+    archived_ids = archived_originator_ids(store_path)
+    counts = Counter()
+    encoder = EventEncoder()
+    pending_runs = {}
+    run_ends = iter(_attribute_change_run_ends(store_path, archived_ids) if collapse_attribute_changes else ())
+    next_run_end = next(run_ends, None)
+
+    with open(store_path, 'rb') as store_file, \
+            open(compacted_path, 'wb') as compacted_file, \
+            open(archive_path, 'ab') as archive_file:
+
+        def flush_run(run):
+            if run.changes == 1:
+                compacted_file.write(run.first_line)
+            else:
+                compacted_file.write(run.encode(encoder).encode('utf-8') + b'\n')
+                counts['collapsed'] += run.changes
+                counts['snapshots'] += 1
+
+        for index, line in enumerate(store_file):
+            if not line.endswith(b'\n'):
+                line += b'\n'
+            counts['read'] += 1
+            view = EventView.from_bytes(line)
+            originator_id = view.originator_id
+            if originator_id in archived_ids:
+                archive_file.write(line)
+                counts['archived'] += 1
+                continue
+            counts['kept'] += 1
+            if collapse_attribute_changes and view.topic == _ATTRIBUTE_CHANGED:
+                run = pending_runs.get(originator_id)
+                if run is None:
+                    run = pending_runs[originator_id] = _AttributeChangeRun(line, view)
+                else:
+                    run.add(view)
+                if index == next_run_end:
+                    del pending_runs[originator_id]
+                    flush_run(run)
+                    next_run_end = next(run_ends, None)
+                continue
+            compacted_file.write(line)
+    return counts
+
+
+def archived_originator_ids(store_path):
+    """Determine which originators' events are to be archived, in a single pass over the log.
+
+    Returns:
+        A set of originator ids.
+    """
+    discarded_board_ids = set()
+    board_of_column = {}
+    board_of_work_item = {}
+    scheduled_work_item_ids = set()
+    work_item_ids = set()
+    discarded_ids = set()
+
+    with open(store_path, 'rb') as store_file:
+        for line in store_file:
+            view = EventView.from_bytes(line)
+            topic = view.topic
+            if topic.startswith(_BOARD):
+                event_name = topic[len(_BOARD):]
+                board_id = view.originator_id
+                if event_name in ('NewColumnAdded', 'NewColumnInserted'):
+                    board_of_column[view.attribute('column_id')] = board_id
+                elif event_name == 'WorkItemScheduled':
+                    work_item_id = view.attribute('work_item_id')
+                    board_of_work_item[work_item_id] = board_id
+                    scheduled_work_item_ids.add(work_item_id)
+                elif event_name in ('WorkItemRetired', 'WorkItemAbandoned'):
+                    board_of_work_item.pop(view.attribute('work_item_id'), None)
+                elif event_name == 'Discarded':
+                    discarded_board_ids.add(board_id)
+            elif topic == _WORK_ITEM_CREATED:
+                work_item_ids.add(view.originator_id)
+            elif topic.endswith('.Discarded'):
+                discarded_ids.add(view.originator_id)
+
+    archived_ids = set(discarded_board_ids)
+    archived_ids.update(column_id for column_id, board_id in board_of_column.items()
+                        if board_id in discarded_board_ids)
+    for work_item_id in work_item_ids:
+        if work_item_id in discarded_ids:
+            archived_ids.add(work_item_id)
+        elif work_item_id in scheduled_work_item_ids:
+            board_id = board_of_work_item.get(work_item_id)
+            if board_id is None or board_id in discarded_board_ids:
+                archived_ids.add(work_item_id)
+    return archived_ids
+
+
+def _attribute_change_run_ends(store_path, archived_ids):
+    """Locate the last event of each run of consecutive AttributeChanged events for one originator.
+
+    Args:
+        store_path: The path of the event log.
+
+        archived_ids: The ids of originators whose events are archived, and so not collapsed.
+
+    Returns:
+        An array of the indices of the lines of the log holding the last events of runs, in
+        ascending order.
+    """
+    run_ends = array('q')
+    last_changes = {}
+    with open(store_path, 'rb') as store_file:
+        for index, line in enumerate(store_file):
+            view = EventView.from_bytes(line)
+            originator_id = view.originator_id
+            if originator_id in archived_ids:
+                continue
+            if view.topic == _ATTRIBUTE_CHANGED:
+                last_changes[originator_id] = index
+            elif originator_id in last_changes:
+                run_ends.append(last_changes.pop(originator_id))
+    run_ends.extend(last_changes.values())
+    return array('q', sorted(run_ends))
+
+
+class _AttributeChangeRun:
+    """Consecutive AttributeChanged events for one originator."""
+
+    def __init__(self, line, view):
+        self.first_line = line
+        self.originator_id = view.originator_id
+        self.originator_version = view.attribute('originator_version')
+        self.values = {}
+        self.changes = 0
+        self.add(view)
+
+    def add(self, view):
+        self.values[view.attribute('name')] = view.attribute('value')
+        self.timestamp = view.attribute('timestamp')
+        self.changes += 1
+
+    def encode(self, encoder):
+        return encoder.encode(ATTRIBUTES_CHANGED_TOPIC, dict(originator_id=self.originator_id,
+                                                             originator_version=self.originator_version,
+                                                             timestamp=self.timestamp,
+                                                             values=self.values,
+                                                             changes=self.changes))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compact an event log, archiving unneeded events")
+    parser.add_argument('store_path')
+    parser.add_argument('archive_path')
+    parser.add_argument('--output', help="Write the compacted log here rather than replacing the original")
+    parser.add_argument('--collapse-attribute-changes', action='store_true')
+    arguments = parser.parse_args(args)
+
+    compacted_path = arguments.output or arguments.store_path + '.compacting'
+    counts = compact(arguments.store_path, compacted_path, arguments.archive_path,
+                     arguments.collapse_attribute_changes)
+    if not arguments.output:
+        os.replace(compacted_path, arguments.store_path)
+    for name in ('read', 'kept', 'archived', 'collapsed', 'snapshots'):
+        print("{}: {}".format(name, counts[name]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
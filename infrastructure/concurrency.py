@@ -0,0 +1,40 @@
+from infrastructure.event_store import ConcurrencyError
+from infrastructure.unit_of_work import unit_of_work
+
+
+def execute_with_retry(persistence_subscriber, load, command, attempts=3):
+    """Execute a command against an aggregate, retrying if it conflicts with another writer.
+
+    The aggregate is loaded and the command executed within a unit of work, so that all of the
+    events resulting from the command are appended atomically. If the append is rejected because
+    the aggregate was concurrently modified, the aggregate is reloaded and the command re-executed.
+
+        execute_with_retry(persistence_subscriber,
+                           lambda: board_repo.board_with_id(board_id),
+                           lambda board: board.add_new_column("Review", 5))
+
+    Args:
+        persistence_subscriber: A PersistenceSubscriber which checks versions.
+
+        load: A callable of no arguments which loads the current state of the aggregate.
+
+        command: A unary callable which accepts the aggregate and executes the command against it.
+
+        attempts: The maximum number of times the command will be executed.
+
+    Returns:
+        The result of the command.
+
+    Raises:
+        ConcurrencyError: If the command still conflicts after the maximum number of attempts.
+    """
+    if attempts < 1:
+        raise ValueError("attempts {!r} is not positive".format(attempts))
+    for attempt in range(attempts):
+        aggregate = load()
+        try:
+            with unit_of_work(persistence_subscriber):
+                return command(aggregate)
+        except ConcurrencyError:
+            if attempt == attempts - 1:
+                raise
@@ -1,17 +1,27 @@
-from functools import reduce
-import importlib
-from utility.utilities import resolve_attr
+from functools import partial, reduce
+import time
+
+from infrastructure.event_scanning import scan_events
+from infrastructure.event_store import EventView
+from infrastructure.transcoders import resolve_class
+from utility import instrumentation
 
 
 class InconsistentEventStreamError(Exception):
     pass
 
 
+class LiveAggregateLimitError(Exception):
+    """Raised when a streaming replay would hold more live aggregates, or larger ones, than permitted."""
+    pass
+
+
 class EventPlayer:
     """Mixin class for replaying events from an Event Store.
     """
 
-    def __init__(self, event_store, mutator, stream_primer=None, **kwargs):
+    def __init__(self, event_store, mutator, stream_primer=None, processes=None,
+                 streaming=False, max_live_aggregates=None, max_live_bytes=None, **kwargs):
         """Create a new EventPlayer.
 
         Args:
@@ -25,38 +35,137 @@ class EventPlayer:
 
             stream_primer: An optional initial value for the state, otherwise None.
 
+            processes: An optional number of worker processes across which the event store
+                will be scanned in parallel when replaying events. If None, events are
+                scanned in this process.
+
+            streaming: If True, events are folded into live aggregates as they are read rather
+                than being buffered, and each aggregate is yielded as soon as its final event
+                has been applied. Streaming takes precedence over processes.
+
+            max_live_aggregates: An optional limit on the number of partially reconstituted
+                aggregates held in memory at any one time during a streaming replay. This is a
+                count, which does not limit the memory used by any one aggregate.
+
+            max_live_bytes: An optional limit on the total size in bytes of the stored records
+                folded into the partially reconstituted aggregates held in memory at any one time
+                during a streaming replay. The state of an aggregate is built from its records,
+                so this limits the memory used by large aggregates as well as by many, although
+                only approximately, since the size of a state is not that of its records.
+
             **kwargs: Any additional arguments will be forwarded to the superclass.
         """
         self._event_store = event_store
         self._mutator = mutator
         self._stream_primer = stream_primer
+        self._processes = processes
+        self._streaming = streaming
+        self._max_live_aggregates = max_live_aggregates
+        self._max_live_bytes = max_live_bytes
         # noinspection PyArgumentList
         super().__init__(**kwargs)
 
-    def _replay_events(self, originator_ids):
+    def _replay_events(self, originator_ids, start=0, end=None):
         """Replay all events or the supplied originator_ids.
 
         Args:
             originator_ids: An iterable series of originator_ids for which events will be replayed.
 
+            start: An optional byte offset, at a record boundary, from which to replay events.
+
+            end: An optional byte offset, at a record boundary, at which to stop replaying events.
+                If None, events are replayed to the end of the store.
+
         Returns:
-            An iterable series of entities reconstituted from the event stream.
+            An iterable series of entities reconstituted from the event stream. No entity is
+            obtained for originator_ids which have no events.
         """
+        if self._streaming:
+            return self._stream_events(originator_ids, start, end)
         grouped_entity_events = {entity_id: [] for entity_id in originator_ids}
-        with self._event_store.open_event_stream() as events:
-            for event in events:
-                originator_id = event['attributes']['originator_id']
-                if originator_id in grouped_entity_events:
-                    grouped_entity_events[originator_id].append(event)
-        all_entities = map(self._reconstitute, grouped_entity_events.values())
+        if self._processes is not None:
+            grouped_entity_events = scan_events(self._event_store,
+                                                mapper=partial(_group_events, frozenset(grouped_entity_events)),
+                                                reducer=_extend_grouped_events,
+                                                initial=grouped_entity_events,
+                                                processes=self._processes,
+                                                start=start,
+                                                end=end,
+                                                lazy=True)
+        else:
+            with self._event_store.open_event_stream(start=start, end=end, lazy=True) as events:
+                for event in events:
+                    originator_id = event.originator_id
+                    if originator_id in grouped_entity_events:
+                        grouped_entity_events[originator_id].append(event)
+        all_entities = map(self._reconstitute, filter(None, grouped_entity_events.values()))
         return all_entities
 
+    def _stream_events(self, originator_ids, start=0, end=None):
+        """Replay events for the supplied originator_ids without buffering stored events.
+
+        A preliminary pass over the store locates the final event for each originator, so
+        that each entity can be yielded as soon as its stream is complete. Peak memory use
+        is therefore proportional to the state of those entities whose event streams are
+        interleaved, rather than to the size of the history.
+
+        Unlike _replay_events() entities are yielded in order of the position of their final
+        event, and no entity is yielded for originator_ids which have no events.
+
+        Args:
+            originator_ids: An iterable series of originator_ids for which events will be replayed.
+
+            start: An optional byte offset, at a record boundary, from which to replay events.
+
+            end: An optional byte offset, at a record boundary, at which to stop replaying events.
+
+        Returns:
+            An iterator over entities reconstituted from the event stream.
+
+        Raises:
+            LiveAggregateLimitError: If more than max_live_aggregates entities, or entities
+                built from more than max_live_bytes of records, would need to be held in memory
+                at once.
+        """
+        final_positions = final_event_positions(self._event_store, originator_ids, start, end)
+        mutator = self._timed_mutator if instrumentation.enabled else self._mutator
+        live_entities = {}
+        # The number of bytes of records folded into each live entity, and in total
+        live_bytes = {}
+        total_live_bytes = 0
+        with self._event_store.open_event_stream(start=start, end=end, lazy=True) as events:
+            position = events.position
+            for event in events:
+                originator_id = event.originator_id
+                if originator_id in final_positions:
+                    entity = mutator(live_entities.pop(originator_id, self._stream_primer),
+                                     deserialize_event(event))
+                    if position == final_positions[originator_id]:
+                        total_live_bytes -= live_bytes.pop(originator_id, 0)
+                        yield entity
+                    else:
+                        live_entities[originator_id] = entity
+                        record_bytes = events.position - position
+                        live_bytes[originator_id] = live_bytes.get(originator_id, 0) + record_bytes
+                        total_live_bytes += record_bytes
+                        if (self._max_live_aggregates is not None
+                                and len(live_entities) > self._max_live_aggregates):
+                            raise LiveAggregateLimitError(
+                                "Streaming replay exceeded the limit of {} live "
+                                "aggregates".format(self._max_live_aggregates))
+                        if self._max_live_bytes is not None and total_live_bytes > self._max_live_bytes:
+                            raise LiveAggregateLimitError(
+                                "Streaming replay exceeded the limit of {} bytes of records in live "
+                                "aggregates".format(self._max_live_bytes))
+                position = events.position
+
     def _reconstitute(self, stored_events):
         """Reconstitute an object from a series of events.
 
         Args:
-            stored_events: An iterable series of stored events (deserialised JSON dictionaries).
-                All events in the supplied stream must pertain to the same originator object.
+            stored_events: An iterable series of stored events (deserialised JSON dictionaries
+                or EventViews). All events in the supplied stream must pertain to the same
+                originator object.
 
         Returns:
             The object obtained by applying the stored events.
@@ -67,7 +176,61 @@ class EventPlayer:
 
     def _apply_events(self, event_stream):
         """Current state is the left fold over previous behaviours - Greg Young"""
-        return reduce(self._mutator, event_stream, self._stream_primer)
+        mutator = self._timed_mutator if instrumentation.enabled else self._mutator
+        return reduce(mutator, event_stream, self._stream_primer)
+
+    def _timed_mutator(self, obj, event):
+        start_time = time.perf_counter()
+        obj = self._mutator(obj, event)
+        instrumentation.record('mutate', instrumentation.event_topic(event), time.perf_counter() - start_time)
+        return obj
+
+
+def _group_events(originator_ids, events):
+    """Group those events in a chunk which pertain to the supplied originator_ids."""
+    grouped_events = {}
+    for event in events:
+        originator_id = event.originator_id
+        if originator_id in originator_ids:
+            grouped_events.setdefault(originator_id, []).append(event)
+    return grouped_events
+
+
+def _extend_grouped_events(grouped_entity_events, grouped_chunk_events):
+    for originator_id, chunk_events in grouped_chunk_events.items():
+        grouped_entity_events[originator_id].extend(chunk_events)
+    return grouped_entity_events
+
+
+def final_event_positions(event_store, originator_ids, start=0, end=None):
+    """Locate the final event for each of a series of originators.
+
+    Args:
+        event_store: The event store to search.
+
+        originator_ids: An iterable series of originator_ids.
+
+        start: An optional byte offset, at a record boundary, from which to search.
+
+        end: An optional byte offset, at a record boundary, at which to stop searching.
+
+    Returns:
+        A dictionary mapping each originator_id which has at least one event to the
+        byte offset at which its final event begins.
+    """
+    originator_ids = set(originator_ids)
+    final_positions = {}
+    position = start
+    with open(event_store.store_path, 'rb') as store_file:
+        store_file.seek(start)
+        for line in store_file:
+            if end is not None and position >= end:
+                break
+            originator_id = EventView.from_bytes(line).originator_id
+            if originator_id in originator_ids:
+                final_positions[originator_id] = position
+            position += len(line)
+    return final_positions
 
 
 def deserialize_event(stored_event):
@@ -83,16 +246,19 @@ def deserialize_event(stored_event):
     Returns:
         An event object.
     """
+    if instrumentation.enabled:
+        start_time = time.perf_counter()
     topic = stored_event['topic']
     module_name, _, class_name = topic.partition('#')
-    module = importlib.import_module(module_name)
-    cls = resolve_attr(module, class_name)
+    cls = resolve_class(module_name, class_name)
     attributes = stored_event['attributes']
     event = cls(**attributes)
+    if instrumentation.enabled:
+        instrumentation.record('deserialize', topic, time.perf_counter() - start_time)
     return event
 
 
-def extant_entity_ids(event_store, entity_class_name):
+def extant_entity_ids(event_store, entity_class_name, processes=None):
     """Scan all events in an event store to find extant entities of a specified type.
 
     Use this function to find those entities which have been created, but not yet
@@ -105,24 +271,50 @@ def extant_entity_ids(event_store, entity_class_name):
             <EntityName>.Created and <EntityName>.Discarded event topics can be
             found.
 
+        processes: An optional number of worker processes across which to scan the
+            event store in parallel. If None, the scan is performed in this process.
+
     Return:
         A set of extant entity ids.
     """
-    entity_ids = set()
-    with event_store.open_event_stream() as events:
-        for event in events:
-            topic = event['topic']
-            if topic.endswith(entity_class_name + '.Created'):
-                entity_id = event['attributes']['originator_id']
-                if entity_id in entity_ids:
-                    raise InconsistentEventStreamError("Inconsistent event stream: Duplicate {} creation "
-                                                       "for id {}".format(entity_class_name, entity_id))
-                entity_ids.add(entity_id)
-
-            elif topic.endswith(entity_class_name + '.Discarded'):
-                entity_id = event['attributes']['originator_id']
-                if entity_id not in entity_ids:
-                    raise InconsistentEventStreamError("Inconsistent event stream: Discarding non-existent {} "
-                                                       "for id {}".format(entity_class_name, entity_id))
-                entity_ids.discard(entity_id)
+    if processes is not None:
+        return scan_events(event_store,
+                           mapper=partial(_entity_lifecycle_list, entity_class_name),
+                           reducer=partial(_apply_entity_lifecycle, entity_class_name),
+                           initial=set(),
+                           processes=processes,
+                           lazy=True)
+    with event_store.open_event_stream(lazy=True) as events:
+        return _apply_entity_lifecycle(entity_class_name, set(), _entity_lifecycle(entity_class_name, events))
+
+
+def _entity_lifecycle(entity_class_name, events):
+    """Generate (created, entity_id) pairs, in order, from Created and Discarded events."""
+    created_suffix = entity_class_name + '.Created'
+    discarded_suffix = entity_class_name + '.Discarded'
+    for event in events:
+        topic = event.topic
+        if topic.endswith(created_suffix):
+            yield True, event.originator_id
+        elif topic.endswith(discarded_suffix):
+            yield False, event.originator_id
+
+
+def _entity_lifecycle_list(entity_class_name, events):
+    return list(_entity_lifecycle(entity_class_name, events))
+
+
+def _apply_entity_lifecycle(entity_class_name, entity_ids, lifecycle):
+    """Apply a series of (created, entity_id) pairs to a set of extant entity ids."""
+    for created, entity_id in lifecycle:
+        if created:
+            if entity_id in entity_ids:
+                raise InconsistentEventStreamError("Inconsistent event stream: Duplicate {} creation "
+                                                   "for id {}".format(entity_class_name, entity_id))
+            entity_ids.add(entity_id)
+        else:
+            if entity_id not in entity_ids:
+                raise InconsistentEventStreamError("Inconsistent event stream: Discarding non-existent {} "
+                                                   "for id {}".format(entity_class_name, entity_id))
+            entity_ids.discard(entity_id)
     return entity_ids
@@ -0,0 +1,104 @@
+"""Parallel scanning of an event store across worker processes.
+
+The event store file is split at record boundaries into contiguous byte-range chunks.
+Each chunk is mapped to a partial result in its own worker process, and the partial
+results are reduced in log order so that ordering-sensitive results remain correct.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+import os
+
+from infrastructure.event_store import EventStream
+
+
+def chunk_boundaries(store_path, number_of_chunks, start=0, end=None):
+    """Split an event store file into byte ranges which begin and end at record boundaries.
+
+    Args:
+        store_path: The path to the event store file.
+
+        number_of_chunks: The desired number of chunks. Fewer chunks may be returned if the
+            store contains too few records.
+
+        start: An optional byte offset, at a record boundary, at which the first chunk begins.
+
+        end: An optional byte offset, at a record boundary, at which the last chunk ends.
+            If None, the last chunk ends at the end of the file.
+
+    Returns:
+        A list of (start, end) byte offset pairs, in log order, which together cover the
+        requested range.
+    """
+    if number_of_chunks < 1:
+        raise ValueError("number_of_chunks {!r} is not positive".format(number_of_chunks))
+    size = os.path.getsize(store_path) if end is None else end
+    boundaries = [start]
+    with open(store_path, 'rb') as store_file:
+        for i in range(1, number_of_chunks):
+            store_file.seek(max(start + (size - start) * i // number_of_chunks - 1, boundaries[-1]))
+            store_file.readline()  # Skip to the start of the next record
+            boundary = store_file.tell()
+            if boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(size)
+    return [(lower, upper) for lower, upper in zip(boundaries, boundaries[1:]) if lower < upper]
+
+
+def scan_events(event_store, mapper, reducer, initial, processes=None, number_of_chunks=None, start=0, end=None,
+                lazy=False):
+    """Map a function over chunks of an event store in parallel and reduce the results in log order.
+
+    Args:
+        event_store: The EventStore to scan.
+
+        mapper: A unary function which accepts an iterable series of stored events (deserialised
+            JSON dictionaries) comprising one chunk, and returns a partial result. The mapper is
+            called in a worker process, so it and its result must be picklable; module-level
+            functions, or functools.partial objects wrapping them, are suitable.
+
+        reducer: A binary function which accepts the accumulated result as its left argument and
+            the partial result for the next chunk as its right argument, and returns the new
+            accumulated result. Partial results are reduced strictly in log order.
+
+        initial: The initial value of the accumulated result.
+
+        processes: The number of worker processes. If None, the number of CPUs is used.
+
+        number_of_chunks: The number of chunks into which to split the store. If None, one chunk
+            per worker process is used.
+
+        start: An optional byte offset, at a record boundary, at which to begin scanning.
+
+        end: An optional byte offset, at a record boundary, at which to stop scanning. If None,
+            the scan continues to the end of the store.
+
+        lazy: If True, the mapper is passed EventViews rather than dictionaries.
+
+    Returns:
+        The accumulated result.
+    """
+    processes = processes or os.cpu_count() or 1
+    if not os.path.exists(event_store.store_path):
+        return initial
+    chunks = chunk_boundaries(event_store.store_path, number_of_chunks or processes, start, end)
+    if processes == 1 or len(chunks) <= 1:
+        partials = (_scan_chunk(event_store.store_path, mapper, chunk_start, chunk_end, lazy)
+                    for chunk_start, chunk_end in chunks)
+        return reduce(reducer, partials, initial)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        partials = executor.map(_scan_chunk,
+                                [event_store.store_path] * len(chunks),
+                                [mapper] * len(chunks),
+                                [chunk_start for chunk_start, _ in chunks],
+                                [chunk_end for _, chunk_end in chunks],
+                                [lazy] * len(chunks))
+        # executor.map yields results in submission order, which is log order
+        return reduce(reducer, partials, initial)
+
+
+def _scan_chunk(store_path, mapper, start, end, lazy):
+    with EventStream(store_path, lambda event: True, start, end, lazy) as events:
+        return mapper(events)
@@ -0,0 +1,296 @@
+"""A per-aggregate index of event positions, versions and timestamps.
+
+The AggregateIndex follows the event log, recording for each originator the byte offset of each
+of its events, the version the originator reaches by applying it, and its timestamp, in compact
+arrays. An originator's state at any version or time can then be reconstituted by binary search
+of its versions or timestamps and by reading only its own records, starting from the nearest
+earlier snapshot of its state rather than from its first event. The most recently used
+snapshots are retained, up to a limit.
+
+The index also records the positions of the Board events which mention each work item, so
+that the whole history of a work item, spread across its own events and those of the Boards
+on which it has been scheduled, can be read without scanning the log.
+"""
+
+from array import array
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from heapq import merge
+import pickle
+import threading
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_store import ATTRIBUTES_CHANGED_TOPIC, SubscriptionError
+from infrastructure.transcoders import EventDecoder
+
+
+_CREATED_SUFFIX = '.Created'
+_BOARD_WORK_ITEM_EVENT_PREFIX = 'kanban.domain.model.board#Board.WorkItem'
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def shared_aggregate_index(event_store):
+    """Obtain the AggregateIndex shared by all users of an event store in this process."""
+    with _indexes_lock:
+        try:
+            return _indexes[event_store.store_path]
+        except KeyError:
+            index = _indexes[event_store.store_path] = AggregateIndex(event_store)
+            return index
+
+
+class _AggregateEvents:
+    """The positions, resulting versions and timestamps of the events of one originator."""
+
+    __slots__ = ('positions', 'versions', 'timestamps')
+
+    def __init__(self):
+        self.positions = array('q')
+        self.versions = array('q')
+        self.timestamps = array('d')
+
+    def count_as_of(self, as_of_version=None, as_of_timestamp=None):
+        """The number of leading events applied to reach a version, or by a time."""
+        count = len(self.positions)
+        if as_of_version is not None:
+            count = min(count, bisect_right(self.versions, as_of_version))
+        if as_of_timestamp is not None:
+            count = min(count, bisect_right(self.timestamps, as_of_timestamp))
+        return count
+
+
+class AggregateIndex:
+    """Indexes the events of each originator in an event store.
+
+    The index is brought up to date with the event log whenever it is used.
+    """
+
+    def __init__(self, event_store, snapshot_interval=64, max_snapshots=1024):
+        """Create an AggregateIndex.
+
+        Args:
+            event_store: The EventStore to index.
+
+            snapshot_interval: The number of events of an originator between snapshots of its
+                state, which are taken as states are reconstituted.
+
+            max_snapshots: The largest number of snapshots retained, across all originators.
+                The least recently used snapshots are discarded first.
+        """
+        self._event_store = event_store
+        self._snapshot_interval = snapshot_interval
+        self._max_snapshots = max_snapshots
+        self._lock = threading.RLock()
+        self._decoder = EventDecoder()
+        self._subscription = None
+        self._store_file = None
+        self._reset()
+
+    def _reset(self):
+        if self._subscription is not None:
+            self._subscription.close()
+        if self._store_file is not None:
+            self._store_file.close()
+        self._subscription = self._event_store.subscribe(0, lazy=True)
+        self._store_file = None
+        self._position = 0
+        self._aggregates = {}
+        self._entity_types = {}
+        # Pickled states keyed by (originator_id, number of events applied), least recently used first
+        self._snapshots = OrderedDict()
+        # The numbers of events applied in the snapshots of each originator, in ascending order
+        self._snapshot_counts = {}
+        self._work_item_mentions = {}
+
+    def close(self):
+        """Stop following the event log."""
+        with self._lock:
+            self._subscription.close()
+            if self._store_file is not None:
+                self._store_file.close()
+                self._store_file = None
+
+    @property
+    def position(self):
+        """The position in the event log up to which events have been indexed."""
+        return self._position
+
+    def update(self):
+        """Index any records appended to the log since the last update.
+
+        If the event log has been replaced or truncated, the index is rebuilt.
+        """
+        with self._lock:
+            try:
+                records = self._subscription.poll()
+            except SubscriptionError:
+                self._reset()
+                records = self._subscription.poll()
+            if records and self._store_file is None:
+                self._store_file = open(self._event_store.store_path, 'rb')
+            for end_position, view in records:
+                self._index_record(self._position, view)
+                self._position = end_position
+
+    def _index_record(self, position, view):
+        originator_id = view.originator_id
+        topic = view.topic
+        version = view.attribute('originator_version')
+        if topic.endswith(_CREATED_SUFFIX):
+            self._entity_types[originator_id] = topic.rpartition('#')[2][:-len(_CREATED_SUFFIX)]
+        elif topic == ATTRIBUTES_CHANGED_TOPIC:
+            version += view.attribute('changes')
+        else:
+            version += 1
+        try:
+            events = self._aggregates[originator_id]
+        except KeyError:
+            events = self._aggregates[originator_id] = _AggregateEvents()
+        events.positions.append(position)
+        events.versions.append(version)
+        events.timestamps.append(view.attribute('timestamp'))
+        if topic.startswith(_BOARD_WORK_ITEM_EVENT_PREFIX):
+            work_item_id = view.attribute('work_item_id')
+            try:
+                mentions = self._work_item_mentions[work_item_id]
+            except KeyError:
+                mentions = self._work_item_mentions[work_item_id] = array('q')
+            mentions.append(position)
+
+    def entity_ids(self, entity_type, as_of_version=None, as_of_timestamp=None):
+        """The ids of the entities of a type which had been created by a version or time.
+
+        Args:
+            entity_type: The unqualified class name of the entities, such as 'Board'.
+
+            as_of_version: An optional version. Every entity has reached version zero once
+                created, so this has no effect unless negative.
+
+            as_of_timestamp: An optional time, in seconds since the epoch.
+
+        Returns:
+            A set of entity ids. Entities which had been discarded by then are included.
+        """
+        self.update()
+        with self._lock:
+            return {originator_id for originator_id, type_of_entity in self._entity_types.items()
+                    if type_of_entity == entity_type
+                    and self._aggregates[originator_id].count_as_of(as_of_version, as_of_timestamp) > 0}
+
+    def version(self, originator_id):
+        """The version reached by an originator with its latest event, or None if it has no events."""
+        self.update()
+        with self._lock:
+            events = self._aggregates.get(originator_id)
+            return None if events is None else events.versions[-1]
+
+    def positions(self, originator_id, after_version=None, as_of_version=None, as_of_timestamp=None):
+        """The positions of the records of an originator's events, in log order.
+
+        Args:
+            originator_id: The id of the originator.
+
+            after_version: If supplied, only events taking the originator beyond this version
+                are included.
+
+            as_of_version: If supplied, only events taking the originator up to this version
+                are included.
+
+            as_of_timestamp: If supplied, only events timestamped no later than this are included.
+
+        Returns:
+            A list of byte offsets.
+        """
+        self.update()
+        with self._lock:
+            events = self._aggregates.get(originator_id)
+            if events is None:
+                return []
+            start = 0 if after_version is None else bisect_right(events.versions, after_version)
+            return list(events.positions[start:events.count_as_of(as_of_version, as_of_timestamp)])
+
+    def work_item_positions(self, work_item_id):
+        """The positions of the records of every event concerning a work item, in log order.
+
+        These are the events of the WorkItem itself, and the events of Boards which schedule,
+        advance, retire or abandon it.
+
+        Returns:
+            A list of byte offsets.
+        """
+        self.update()
+        with self._lock:
+            events = self._aggregates.get(work_item_id)
+            own_positions = () if events is None else events.positions
+            return list(merge(own_positions, self._work_item_mentions.get(work_item_id, ())))
+
+    def read(self, positions):
+        """Read the records at a series of positions.
+
+        Returns:
+            A list of stored events (dictionaries).
+        """
+        with self._lock:
+            records = []
+            for position in positions:
+                self._store_file.seek(position)
+                records.append(self._decoder.decode(self._store_file.readline()))
+            return records
+
+    def reconstitute(self, originator_id, mutator, as_of_version=None, as_of_timestamp=None):
+        """Reconstitute the state of an originator as it was at a version or time.
+
+        Starts from the nearest earlier snapshot, if any, and snapshots the state at intervals
+        while applying later events.
+
+        Args:
+            originator_id: The id of the originator.
+
+            mutator: The function which applies an event to a state, as for EventPlayer.
+
+            as_of_version: An optional version beyond which events are not applied.
+
+            as_of_timestamp: An optional time after which events are not applied.
+
+        Returns:
+            The reconstituted originator, or None if it did not exist by then.
+        """
+        self.update()
+        with self._lock:
+            events = self._aggregates.get(originator_id)
+            if events is None:
+                return None
+            count = events.count_as_of(as_of_version, as_of_timestamp)
+            snapshot_counts = self._snapshot_counts.get(originator_id, ())
+            snapshot_index = bisect_right(snapshot_counts, count) - 1
+            if snapshot_index >= 0:
+                applied = snapshot_counts[snapshot_index]
+                self._snapshots.move_to_end((originator_id, applied))
+                state = pickle.loads(self._snapshots[originator_id, applied])
+            else:
+                applied, state = 0, None
+            positions = events.positions[applied:count]
+            stored_events = self.read(positions)
+
+        for stored_event in stored_events:
+            state = mutator(state, deserialize_event(stored_event))
+            applied += 1
+            if applied % self._snapshot_interval == 0:
+                self._take_snapshot(originator_id, applied, state)
+        return state
+
+    def _take_snapshot(self, originator_id, applied, state):
+        with self._lock:
+            key = (originator_id, applied)
+            if key in self._snapshots:
+                return
+            self._snapshots[key] = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+            insort(self._snapshot_counts.setdefault(originator_id, []), applied)
+            while len(self._snapshots) > self._max_snapshots:
+                (evicted_id, evicted_applied), _ = self._snapshots.popitem(last=False)
+                snapshot_counts = self._snapshot_counts[evicted_id]
+                snapshot_counts.remove(evicted_applied)
+                if not snapshot_counts:
+                    del self._snapshot_counts[evicted_id]
@@ -0,0 +1,289 @@
+"""A projection of the age of the work in progress in each column of each Board.
+
+The projection follows the event log, recording when each work item entered its current column,
+from the timestamps of the WorkItemScheduled and WorkItemAdvanced events. The work items in each
+column are kept in an IndexableSkipList, ordered by the time at which they entered it, so that
+the oldest work items, and percentiles of their ages, can be obtained without examining every
+work item. Entering, leaving or moving between columns, and finding a percentile, take time
+logarithmic in the number of work items in the columns concerned.
+"""
+
+from itertools import islice
+import math
+import threading
+
+from singledispatch import singledispatch
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_store import SubscriptionError
+from kanban.domain.model.board import Board
+from kanban.domain.model.entity import Entity
+from utility.skip_list import IndexableSkipList
+from utility.time import utc_now
+
+
+class _ColumnAges:
+    """The work items in a column, ordered by the time at which they entered it."""
+
+    __slots__ = ('name', 'entries')
+
+    def __init__(self, name):
+        self.name = name
+        # (entry time, work item id) pairs, oldest first
+        self.entries = IndexableSkipList()
+
+    def add(self, entry_time, work_item_id):
+        self.entries.add((entry_time, work_item_id))
+
+    def remove(self, entry_time, work_item_id):
+        self.entries.remove((entry_time, work_item_id))
+
+    def oldest(self, count, now):
+        return [(work_item_id, now - entry_time) for entry_time, work_item_id in islice(self.entries, count)]
+
+    def age_percentile(self, percentile, now):
+        if not self.entries:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * len(self.entries)))
+        # Ages increase as entry times decrease, so the youngest work items are last
+        entry_time, _ = self.entries[-rank]
+        return now - entry_time
+
+
+class AgingWorkInProgressProjection:
+    """Tracks how long each work item has been in its current column.
+
+    The projection is brought up to date with the event log whenever it is queried. Ages are
+    in seconds, measured up to a time which defaults to the present.
+    """
+
+    def __init__(self, event_store):
+        self._event_store = event_store
+        self._lock = threading.Lock()
+        self._subscription = None
+        self._reset()
+
+    def _reset(self):
+        if self._subscription is not None:
+            self._subscription.close()
+        self._subscription = self._event_store.subscribe(0)
+        self._column_ids_of_board = {}
+        self._columns = {}
+        self._location_of_work_item = {}
+
+    def close(self):
+        """Stop following the event log."""
+        with self._lock:
+            self._subscription.close()
+
+    def update(self):
+        """Apply any events appended to the log since the last update.
+
+        If the event log has been replaced or truncated, the projection is rebuilt.
+        """
+        with self._lock:
+            try:
+                records = self._subscription.poll()
+            except SubscriptionError:
+                self._reset()
+                records = self._subscription.poll()
+            for _, stored_event in records:
+                _when(deserialize_event(stored_event), self)
+
+    def column_ids(self, board_id):
+        """The ids of the columns of a Board, from left to right, or an empty list if there is no such Board."""
+        self.update()
+        with self._lock:
+            return list(self._column_ids_of_board.get(board_id, ()))
+
+    def entry_time(self, work_item_id):
+        """The time at which a work item entered its current column, or None if it is not on a Board."""
+        self.update()
+        with self._lock:
+            location = self._location_of_work_item.get(work_item_id)
+            return None if location is None else location[1]
+
+    def oldest_work_items(self, column_id, count, now=None):
+        """Obtain the work items which have been in a column the longest.
+
+        Args:
+            column_id: The id of the column.
+
+            count: The largest number of work items to obtain.
+
+            now: The time, in seconds since the epoch, at which to measure ages. By default, the
+                present.
+
+        Returns:
+            A list of up to count (work item id, age in seconds) pairs, oldest first.
+
+        Raises:
+            ValueError: If there is no such column.
+        """
+        self.update()
+        now = utc_now() if now is None else now
+        with self._lock:
+            return self._column(column_id).oldest(count, now)
+
+    def age_percentile(self, column_id, percentile, now=None):
+        """Obtain a percentile of the ages of the work items in a column.
+
+        Args:
+            column_id: The id of the column.
+
+            percentile: A percentile, greater than zero and at most 100.
+
+            now: The time, in seconds since the epoch, at which to measure ages. By default, the
+                present.
+
+        Returns:
+            The smallest age in seconds which at least percentile percent of the work items in
+            the column do not exceed, or None if the column is empty.
+
+        Raises:
+            ValueError: If there is no such column.
+        """
+        self.update()
+        now = utc_now() if now is None else now
+        with self._lock:
+            return self._column(column_id).age_percentile(percentile, now)
+
+    def aging_report(self, board_id, count=5, percentiles=(50, 85), now=None):
+        """Report the age of the work in progress in each column of a Board.
+
+        Args:
+            board_id: The id of the Board.
+
+            count: The number of oldest work items to include for each column.
+
+            percentiles: The percentiles of the ages of work items to include for each column.
+
+            now: The time, in seconds since the epoch, at which to measure ages. By default, the
+                present.
+
+        Returns:
+            A list of dictionaries, one for each column from left to right, with 'column_id',
+            'name', 'work_items' (the number of work items), 'oldest' (as for
+            oldest_work_items()) and 'age_percentiles' (a mapping from percentiles to ages, as
+            for age_percentile()) keys. The whole report reflects a single state of the
+            projection. If there is no such Board, the list is empty.
+        """
+        self.update()
+        now = utc_now() if now is None else now
+        with self._lock:
+            report = []
+            for column_id in self._column_ids_of_board.get(board_id, ()):
+                column = self._columns[column_id]
+                report.append(dict(column_id=column_id,
+                                   name=column.name,
+                                   work_items=len(column.entries),
+                                   oldest=column.oldest(count, now),
+                                   age_percentiles={percentile: column.age_percentile(percentile, now)
+                                                    for percentile in percentiles}))
+            return report
+
+    def _column(self, column_id):
+        try:
+            return self._columns[column_id]
+        except KeyError:
+            raise ValueError("No column with id {}".format(column_id)) from None
+
+    # ==================================================================================================================
+    # Maintenance
+    #
+
+    def _column_added(self, board_id, column_id, name, succeeding_column_id=None):
+        column_ids = self._column_ids_of_board.setdefault(board_id, [])
+        if succeeding_column_id is None:
+            column_ids.append(column_id)
+        else:
+            column_ids.insert(column_ids.index(succeeding_column_id), column_id)
+        self._columns[column_id] = _ColumnAges(name)
+
+    def _column_removed(self, board_id, column_id):
+        self._column_ids_of_board[board_id].remove(column_id)
+        for _, work_item_id in self._columns.pop(column_id).entries:
+            del self._location_of_work_item[work_item_id]
+
+    def _board_discarded(self, board_id):
+        for column_id in list(self._column_ids_of_board.get(board_id, ())):
+            self._column_removed(board_id, column_id)
+        self._column_ids_of_board.pop(board_id, None)
+
+    def _enter(self, column_id, work_item_id, entry_time):
+        self._columns[column_id].add(entry_time, work_item_id)
+        self._location_of_work_item[work_item_id] = (column_id, entry_time)
+
+    def _leave(self, work_item_id):
+        """Remove a work item from its column, returning the id of the column."""
+        column_id, entry_time = self._location_of_work_item.pop(work_item_id)
+        self._columns[column_id].remove(entry_time, work_item_id)
+        return column_id
+
+
+# ======================================================================================================================
+# Mutators - all projection maintenance is dispatched by the generic _when() function.
+#
+
+@singledispatch
+def _when(event, projection):
+    _ = event
+    _ = projection
+
+
+@_when.register(Board.NewColumnAdded)
+def _(event, projection):
+    projection._column_added(event.originator_id, event.column_id, event.column_name)
+
+
+@_when.register(Board.NewColumnInserted)
+def _(event, projection):
+    projection._column_added(event.originator_id, event.column_id, event.column_name, event.succeeding_column_id)
+
+
+@_when.register(Board.ColumnRemoved)
+def _(event, projection):
+    projection._column_removed(event.originator_id, event.column_id)
+
+
+@_when.register(Board.Discarded)
+def _(event, projection):
+    projection._board_discarded(event.originator_id)
+
+
+@_when.register(Entity.AttributeChanged)
+def _(event, projection):
+    column = projection._columns.get(event.originator_id)
+    if column is not None and event.name == '_name':
+        column.name = event.value
+
+
+@_when.register(Entity.AttributesChanged)
+def _(event, projection):
+    column = projection._columns.get(event.originator_id)
+    if column is not None and '_name' in event.values:
+        column.name = event.values['_name']
+
+
+@_when.register(Board.WorkItemScheduled)
+def _(event, projection):
+    first_column_id = projection._column_ids_of_board[event.originator_id][0]
+    projection._enter(first_column_id, event.work_item_id, event.timestamp)
+
+
+@_when.register(Board.WorkItemAdvanced)
+def _(event, projection):
+    source_column_id = projection._leave(event.work_item_id)
+    column_ids = projection._column_ids_of_board[event.originator_id]
+    destination_column_id = column_ids[column_ids.index(source_column_id) + 1]
+    projection._enter(destination_column_id, event.work_item_id, event.timestamp)
+
+
+@_when.register(Board.WorkItemRetired)
+def _(event, projection):
+    projection._leave(event.work_item_id)
+
+
+@_when.register(Board.WorkItemAbandoned)
+def _(event, projection):
+    projection._leave(event.work_item_id)
@@ -0,0 +1,268 @@
+"""Secondary indexes over entity attributes, for narrowing queries before replay.
+
+An AttributeIndex follows the event log, tracking the extant Boards and WorkItems, the current
+values of their indexed attributes as set by Created and AttributeChanged events, and which
+work items are scheduled on which boards. Repositories use it to reduce a structured query to
+a set of candidate ids, so that only those entities need be reconstituted.
+"""
+
+from bisect import bisect_left, bisect_right
+import threading
+
+from singledispatch import singledispatch
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_store import SubscriptionError
+from kanban.domain.model.board import Board
+from kanban.domain.model.entity import Entity
+from kanban.domain.model.queries import AllOf, Equals, HasWorkItem, InRange, OnBoard, OneOf, Query, conjuncts
+from kanban.domain.model.workitem import WorkItem
+
+
+# The attributes indexed for each type of entity
+INDEXED_ATTRIBUTES = dict(Board=('name',), WorkItem=('name', 'due_date'))
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def shared_attribute_index(event_store):
+    """Obtain the AttributeIndex shared by all users of an event store in this process."""
+    with _indexes_lock:
+        try:
+            return _indexes[event_store.store_path]
+        except KeyError:
+            index = _indexes[event_store.store_path] = AttributeIndex(event_store)
+            return index
+
+
+class AttributeIndex:
+    """Indexes the attributes of the Boards and WorkItems in an event store.
+
+    The index is brought up to date with the event log whenever it is queried.
+    """
+
+    def __init__(self, event_store):
+        self._event_store = event_store
+        self._lock = threading.Lock()
+        self._subscription = None
+        self._reset()
+
+    def _reset(self):
+        if self._subscription is not None:
+            self._subscription.close()
+        self._subscription = self._event_store.subscribe(0)
+        self._entity_types = {}
+        self._values = {(entity_type, attribute): {}
+                        for entity_type, attributes in INDEXED_ATTRIBUTES.items()
+                        for attribute in attributes}
+        self._current_values = {}
+        self._sorted_values = {}
+        self._board_of_work_item = {}
+        self._work_items_on_board = {}
+
+    def close(self):
+        """Stop following the event log."""
+        with self._lock:
+            self._subscription.close()
+
+    def update(self):
+        """Apply any events appended to the log since the last update.
+
+        If the event log has been replaced or truncated, the index is rebuilt.
+        """
+        with self._lock:
+            try:
+                records = self._subscription.poll()
+            except SubscriptionError:
+                self._reset()
+                records = self._subscription.poll()
+            for _, stored_event in records:
+                _when(deserialize_event(stored_event), self)
+
+    def extant_ids(self, entity_type):
+        """The ids of the extant entities of a type, such as 'Board'."""
+        self.update()
+        with self._lock:
+            return {id for id, type_of_entity in self._entity_types.items() if type_of_entity == entity_type}
+
+    def narrow(self, entity_type, predicate):
+        """Narrow a query to a set of candidate ids, using the index.
+
+        Args:
+            entity_type: The type of entity queried, either 'Board' or 'WorkItem'.
+
+            predicate: A structured query, an AllOf combining structured queries and other
+                predicates, or any other unary callable.
+
+        Returns:
+            A pair of the set of ids of the extant entities which satisfy all the structured
+            queries the index can evaluate, and the residual predicate which those entities
+            must also satisfy, or None if there is nothing left to evaluate. If the index can
+            evaluate no part of the predicate, the ids are None and the residual is the
+            original predicate.
+        """
+        if not any(isinstance(conjunct, Query) for conjunct in conjuncts(predicate)):
+            return None, predicate
+        self.update()
+        ids = None
+        residuals = []
+        with self._lock:
+            for conjunct in conjuncts(predicate):
+                matching_ids = self._matching_ids(entity_type, conjunct)
+                if matching_ids is None:
+                    residuals.append(conjunct)
+                elif ids is None:
+                    ids = set(matching_ids)
+                else:
+                    ids.intersection_update(matching_ids)
+        if ids is None:
+            return None, predicate
+        if not residuals:
+            return ids, None
+        return ids, residuals[0] if len(residuals) == 1 else AllOf(*residuals)
+
+    def _matching_ids(self, entity_type, query):
+        """The ids of the extant entities matching a query, or None if it cannot be evaluated."""
+        if isinstance(query, OnBoard) and entity_type == 'WorkItem':
+            return self._work_items_on_board.get(query.board_id, ())
+        if isinstance(query, HasWorkItem) and entity_type == 'Board':
+            board_id = self._board_of_work_item.get(query.work_item_id)
+            return () if board_id is None else (board_id,)
+        values = self._values.get((entity_type, getattr(query, 'attribute', None)))
+        if values is None:
+            return None
+        try:
+            if isinstance(query, Equals):
+                return values.get(query.value, ())
+            if isinstance(query, OneOf):
+                return set().union(*(values.get(value, ()) for value in query.values))
+            if isinstance(query, InRange):
+                sorted_values = self._sorted(entity_type, query.attribute)
+                start = 0 if query.lower is None else bisect_left(sorted_values, query.lower)
+                end = len(sorted_values) if query.upper is None else bisect_right(sorted_values, query.upper)
+                return set().union(*(values[value] for value in sorted_values[start:end]))
+        except TypeError:
+            # Unhashable or incomparable values, which must be evaluated against the entities
+            return None
+        return None
+
+    def _sorted(self, entity_type, attribute):
+        key = (entity_type, attribute)
+        try:
+            return self._sorted_values[key]
+        except KeyError:
+            sorted_values = self._sorted_values[key] = sorted(
+                value for value in self._values[key] if value is not None)
+            return sorted_values
+
+    # ==================================================================================================================
+    # Maintenance
+    #
+
+    def _created(self, entity_type, entity_id, attributes):
+        self._entity_types[entity_id] = entity_type
+        for attribute in INDEXED_ATTRIBUTES[entity_type]:
+            self._set_value(entity_type, entity_id, attribute, attributes.get(attribute))
+
+    def _set_value(self, entity_type, entity_id, attribute, value):
+        key = (entity_type, attribute)
+        self._remove_value(key, entity_id)
+        try:
+            ids = self._values[key][value]
+        except KeyError:
+            ids = self._values[key][value] = set()
+            self._sorted_values.pop(key, None)
+        except TypeError:
+            return  # Unhashable values are not indexed
+        ids.add(entity_id)
+        self._current_values[entity_id, attribute] = value
+
+    def _remove_value(self, key, entity_id):
+        _, attribute = key
+        try:
+            value = self._current_values.pop((entity_id, attribute))
+        except KeyError:
+            return
+        ids = self._values[key][value]
+        ids.discard(entity_id)
+        if not ids:
+            del self._values[key][value]
+            self._sorted_values.pop(key, None)
+
+    def _discarded(self, entity_id):
+        entity_type = self._entity_types.pop(entity_id, None)
+        if entity_type is None:
+            return
+        for attribute in INDEXED_ATTRIBUTES[entity_type]:
+            self._remove_value((entity_type, attribute), entity_id)
+
+    def _scheduled(self, board_id, work_item_id):
+        self._board_of_work_item[work_item_id] = board_id
+        self._work_items_on_board.setdefault(board_id, set()).add(work_item_id)
+
+    def _unscheduled(self, work_item_id):
+        board_id = self._board_of_work_item.pop(work_item_id, None)
+        if board_id is not None:
+            self._work_items_on_board[board_id].discard(work_item_id)
+
+
+# ======================================================================================================================
+# Mutators - all index maintenance is dispatched by the generic _when() function.
+#
+
+@singledispatch
+def _when(event, index):
+    _ = event
+    _ = index
+
+
+@_when.register(Board.Created)
+def _(event, index):
+    index._created('Board', event.originator_id, event.__dict__)
+
+
+@_when.register(WorkItem.Created)
+def _(event, index):
+    index._created('WorkItem', event.originator_id, event.__dict__)
+
+
+@_when.register(Entity.AttributeChanged)
+def _(event, index):
+    entity_type = index._entity_types.get(event.originator_id)
+    attribute = event.name.lstrip('_')
+    if entity_type is not None and attribute in INDEXED_ATTRIBUTES[entity_type]:
+        index._set_value(entity_type, event.originator_id, attribute, event.value)
+
+
+@_when.register(Entity.AttributesChanged)
+def _(event, index):
+    for attribute_changed in event.expand():
+        _when(attribute_changed, index)
+
+
+@_when.register(Entity.Discarded)
+def _(event, index):
+    index._discarded(event.originator_id)
+
+
+@_when.register(Board.Discarded)
+def _(event, index):
+    index._discarded(event.originator_id)
+    for work_item_id in index._work_items_on_board.pop(event.originator_id, ()):
+        del index._board_of_work_item[work_item_id]
+
+
+@_when.register(Board.WorkItemScheduled)
+def _(event, index):
+    index._scheduled(event.originator_id, event.work_item_id)
+
+
+@_when.register(Board.WorkItemRetired)
+def _(event, index):
+    index._unscheduled(event.work_item_id)
+
+
+@_when.register(Board.WorkItemAbandoned)
+def _(event, index):
+    index._unscheduled(event.work_item_id)
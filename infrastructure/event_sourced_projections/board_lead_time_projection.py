@@ -1,20 +1,48 @@
 from infrastructure.event_processing import EventPlayer
+from infrastructure.event_sourced_projections.checkpoints import CheckpointedProjection
 from kanban.domain.model import lead_time
 from utility.itertools import consume
 
 
-class LeadTimeProjection(lead_time.LeadTimeProjection, EventPlayer):
-    """
+class LeadTimeProjection(lead_time.LeadTimeProjection, CheckpointedProjection, EventPlayer):
+    """A lead time projection initialized from an event store.
 
+    If a checkpoint_path is supplied, the projection state is checkpointed once the historical
+    events have been loaded, and subsequently restored from that checkpoint so that only events
+    recorded since need be replayed.
     """
 
-    def __init__(self, board_id, event_store, **kwargs):
+    checkpoint_version = 2
+
+    def __init__(self, board_id, event_store, checkpoint_path=None, **kwargs):
         super().__init__(board_id=board_id,
                          event_store=event_store,
+                         checkpoint_path=checkpoint_path,
                          mutator=lead_time.mutate,
                          stream_primer=self,
                          **kwargs)
 
     def _load_events(self):
         """Initialize the projection with historical events."""
-        consume(self._replay_events([self._board_id]))
+        position = self._load_checkpoint()
+        end = self._event_store.end_position()
+        consume(self._replay_events([self._board_id], start=position, end=end))
+        self.save_checkpoint(end)
+
+    def _checkpoint_key(self):
+        return self._board_id
+
+    def _checkpoint_state(self):
+        return dict(work_item_start_times=self._work_item_start_times,
+                    lead_times=self._lead_times,
+                    retirement_times=self._retirement_times)
+
+    def _restore_checkpoint_state(self, state):
+        self._work_item_start_times = state['work_item_start_times']
+        self._lead_times = state['lead_times']
+        self._retirement_times = state['retirement_times']
+
+    def _reset_checkpoint_state(self):
+        self._work_item_start_times = {}
+        self._lead_times = {}
+        self._retirement_times = {}
@@ -0,0 +1,110 @@
+"""Persistent checkpoints of projection state, for fast projection startup."""
+
+import json
+import os
+
+from infrastructure.transcoders import ObjectJSONEncoder, ObjectJSONDecoder
+
+
+class CheckpointedProjection:
+    """Mixin class for projections which persist their state together with the log position it reflects.
+
+    On startup a projection loads its checkpoint, if there is a valid one, and need only catch up with
+    those events recorded after the checkpointed position. A checkpoint is considered stale, and the
+    projection is rebuilt from the beginning of the log, if it was written by a different checkpoint_version
+    of the projection, for a different projection key, or against a different event store file.
+
+    Subclasses should bump checkpoint_version whenever the projection state or its interpretation of
+    events changes, and must implement _checkpoint_key(), _checkpoint_state(), _restore_checkpoint_state()
+    and _reset_checkpoint_state().
+    """
+
+    checkpoint_version = 1
+
+    def __init__(self, checkpoint_path=None, **kwargs):
+        """Initialise checkpointing.
+
+        Args:
+            checkpoint_path: An optional path to a file in which the projection state will be
+                checkpointed. If None, the projection is not checkpointed.
+
+            **kwargs: Any additional arguments will be forwarded to the superclass.
+        """
+        self._checkpoint_path = checkpoint_path
+        # noinspection PyArgumentList
+        super().__init__(**kwargs)
+
+    @property
+    def checkpoint_path(self):
+        """The path to the checkpoint file, or None if this projection is not checkpointed."""
+        return self._checkpoint_path
+
+    def save_checkpoint(self, position=None):
+        """Persist the projection state.
+
+        Args:
+            position: The log position reflected by the projection state. If None, the current
+                end of the event store is used, which is correct only if the projection has been
+                kept up to date with every event in the store, as is the case when every event is
+                published in this process.
+        """
+        if self._checkpoint_path is None:
+            return
+        if position is None:
+            position = self._event_store.end_position()
+        checkpoint = dict(version=self.checkpoint_version,
+                          projection=self._checkpoint_projection_name(),
+                          key=self._checkpoint_key(),
+                          store=self._event_store.identity(),
+                          position=position,
+                          state=self._checkpoint_state())
+        temporary_path = self._checkpoint_path + '.tmp'
+        with open(temporary_path, 'wt') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, separators=(',', ':'), sort_keys=True, cls=ObjectJSONEncoder)
+        os.replace(temporary_path, self._checkpoint_path)
+
+    def _load_checkpoint(self):
+        """Restore the projection state from the checkpoint, if it is valid.
+
+        Returns:
+            The log position from which events must be replayed to bring the projection up to date,
+            which is zero if there is no valid checkpoint.
+        """
+        self._reset_checkpoint_state()
+        if self._checkpoint_path is None:
+            return 0
+        try:
+            with open(self._checkpoint_path, 'rt') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file, cls=ObjectJSONDecoder)
+        except (FileNotFoundError, ValueError):
+            return 0
+        if not self._checkpoint_is_current(checkpoint):
+            return 0
+        self._restore_checkpoint_state(checkpoint['state'])
+        return checkpoint['position']
+
+    def _checkpoint_is_current(self, checkpoint):
+        return (checkpoint.get('version') == self.checkpoint_version
+                and checkpoint.get('projection') == self._checkpoint_projection_name()
+                and checkpoint.get('key') == self._checkpoint_key()
+                and checkpoint.get('store') == self._event_store.identity()
+                and checkpoint.get('position', 0) <= self._event_store.end_position())
+
+    def _checkpoint_projection_name(self):
+        return type(self).__module__ + '#' + type(self).__qualname__
+
+    def _checkpoint_key(self):
+        """A JSON serializable value distinguishing instances of the same projection, such as a Board id."""
+        raise NotImplementedError
+
+    def _checkpoint_state(self):
+        """Obtain the projection state as a JSON serializable value."""
+        raise NotImplementedError
+
+    def _restore_checkpoint_state(self, state):
+        """Restore the projection state from the value returned by _checkpoint_state()."""
+        raise NotImplementedError
+
+    def _reset_checkpoint_state(self):
+        """Restore the projection to its initial, empty, state."""
+        raise NotImplementedError
@@ -0,0 +1,364 @@
+"""A queryable SQLite read model of boards, columns and work items.
+
+The read model follows the event log, applying each newly appended record to a set of indexed
+tables in the same transaction as it records its position in the log, so it can be reopened
+and brought up to date incrementally, or rebuilt from scratch at any time. Publication of
+domain events triggers an update, as does every query.
+
+    read_model = SQLiteReadModel(event_store, 'kanban.sqlite')
+    read_model.boards_with_name("Development")
+    read_model.work_items_due_between(latest=datetime.date.today())
+    read_model.close()
+"""
+
+import datetime
+import sqlite3
+import threading
+
+from singledispatch import singledispatch
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_store import SubscriptionError
+from kanban.domain.model.board import Board
+from kanban.domain.model.entity import Entity
+from kanban.domain.model.events import subscribe, unsubscribe
+from kanban.domain.model.workitem import WorkItem
+from utility.deferred import resolved
+
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS boards (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boards_by_name ON boards (name);
+CREATE TABLE IF NOT EXISTS columns (
+    id TEXT PRIMARY KEY,
+    board_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    wip_limit INTEGER
+);
+CREATE INDEX IF NOT EXISTS columns_by_board ON columns (board_id, position);
+CREATE TABLE IF NOT EXISTS column_work_items (
+    column_id TEXT NOT NULL,
+    board_id TEXT NOT NULL,
+    work_item_id TEXT NOT NULL,
+    priority INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS column_work_items_by_column ON column_work_items (column_id, priority);
+CREATE INDEX IF NOT EXISTS column_work_items_by_work_item ON column_work_items (work_item_id);
+CREATE TABLE IF NOT EXISTS work_items (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    due_date TEXT,
+    content TEXT
+);
+CREATE INDEX IF NOT EXISTS work_items_by_name ON work_items (name);
+CREATE INDEX IF NOT EXISTS work_items_by_due_date ON work_items (due_date);
+"""
+
+_TABLES = ('boards', 'columns', 'column_work_items', 'work_items')
+
+
+class SQLiteReadModel:
+    """A read model of the boards, columns and work items in an event store, held in SQLite."""
+
+    def __init__(self, event_store, database_path=':memory:', blob_store=None):
+        """Open, creating if necessary, a read model and bring it up to date.
+
+        Args:
+            event_store: The EventStore from which the read model is built.
+
+            database_path: The path of the SQLite database file. By default the database is
+                held in memory, and so is rebuilt each time the read model is opened.
+
+            blob_store: An optional BlobStore holding any work item content to which the
+                stored events refer.
+        """
+        self._event_store = event_store
+        self._blob_store = blob_store
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(database_path, check_same_thread=False)
+        self._connection.executescript(_SCHEMA)
+        self._subscription = None
+        if (self._metadata('schema_version') != SCHEMA_VERSION
+                or self._metadata('store') != self._event_store.identity()):
+            self.rebuild()
+        else:
+            self._subscribe(self._metadata('position'))
+            self.update()
+        subscribe(self._event_filter, self._handler)
+
+    def close(self):
+        """Stop keeping this read model up to date, and close the database."""
+        unsubscribe(self._event_filter, self._handler)
+        with self._lock:
+            self._subscription.close()
+            self._connection.close()
+
+    @property
+    def position(self):
+        """The position in the event log up to which events have been applied."""
+        return self._subscription.position
+
+    def rebuild(self):
+        """Discard the contents of the read model and rebuild it from the whole event log."""
+        with self._lock:
+            if self._subscription is not None:
+                self._subscription.close()
+            with self._connection:
+                for table in _TABLES:
+                    self._connection.execute("DELETE FROM {}".format(table))
+                self._set_metadata('schema_version', SCHEMA_VERSION)
+                self._set_metadata('store', self._event_store.identity())
+                self._set_metadata('position', 0)
+            self._subscribe(0)
+            self.update()
+
+    def update(self):
+        """Apply any events appended to the log since the last update.
+
+        If the event log has been replaced or truncated, the read model is rebuilt.
+        """
+        with self._lock:
+            try:
+                records = self._subscription.poll()
+            except SubscriptionError:
+                self.rebuild()
+                return
+            if not records:
+                return
+            with self._connection:
+                for _, stored_event in records:
+                    _when(self._deserialize(stored_event), self._connection)
+                self._set_metadata('position', self._subscription.position)
+                self._set_metadata('store', self._event_store.identity())
+
+    # ==================================================================================================================
+    # Queries
+    #
+
+    def boards_with_name(self, name):
+        """The ids of the boards with a given name."""
+        return self._column("SELECT id FROM boards WHERE name = ?", name)
+
+    def columns_of_board(self, board_id):
+        """The ids of the columns of a board, from left to right."""
+        return self._column("SELECT id FROM columns WHERE board_id = ? ORDER BY position", board_id)
+
+    def work_items_with_name(self, name):
+        """The ids of the work items with a given name."""
+        return self._column("SELECT id FROM work_items WHERE name = ?", name)
+
+    def work_items_due_between(self, earliest=None, latest=None):
+        """The ids of the work items with due dates in a range, in order of due date.
+
+        Args:
+            earliest: An optional datetime.date. If supplied, only work items due on or after this
+                date are included.
+
+            latest: An optional datetime.date. If supplied, only work items due on or before this
+                date are included.
+        """
+        return self._column("SELECT id FROM work_items WHERE due_date BETWEEN ? AND ? ORDER BY due_date, id",
+                            _date_text(earliest or datetime.date.min), _date_text(latest or datetime.date.max))
+
+    def work_items_in_column(self, column_id):
+        """The ids of the work items in a column, in priority order."""
+        return self._column("SELECT work_item_id FROM column_work_items WHERE column_id = ? ORDER BY priority",
+                            column_id)
+
+    def location_of_work_item(self, work_item_id):
+        """Locate a work item on a board.
+
+        Returns:
+            A (board_id, column_id, priority) tuple, or None if the work item is not on a board.
+        """
+        self.update()
+        with self._lock:
+            return self._connection.execute(
+                "SELECT board_id, column_id, priority FROM column_work_items WHERE work_item_id = ?",
+                (work_item_id,)).fetchone()
+
+    def work_item_counts(self, board_id):
+        """The number of work items in each column of a board.
+
+        Returns:
+            A list of (column_name, number_of_work_items) pairs, from left to right.
+        """
+        self.update()
+        with self._lock:
+            return self._connection.execute(
+                "SELECT columns.name, COUNT(column_work_items.work_item_id) FROM columns "
+                "LEFT JOIN column_work_items ON column_work_items.column_id = columns.id "
+                "WHERE columns.board_id = ? GROUP BY columns.id ORDER BY columns.position",
+                (board_id,)).fetchall()
+
+    def _column(self, sql, *parameters):
+        self.update()
+        with self._lock:
+            return [row[0] for row in self._connection.execute(sql, parameters)]
+
+    # ==================================================================================================================
+    # Maintenance
+    #
+
+    def _event_filter(self, event):
+        return isinstance(event, (Board.Created, Board.Discarded, Entity.AttributeChanged, Entity.AttributesChanged,
+                                  WorkItem.Created,
+                                  Board.NewColumnAdded, Board.NewColumnInserted, Board.ColumnRemoved,
+                                  Board.WorkItemScheduled, Board.WorkItemAbandoned, Board.WorkItemAdvanced,
+                                  Board.WorkItemRetired))
+
+    def _deserialize(self, stored_event):
+        event = deserialize_event(stored_event)
+        return event if self._blob_store is None else self._blob_store.bind(event)
+
+    def _handler(self, event):
+        # The event itself is applied from the log, once it has been stored
+        self.update()
+
+    def _subscribe(self, position):
+        self._subscription = self._event_store.subscribe(position)
+
+    def _metadata(self, key):
+        row = self._connection.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    def _set_metadata(self, key, value):
+        self._connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, value))
+
+
+def _date_text(date):
+    return None if date is None else date.isoformat()
+
+
+# ======================================================================================================================
+# Mutators - all read model updates are performed by the generic _when() function.
+#
+
+_ATTRIBUTE_COLUMNS = dict(
+    boards=dict(_name='name', _description='description'),
+    columns=dict(_name='name', _wip_limit='wip_limit'),
+    work_items=dict(_name='name', _due_date='due_date', _content='content'))
+
+
+@singledispatch
+def _when(event, connection):
+    _ = event
+    _ = connection
+
+
+@_when.register(Board.Created)
+def _(event, connection):
+    connection.execute("INSERT OR REPLACE INTO boards (id, name, description) VALUES (?, ?, ?)",
+                       (event.originator_id, event.name, event.description))
+
+
+@_when.register(Board.Discarded)
+def _(event, connection):
+    connection.execute("DELETE FROM column_work_items WHERE board_id = ?", (event.originator_id,))
+    connection.execute("DELETE FROM columns WHERE board_id = ?", (event.originator_id,))
+    connection.execute("DELETE FROM boards WHERE id = ?", (event.originator_id,))
+
+
+@_when.register(Entity.AttributeChanged)
+def _(event, connection):
+    # The originator may be a Board, a Column or a WorkItem
+    value = _date_text(event.value) if event.name == '_due_date' else resolved(event.value)
+    for table, columns in _ATTRIBUTE_COLUMNS.items():
+        if event.name in columns:
+            connection.execute("UPDATE {} SET {} = ? WHERE id = ?".format(table, columns[event.name]),
+                               (value, event.originator_id))
+
+
+@_when.register(Entity.AttributesChanged)
+def _(event, connection):
+    for attribute_changed in event.expand():
+        _when(attribute_changed, connection)
+
+
+@_when.register(WorkItem.Created)
+def _(event, connection):
+    connection.execute("INSERT OR REPLACE INTO work_items (id, name, due_date, content) VALUES (?, ?, ?, ?)",
+                       (event.originator_id, event.name, _date_text(event.due_date), resolved(event.content)))
+
+
+@_when.register(Board.NewColumnAdded)
+def _(event, connection):
+    connection.execute("INSERT INTO columns (id, board_id, position, name, wip_limit) "
+                       "SELECT ?, ?, COALESCE(MAX(position) + 1, 0), ?, ? FROM columns WHERE board_id = ?",
+                       (event.column_id, event.originator_id, event.column_name, event.wip_limit,
+                        event.originator_id))
+
+
+@_when.register(Board.NewColumnInserted)
+def _(event, connection):
+    position, = connection.execute("SELECT position FROM columns WHERE id = ?",
+                                   (event.succeeding_column_id,)).fetchone()
+    connection.execute("UPDATE columns SET position = position + 1 WHERE board_id = ? AND position >= ?",
+                       (event.originator_id, position))
+    connection.execute("INSERT INTO columns (id, board_id, position, name, wip_limit) VALUES (?, ?, ?, ?, ?)",
+                       (event.column_id, event.originator_id, position, event.column_name, event.wip_limit))
+
+
+@_when.register(Board.ColumnRemoved)
+def _(event, connection):
+    connection.execute("DELETE FROM column_work_items WHERE column_id = ?", (event.column_id,))
+    connection.execute("DELETE FROM columns WHERE id = ?", (event.column_id,))
+
+
+@_when.register(Board.WorkItemScheduled)
+def _(event, connection):
+    first_column_id, = connection.execute("SELECT id FROM columns WHERE board_id = ? ORDER BY position LIMIT 1",
+                                          (event.originator_id,)).fetchone()
+    _append_to_column(connection, event.originator_id, first_column_id, event.work_item_id)
+
+
+@_when.register(Board.WorkItemAbandoned)
+def _(event, connection):
+    _remove_from_column(connection, event.work_item_id)
+
+
+@_when.register(Board.WorkItemAdvanced)
+def _(event, connection):
+    source_column_id = _remove_from_column(connection, event.work_item_id)
+    source_position, = connection.execute("SELECT position FROM columns WHERE id = ?",
+                                          (source_column_id,)).fetchone()
+    destination_column_id, = connection.execute(
+        "SELECT id FROM columns WHERE board_id = ? AND position > ? ORDER BY position LIMIT 1",
+        (event.originator_id, source_position)).fetchone()
+    _append_to_column(connection, event.originator_id, destination_column_id, event.work_item_id)
+
+
+@_when.register(Board.WorkItemRetired)
+def _(event, connection):
+    _remove_from_column(connection, event.work_item_id)
+
+
+def _append_to_column(connection, board_id, column_id, work_item_id):
+    connection.execute("INSERT INTO column_work_items (column_id, board_id, work_item_id, priority) "
+                       "SELECT ?, ?, ?, COUNT(*) FROM column_work_items WHERE column_id = ?",
+                       (column_id, board_id, work_item_id, column_id))
+
+
+def _remove_from_column(connection, work_item_id):
+    """Remove a work item from its column, closing up the priorities of those after it.
+
+    Returns:
+        The id of the column from which the work item was removed.
+    """
+    column_id, priority = connection.execute(
+        "SELECT column_id, priority FROM column_work_items WHERE work_item_id = ?", (work_item_id,)).fetchone()
+    connection.execute("DELETE FROM column_work_items WHERE work_item_id = ?", (work_item_id,))
+    connection.execute("UPDATE column_work_items SET priority = priority - 1 WHERE column_id = ? AND priority > ?",
+                       (column_id, priority))
+    return column_id
@@ -0,0 +1,383 @@
+"""A full-text inverted index over the names and content of work items.
+
+The index follows the event log, tokenizing the name and content of each work item from its
+Created event, and retokenizing whichever of them changes in an AttributeChanged event. Each
+term maps to a posting list of the work items containing it, with term frequencies, and
+searches are ranked with BM25, weighting terms in names above those in content. The index can
+be saved in a compact binary file, from which it is reloaded and brought up to date
+incrementally, and can be rebuilt from the whole log at any time.
+
+    text_index = TextIndex(event_store, 'work_items.index')
+    text_index.search("export report", limit=10)
+    text_index.save()
+"""
+
+from collections import Counter
+import json
+import math
+import os
+import re
+import threading
+import zlib
+
+from singledispatch import singledispatch
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_store import SubscriptionError
+from kanban.domain.model.entity import Entity
+from kanban.domain.model.workitem import WorkItem
+from utility.deferred import resolved
+
+
+FORMAT_MAGIC = b'KTI1'
+
+# The weight of an occurrence of a term in a name, relative to one in content
+NAME_WEIGHT = 3
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lower case terms.
+
+    Args:
+        text: A string, or None.
+
+    Returns:
+        A list of terms, in order of occurrence.
+    """
+    if not text:
+        return []
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class TextIndexFormatError(Exception):
+    """Raised when an index file cannot be read."""
+    pass
+
+
+class TextIndex:
+    """An inverted index over the text of the work items in an event store."""
+
+    def __init__(self, event_store, index_path=None, blob_store=None):
+        """Open a text index, loading it from a file if possible, and bring it up to date.
+
+        Args:
+            event_store: The EventStore whose work items are indexed.
+
+            index_path: An optional path of a file in which the index is saved. If the file
+                exists, and was saved from the same event store, the index is loaded from it,
+                and only events appended since are applied. Otherwise the index is built from
+                the whole log.
+
+            blob_store: An optional BlobStore holding any work item content to which the
+                stored events refer.
+        """
+        self._event_store = event_store
+        self._blob_store = blob_store
+        self._index_path = index_path
+        self._lock = threading.RLock()
+        self._subscription = None
+        self._clear()
+        position = 0
+        if index_path is not None and os.path.exists(index_path):
+            try:
+                position = self._load(index_path)
+            except TextIndexFormatError:
+                self._clear()
+        self._subscribe(position)
+        self.update()
+
+    def close(self):
+        """Stop following the event log."""
+        with self._lock:
+            self._subscription.close()
+
+    @property
+    def position(self):
+        """The position in the event log up to which events have been indexed."""
+        return self._subscription.position
+
+    def rebuild(self):
+        """Discard the index and rebuild it from the whole event log."""
+        with self._lock:
+            self._clear()
+            self._subscribe(0)
+            self.update()
+
+    def update(self):
+        """Index any events appended to the log since the last update.
+
+        If the event log has been replaced or truncated, the index is rebuilt.
+        """
+        with self._lock:
+            try:
+                records = self._subscription.poll()
+            except SubscriptionError:
+                self.rebuild()
+                return
+            for _, stored_event in records:
+                _when(self._deserialize(stored_event), self)
+
+    def search(self, query, limit=None):
+        """Search for work items matching a query, best matches first.
+
+        Args:
+            query: A string of terms, any of which may match.
+
+            limit: An optional maximum number of results.
+
+        Returns:
+            A list of work item ids, ranked by relevance.
+        """
+        self.update()
+        with self._lock:
+            number_of_documents = len(self._lengths)
+            if number_of_documents == 0:
+                return []
+            average_length = (self._total_length / number_of_documents) or 1
+            scores = Counter()
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (number_of_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for work_item_id, frequency in postings.items():
+                    length = self._lengths[work_item_id]
+                    scores[work_item_id] += idf * frequency * (K1 + 1) / (
+                        frequency + K1 * (1 - B + B * length / average_length))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [work_item_id for work_item_id, _ in ranked[:limit]]
+
+    def terms(self, work_item_id):
+        """The terms indexed for a work item, with their weighted frequencies."""
+        self.update()
+        with self._lock:
+            return dict(self._weighted_terms(work_item_id))
+
+    # ==================================================================================================================
+    # Maintenance
+    #
+
+    def _deserialize(self, stored_event):
+        event = deserialize_event(stored_event)
+        return event if self._blob_store is None else self._blob_store.bind(event)
+
+    def _clear(self):
+        self._fields = {}        # work_item_id -> [name Counter, content Counter]
+        self._postings = {}      # term -> {work_item_id: weighted frequency}
+        self._lengths = {}       # work_item_id -> weighted number of terms
+        self._total_length = 0
+
+    def _subscribe(self, position):
+        if self._subscription is not None:
+            self._subscription.close()
+        self._subscription = self._event_store.subscribe(position)
+
+    def _weighted_terms(self, work_item_id):
+        name_terms, content_terms = self._fields[work_item_id]
+        weighted = Counter({term: NAME_WEIGHT * frequency for term, frequency in name_terms.items()})
+        weighted.update(content_terms)
+        return weighted
+
+    def _set_fields(self, work_item_id, name_terms=None, content_terms=None):
+        """Replace the terms of one or both fields of a work item, creating it if necessary."""
+        if work_item_id in self._fields:
+            self._remove_postings(work_item_id)
+            fields = self._fields[work_item_id]
+        else:
+            fields = self._fields[work_item_id] = [Counter(), Counter()]
+        if name_terms is not None:
+            fields[0] = name_terms
+        if content_terms is not None:
+            fields[1] = content_terms
+        weighted = self._weighted_terms(work_item_id)
+        for term, frequency in weighted.items():
+            self._postings.setdefault(term, {})[work_item_id] = frequency
+        length = sum(weighted.values())
+        self._lengths[work_item_id] = length
+        self._total_length += length
+
+    def _remove_postings(self, work_item_id):
+        for term in self._weighted_terms(work_item_id):
+            postings = self._postings[term]
+            del postings[work_item_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(work_item_id)
+
+    def _remove(self, work_item_id):
+        if work_item_id in self._fields:
+            self._remove_postings(work_item_id)
+            del self._fields[work_item_id]
+
+    # ==================================================================================================================
+    # Persistence
+    #
+    # The file consists of FORMAT_MAGIC followed by a zlib compressed body of:
+    #   a length-prefixed JSON header, with the log position and the identity of the store;
+    #   the number of work items, and each work item id, length-prefixed;
+    #   the number of terms, and for each term in sorted order its length-prefixed text, the
+    #   number of postings, and for each posting in work item order the difference from the
+    #   previous work item number, and the frequencies of the term in the name and content.
+    # All integers are unsigned LEB128 varints.
+    #
+
+    def save(self, index_path=None):
+        """Save the index, atomically replacing any previous file.
+
+        Args:
+            index_path: The path of the file, if not that supplied when the index was opened.
+        """
+        index_path = index_path or self._index_path
+        if index_path is None:
+            raise ValueError("No index path")
+        with self._lock:
+            body = bytearray()
+            header = json.dumps(dict(position=self._subscription.position,
+                                     store=self._event_store.identity())).encode('utf-8')
+            _write_bytes(body, header)
+            work_item_ids = sorted(self._fields)
+            numbers = {work_item_id: number for number, work_item_id in enumerate(work_item_ids)}
+            _write_varint(body, len(work_item_ids))
+            for work_item_id in work_item_ids:
+                _write_bytes(body, work_item_id.encode('utf-8'))
+            terms = sorted(self._postings)
+            _write_varint(body, len(terms))
+            for term in terms:
+                _write_bytes(body, term.encode('utf-8'))
+                postings = sorted(numbers[work_item_id] for work_item_id in self._postings[term])
+                _write_varint(body, len(postings))
+                previous = 0
+                for number in postings:
+                    name_terms, content_terms = self._fields[work_item_ids[number]]
+                    _write_varint(body, number - previous)
+                    _write_varint(body, name_terms[term])
+                    _write_varint(body, content_terms[term])
+                    previous = number
+        temporary_path = index_path + '.tmp'
+        with open(temporary_path, 'wb') as index_file:
+            index_file.write(FORMAT_MAGIC)
+            index_file.write(zlib.compress(bytes(body)))
+        os.replace(temporary_path, index_path)
+
+    def _load(self, index_path):
+        """Load the index from a file.
+
+        Returns:
+            The log position from which to continue indexing, which is 0 if the file was saved
+            from a different event store.
+
+        Raises:
+            TextIndexFormatError: If the file is not a valid index file.
+        """
+        with open(index_path, 'rb') as index_file:
+            data = index_file.read()
+        if not data.startswith(FORMAT_MAGIC):
+            raise TextIndexFormatError("{!r} is not a text index file".format(index_path))
+        try:
+            body = zlib.decompress(data[len(FORMAT_MAGIC):])
+            offset, header = _read_bytes(body, 0)
+            header = json.loads(header.decode('utf-8'))
+            if header['store'] != self._event_store.identity():
+                return 0
+            offset, number_of_work_items = _read_varint(body, offset)
+            work_item_ids = []
+            fields = []
+            for _ in range(number_of_work_items):
+                offset, work_item_id = _read_bytes(body, offset)
+                work_item_ids.append(work_item_id.decode('utf-8'))
+                fields.append((Counter(), Counter()))
+            offset, number_of_terms = _read_varint(body, offset)
+            for _ in range(number_of_terms):
+                offset, term = _read_bytes(body, offset)
+                term = term.decode('utf-8')
+                offset, number_of_postings = _read_varint(body, offset)
+                number = 0
+                for _ in range(number_of_postings):
+                    offset, delta = _read_varint(body, offset)
+                    offset, name_frequency = _read_varint(body, offset)
+                    offset, content_frequency = _read_varint(body, offset)
+                    number += delta
+                    name_terms, content_terms = fields[number]
+                    if name_frequency:
+                        name_terms[term] = name_frequency
+                    if content_frequency:
+                        content_terms[term] = content_frequency
+        except (zlib.error, ValueError, KeyError, IndexError) as e:
+            raise TextIndexFormatError("{!r} is corrupt".format(index_path)) from e
+        for work_item_id, (name_terms, content_terms) in zip(work_item_ids, fields):
+            self._set_fields(work_item_id, name_terms, content_terms)
+        return header['position']
+
+
+def _write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return offset, value
+        shift += 7
+
+
+def _write_bytes(buffer, value):
+    _write_varint(buffer, len(value))
+    buffer += value
+
+
+def _read_bytes(data, offset):
+    offset, length = _read_varint(data, offset)
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated index")
+    return end, data[offset:end]
+
+
+# ======================================================================================================================
+# Mutators - all index maintenance is dispatched by the generic _when() function.
+#
+
+@singledispatch
+def _when(event, index):
+    _ = event
+    _ = index
+
+
+@_when.register(WorkItem.Created)
+def _(event, index):
+    index._set_fields(event.originator_id, Counter(tokenize(event.name)), Counter(tokenize(resolved(event.content))))
+
+
+@_when.register(Entity.AttributeChanged)
+def _(event, index):
+    if event.originator_id not in index._fields:
+        return
+    if event.name == '_name':
+        index._set_fields(event.originator_id, name_terms=Counter(tokenize(event.value)))
+    elif event.name == '_content':
+        index._set_fields(event.originator_id, content_terms=Counter(tokenize(resolved(event.value))))
+
+
+@_when.register(Entity.AttributesChanged)
+def _(event, index):
+    for attribute_changed in event.expand():
+        _when(attribute_changed, index)
+
+
+@_when.register(Entity.Discarded)
+def _(event, index):
+    index._remove(event.originator_id)
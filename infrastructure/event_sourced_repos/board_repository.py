@@ -1,4 +1,6 @@
 from infrastructure.event_processing import EventPlayer, extant_entity_ids
+from infrastructure.event_sourced_projections.aggregate_index import shared_aggregate_index
+from infrastructure.event_sourced_projections.attribute_index import shared_attribute_index
 from kanban.domain.model import board
 
 
@@ -6,17 +8,46 @@ class BoardRepository(board.Repository, EventPlayer):
     """Concrete repository for Boards in terms of an event store.
     """
 
-    def __init__(self, event_store, **kwargs):
+    def __init__(self, event_store, attribute_index=None, as_of_version=None, as_of_timestamp=None,
+                 aggregate_index=None, work_item_id_storage='list', **kwargs):
         """Create a new BoardRepository.
 
         Args:
             event_store: An EventStore instance from which boards can be reconstituted.
 
+            attribute_index: An optional AttributeIndex used to narrow structured queries. By
+                default the index shared by all repositories for the event store is used.
+
+            as_of_version: If supplied, each Board is obtained as it was at this version, and
+                Boards which did not yet exist are not obtained.
+
+            as_of_timestamp: If supplied, Boards are obtained as they were at this time, in
+                seconds since the epoch.
+
+            aggregate_index: An optional AggregateIndex used to reconstitute historical Boards.
+                By default the index shared by all repositories for the event store is used.
+
+            work_item_id_storage: How the Columns of the Boards obtained store the ids of their
+                work items, as for kanban.domain.model.board.mutator(). Historical Boards
+                reconstituted from a snapshot of the aggregate index keep the storage of the
+                Board from which the snapshot was taken.
+
+        Raises:
+            ValueError: If work_item_id_storage is not recognised.
         """
+        self._attribute_index = attribute_index
+        self._as_of_version = as_of_version
+        self._as_of_timestamp = as_of_timestamp
+        self._aggregate_index = aggregate_index
         super().__init__(event_store=event_store,
-                         mutator=board.mutate,
+                         mutator=board.mutator(work_item_id_storage),
                          **kwargs)
 
+    @property
+    def historical(self):
+        """True if this repository obtains Boards as they were at some version or time."""
+        return self._as_of_version is not None or self._as_of_timestamp is not None
+
     def all_boards(self, board_ids=None):
         """Obtain all Boards.
 
@@ -27,10 +58,13 @@ class BoardRepository(board.Repository, EventPlayer):
         Returns:
             An iterable series of Boards.
         """
+        if self.historical:
+            return self._replay_as_of(board_ids)
         if board_ids is None:
             board_ids = extant_entity_ids(
                 event_store=self._event_store,
-                entity_class_name='Board')
+                entity_class_name='Board',
+                processes=self._processes)
         return self._replay_events(board_ids)
 
     def boards_where(self, predicate, board_ids=None):
@@ -40,6 +74,13 @@ class BoardRepository(board.Repository, EventPlayer):
         series of Boards to be tested against the predicate can be further
         constrained by an optional series of board_ids.
 
+        Structured queries (see kanban.domain.model.queries) on name, or on
+        the work items scheduled on a Board, are evaluated using the attribute
+        index, so that only matching Boards are reconstituted. Any remaining
+        predicates are evaluated against those Boards. The attribute index
+        reflects only the current state, so historical queries evaluate every
+        predicate against the historical Boards.
+
         Args:
             predicate: A unary callable against which candidate Boards will be
                 tested. Only those Boards for which the function returns True
@@ -52,9 +93,45 @@ class BoardRepository(board.Repository, EventPlayer):
         Returns:
             An iterable series of Boards.
         """
+        if self.historical:
+            return filter(predicate, self._replay_as_of(board_ids))
+
+        candidate_ids, residual = self._narrow(predicate)
+        if candidate_ids is not None:
+            if board_ids is not None:
+                candidate_ids.intersection_update(board_ids)
+            boards = self._replay_events(candidate_ids)
+            return boards if residual is None else filter(residual, boards)
+
         if board_ids is None:
             board_ids = extant_entity_ids(
                 event_store=self._event_store,
-                entity_class_name='Board')
+                entity_class_name='Board',
+                processes=self._processes)
         boards = self._replay_events(board_ids)
         return filter(predicate, boards)
+
+    def _narrow(self, predicate):
+        if self._attribute_index is None:
+            self._attribute_index = shared_attribute_index(self._event_store)
+        return self._attribute_index.narrow('Board', predicate)
+
+    def _replay_as_of(self, board_ids):
+        """Reconstitute Boards as they were at the version or time of this repository.
+
+        If no board_ids are supplied, the Boards which existed and had not been discarded at
+        that time are obtained.
+        """
+        extant_only = board_ids is None
+        if extant_only:
+            board_ids = self._index().entity_ids('Board', self._as_of_version, self._as_of_timestamp)
+        for board_id in board_ids:
+            board_as_of = self._index().reconstitute(board_id, self._mutator,
+                                                     self._as_of_version, self._as_of_timestamp)
+            if board_as_of is not None and not (extant_only and board_as_of.discarded):
+                yield board_as_of
+
+    def _index(self):
+        if self._aggregate_index is None:
+            self._aggregate_index = shared_aggregate_index(self._event_store)
+        return self._aggregate_index
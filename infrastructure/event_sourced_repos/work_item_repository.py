@@ -1,22 +1,52 @@
-from infrastructure.event_processing import EventPlayer, extant_entity_ids
-from kanban.domain.model import workitem
+from infrastructure.event_processing import EventPlayer, deserialize_event, extant_entity_ids
+from infrastructure.event_sourced_projections.aggregate_index import shared_aggregate_index
+from infrastructure.event_sourced_projections.attribute_index import shared_attribute_index
+from kanban.domain.model import board, workitem
+from kanban.domain.model.queries import AllOf, OnBoard, conjuncts
 
 
 class WorkItemRepository(workitem.Repository, EventPlayer):
     """Concrete repository for WorkItems in terms of an event store.
     """
 
-    def __init__(self, event_store, **kwargs):
+    def __init__(self, event_store, attribute_index=None, as_of_version=None, as_of_timestamp=None,
+                 aggregate_index=None, blob_store=None, **kwargs):
         """Create a new WorkItemRepository.
 
         Args:
             event_store: An EventStore instance from which work items can be reconstituted.
 
+            attribute_index: An optional AttributeIndex used to narrow structured queries. By
+                default the index shared by all repositories for the event store is used.
+
+            as_of_version: If supplied, each WorkItem is obtained as it was at this version, and
+                WorkItems which did not yet exist are not obtained.
+
+            as_of_timestamp: If supplied, WorkItems are obtained as they were at this time, in
+                seconds since the epoch.
+
+            aggregate_index: An optional AggregateIndex used to reconstitute historical
+                WorkItems. By default the index shared by all repositories for the event store
+                is used.
+
+            blob_store: An optional BlobStore holding any content to which the stored events
+                refer, as stored by a PersistenceSubscriber with the same BlobStore. Without it,
+                such content cannot be read.
         """
+        self._attribute_index = attribute_index
+        self._as_of_version = as_of_version
+        self._as_of_timestamp = as_of_timestamp
+        self._aggregate_index = aggregate_index
+        self._blob_store = blob_store
         super().__init__(event_store=event_store,
-                         mutator=workitem.mutate,
+                         mutator=workitem.mutate if blob_store is None else self._mutate_with_blobs,
                          **kwargs)
 
+    @property
+    def historical(self):
+        """True if this repository obtains WorkItems as they were at some version or time."""
+        return self._as_of_version is not None or self._as_of_timestamp is not None
+
     def all_work_items(self, work_item_ids=None):
         """Obtain all WorkItems.
 
@@ -27,11 +57,13 @@ class WorkItemRepository(workitem.Repository, EventPlayer):
         Returns:
             An iterable series of WorkItems.
         """
-
+        if self.historical:
+            return self._replay_as_of(work_item_ids)
         if work_item_ids is None:
             work_item_ids = extant_entity_ids(
                 event_store=self._event_store,
-                entity_class_name='WorkItem')
+                entity_class_name='WorkItem',
+                processes=self._processes)
         return self._replay_events(work_item_ids)
 
     def work_items_where(self, predicate, work_item_ids=None):
@@ -41,6 +73,14 @@ class WorkItemRepository(workitem.Repository, EventPlayer):
         series of WorkItems to be tested against the predicate can be further
         constrained by an optional series of work_item_ids.
 
+        Structured queries (see kanban.domain.model.queries) on name, due date
+        or board membership are evaluated using the attribute index, so that
+        only matching WorkItems are reconstituted. Any remaining predicates are
+        evaluated against those WorkItems. The attribute index reflects only
+        the current state, so historical queries evaluate every predicate
+        against the historical WorkItems, and board membership against the
+        historical Board.
+
         Args:
             predicate: A unary callable agaist which candidate WorkItems will be
                 tested. Only those WorkItems for which the function returns True
@@ -53,9 +93,89 @@ class WorkItemRepository(workitem.Repository, EventPlayer):
         Returns:
             An iterable series of WorkItems.
         """
+        if self.historical:
+            return self._work_items_where_as_of(predicate, work_item_ids)
+
+        candidate_ids, residual = self._narrow(predicate)
+        if candidate_ids is not None:
+            if work_item_ids is not None:
+                candidate_ids.intersection_update(work_item_ids)
+            work_items = self._replay_events(candidate_ids)
+            return work_items if residual is None else filter(residual, work_items)
+
         if work_item_ids is None:
             work_item_ids = extant_entity_ids(
                 event_store=self._event_store,
-                entity_class_name='WorkItem')
+                entity_class_name='WorkItem',
+                processes=self._processes)
         work_items = self._replay_events(work_item_ids)
         return filter(predicate, work_items)
+
+    def _narrow(self, predicate):
+        if self._attribute_index is None:
+            self._attribute_index = shared_attribute_index(self._event_store)
+        return self._attribute_index.narrow('WorkItem', predicate)
+
+    def work_item_history(self, work_item_id):
+        """Obtain the timeline of a work item.
+
+        The timeline merges the events of the WorkItem itself with the events of the Boards
+        on which it has been scheduled, advanced, retired or abandoned. It is read using the
+        aggregate index, in time proportional to the number of those events. The version or
+        time of a historical repository is not applied.
+
+        Args:
+            work_item_id: The id of a work item.
+
+        Returns:
+            A list of domain events in the order in which they were stored, which is empty if
+            no events concern the work item.
+        """
+        index = self._index()
+        stored_events = index.read(index.work_item_positions(work_item_id))
+        events = [deserialize_event(stored_event) for stored_event in stored_events]
+        if self._blob_store is not None:
+            events = [self._blob_store.bind(event) for event in events]
+        return events
+
+    def _work_items_where_as_of(self, predicate, work_item_ids):
+        residuals = []
+        for conjunct in conjuncts(predicate):
+            if isinstance(conjunct, OnBoard):
+                on_board_ids = self._work_item_ids_on_board_as_of(conjunct.board_id)
+                work_item_ids = on_board_ids if work_item_ids is None else on_board_ids.intersection(work_item_ids)
+            else:
+                residuals.append(conjunct)
+        work_items = self._replay_as_of(work_item_ids)
+        if not residuals:
+            return work_items
+        return filter(residuals[0] if len(residuals) == 1 else AllOf(*residuals), work_items)
+
+    def _work_item_ids_on_board_as_of(self, board_id):
+        board_as_of = self._index().reconstitute(board_id, board.mutate, self._as_of_version, self._as_of_timestamp)
+        if board_as_of is None or board_as_of.discarded:
+            return set()
+        return {work_item_id for column in board_as_of.columns() for work_item_id in column.work_item_ids()}
+
+    def _replay_as_of(self, work_item_ids):
+        """Reconstitute WorkItems as they were at the version or time of this repository.
+
+        If no work_item_ids are supplied, the WorkItems which existed and had not been
+        discarded at that time are obtained.
+        """
+        extant_only = work_item_ids is None
+        if extant_only:
+            work_item_ids = self._index().entity_ids('WorkItem', self._as_of_version, self._as_of_timestamp)
+        for work_item_id in work_item_ids:
+            work_item_as_of = self._index().reconstitute(work_item_id, self._mutator,
+                                                         self._as_of_version, self._as_of_timestamp)
+            if work_item_as_of is not None and not (extant_only and work_item_as_of.discarded):
+                yield work_item_as_of
+
+    def _mutate_with_blobs(self, work_item, event):
+        return workitem.mutate(work_item, self._blob_store.bind(event))
+
+    def _index(self):
+        if self._aggregate_index is None:
+            self._aggregate_index = shared_aggregate_index(self._event_store)
+        return self._aggregate_index
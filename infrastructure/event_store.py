@@ -1,9 +1,34 @@
 import json
-from infrastructure.transcoders import ObjectJSONEncoder, ObjectJSONDecoder
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from infrastructure.transcoders import EventEncoder, EventDecoder, decode_value, resolve_class
+from utility import instrumentation
+
+
+ANY_VERSION = object()
+
+# The topic of compacted events standing for a number of attribute changes
+ATTRIBUTES_CHANGED_TOPIC = 'kanban.domain.model.entity#Entity.AttributesChanged'
+
+
+class ConcurrencyError(Exception):
+    """Raised when an append conflicts with events already appended for the same originator."""
+    pass
 
 
 class EventStore:
     """A simple file-based event store which stores data in a JSON stream.
+
+    Appends are serialized between threads, and between processes by locking the store file,
+    so records from concurrent writers are never interleaved. Appends may specify the version each originator
+    is expected to have reached, in which case conflicting appends are rejected.
     """
 
     def __init__(self, store_path):
@@ -13,23 +38,174 @@ class EventStore:
             store_path: THe path to a new or existing event store.
         """
         self._store_path = store_path
+        self._versions = None
+        self._versions_position = 0
+        self._append_lock = threading.Lock()
+        self._encoder = EventEncoder()
 
-    def append(self, topic, **attributes):
+    def append(self, topic, *, _expected_version=ANY_VERSION, **attributes):
         """Append an event.
 
         Args:
             topic: A string representing the event type, or topic.
 
+            _expected_version: The version the originator of the event is expected to have
+                reached before this event, as for append_batch(). By default the version is
+                not checked. The leading underscore keeps it distinct from any event attribute.
+
             **attributes: Any attributes associated with the event.
                 Attributes must be JSON serializable.
+
+        Raises:
+            ConcurrencyError: If the originator is not at the expected version.
+        """
+        expected_versions = None
+        if _expected_version is not ANY_VERSION:
+            expected_versions = {attributes['originator_id']: _expected_version}
+        self.append_batch([(topic, attributes)], expected_versions)
+
+    def append_batch(self, records, expected_versions=None):
+        """Append a contiguous batch of events with a single write.
+
+        Versions are tracked for those originators which have a Created event. The version of
+        such an originator is the originator_version which its next event must carry: the
+        originator_version of its Created event, or one more than that of any subsequent event.
+
+        Args:
+            records: An iterable series of (topic, attributes) pairs, where topic is a string
+                representing the event type and attributes is a dictionary of JSON serializable
+                attributes associated with the event.
+
+            expected_versions: An optional mapping of originator_ids to the versions which
+                those originators are expected to have reached before the batch is appended.
+                An expected version of None indicates that the originator must not yet exist.
+                Expectations for originators whose versions are not tracked are ignored.
+
+        Raises:
+            ConcurrencyError: If any originator is not at its expected version, in which case
+                none of the records are appended.
+        """
+        records = list(records)
+        lines = [self._encoder.encode(topic, attributes) for topic, attributes in records]
+        self._append_lines(records, lines, expected_versions)
+
+    def append_events(self, events, expected_versions=None):
+        """Append a contiguous batch of event objects with a single write.
+
+        Each event is stored with a topic derived from its module and qualified class name,
+        and with its instance attributes.
+
+        Args:
+            events: An iterable series of event objects.
+
+            expected_versions: An optional mapping of originator_ids to expected versions,
+                as for append_batch().
+
+        Raises:
+            ConcurrencyError: If any originator is not at its expected version, in which case
+                none of the events are appended.
+        """
+        records = []
+        lines = []
+        for event in events:
+            records.append((self._encoder.event_topic(event), event.__dict__))
+            lines.append(self._encoder.encode_event(event))
+        self._append_lines(records, lines, expected_versions)
+
+    def _append_lines(self, records, lines, expected_versions):
+        if not lines:
+            return
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        if instrumentation.enabled:
+            start_time = time.perf_counter()
+            with self._append_lock:
+                self._append_locked(records, data, expected_versions)
+            # Attribute the time for the batch equally to the records in it
+            seconds_per_record = (time.perf_counter() - start_time) / len(records)
+            for topic, _ in records:
+                instrumentation.record('append', topic, seconds_per_record)
+        else:
+            with self._append_lock:
+                self._append_locked(records, data, expected_versions)
+
+    def _append_locked(self, records, data, expected_versions):
+        store_fd = os.open(self._store_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        try:
+            if fcntl is not None:
+                fcntl.flock(store_fd, fcntl.LOCK_EX)
+            if expected_versions is not None:
+                self._check_versions(expected_versions)
+            position = os.fstat(store_fd).st_size
+            written = 0
+            while written < len(data):
+                written += os.write(store_fd, data[written:])
+            if self._versions is not None and self._versions_position == position:
+                for topic, attributes in records:
+                    self._track_version(topic, attributes)
+                self._versions_position = position + len(data)
+        finally:
+            os.close(store_fd)  # Also releases the lock
+
+    def _check_versions(self, expected_versions):
+        """Bring the version table up to date with the store, then check the expected versions.
+
+        Must be called with the store locked.
         """
-        with open(self._store_path, 'a+t') as store_file:
-            event = dict(topic=topic,
-                         attributes=attributes)
-            json.dump(event, store_file, separators=(',',':'), sort_keys=True, cls=ObjectJSONEncoder)
-            store_file.write('\n')
+        if self._versions is None:
+            self._versions = {}
+            self._versions_position = 0
+        with open(self._store_path, 'rb') as store_file:
+            store_file.seek(self._versions_position)
+            for line in store_file:
+                stored_event = json.loads(line.decode('utf-8'))
+                self._track_version(stored_event['topic'], stored_event['attributes'])
+                self._versions_position += len(line)
+
+        for originator_id, expected_version in expected_versions.items():
+            if expected_version is None:
+                if originator_id in self._versions:
+                    raise ConcurrencyError("Originator {} already exists".format(originator_id))
+            elif originator_id in self._versions:
+                actual_version = self._versions[originator_id]
+                if actual_version != expected_version:
+                    raise ConcurrencyError("Originator {} is at version {}, not the expected "
+                                           "version {}".format(originator_id, actual_version, expected_version))
+
+    def _track_version(self, topic, attributes):
+        originator_id = attributes['originator_id']
+        if topic.endswith('.Created'):
+            self._versions[originator_id] = attributes['originator_version']
+        elif originator_id in self._versions:
+            changes = attributes['changes'] if topic == ATTRIBUTES_CHANGED_TOPIC else 1
+            self._versions[originator_id] = attributes['originator_version'] + changes
+
+    @property
+    def store_path(self):
+        """The path to the file backing this event store."""
+        return self._store_path
+
+    def identity(self):
+        """Identify the file backing this event store.
 
-    def open_event_stream(self, predicate=lambda event: True):
+        A store which is rewritten, for example by compaction, is replaced by a new file with a
+        new identity, so positions recorded against the old identity are meaningless.
+
+        Returns:
+            A string identifying the file, or None if the store does not yet exist.
+        """
+        try:
+            return _file_identity(os.stat(self._store_path))
+        except FileNotFoundError:
+            return None
+
+    def end_position(self):
+        """The byte offset of the end of the store, at which the next record will be appended."""
+        try:
+            return os.path.getsize(self._store_path)
+        except FileNotFoundError:
+            return 0
+
+    def open_event_stream(self, predicate=lambda event: True, start=0, end=None, lazy=False):
         """Open an event stream, optionally filtering for specific events.
 
         Args:
@@ -37,23 +213,67 @@ class EventStore:
                 accept a single argument which is a deserialized JSON object, that is, a dictionary
                 with string keys and arbitrary values.
 
+            start: An optional byte offset at which to begin reading. Must be at a record boundary.
+
+            end: An optional byte offset. Records beginning at or beyond this offset will not be
+                read. If None, the stream continues to the end of the store.
+
+            lazy: If True, the stream yields EventViews, which decode only those parts of each
+                record which are accessed, rather than dictionaries. The predicate will also be
+                passed EventViews.
+
         Returns:
             An EventStream which can be used as a context manager.
             Iteration over the EventStream yields deserialised events (dictionaries).
         """
-        return EventStream(self._store_path, predicate)
+        return EventStream(self._store_path, predicate, start, end, lazy)
+
+    def subscribe(self, position=0, predicate=lambda event: True, poll_interval=0.1, lazy=False):
+        """Subscribe to the events in this store, from a given position onwards.
+
+        The subscription first reads forward from position to the end of the store, and then
+        continues to follow records as they are appended, possibly by other processes.
+
+        Args:
+            position: The byte offset, at a record boundary, from which to begin reading.
+
+            predicate: An optional predicate function for filtering events, as for open_event_stream().
+
+            poll_interval: The time in seconds to wait between checks for newly appended
+                records when following the store.
+
+            lazy: If True, the subscription delivers EventViews rather than dictionaries, as
+                for open_event_stream().
+
+        Returns:
+            A Subscription, which can be used as a context manager.
+        """
+        return Subscription(self._store_path, position, predicate, poll_interval, lazy)
+
+
+def _file_identity(status):
+    return '{}:{}'.format(status.st_dev, status.st_ino)
 
 
 class EventStream:
-    """A stream of events."""
+    """A stream of events.
+
+    Attributes:
+        position: The byte offset immediately following the most recently read record,
+            which is where reading would resume.
+    """
 
-    def __init__(self, store_path, predicate):
+    def __init__(self, store_path, predicate, start=0, end=None, lazy=False):
         self._store_path = store_path
         self._predicate = predicate
         self._store_file = None
+        self._end = end
+        self._decode = EventView.from_bytes if lazy else EventDecoder().decode
+        self.position = start
 
     def __enter__(self):
-        self._store_file = open(self._store_path, 'rt')
+        self._store_file = open(self._store_path, 'rb')
+        self._store_file.seek(self.position)
         return self
 
     def __exit__(self, *exc_info):
@@ -64,9 +284,222 @@ class EventStream:
 
     def __next__(self):
         while True:
+            if self._end is not None and self.position >= self._end:
+                raise StopIteration
             line = next(self._store_file)
-            event = json.loads(line, cls=ObjectJSONDecoder)
+            self.position += len(line)
+            if instrumentation.enabled:
+                start_time = time.perf_counter()
+                event = self._decode(line)
+                instrumentation.record('decode', event['topic'], time.perf_counter() - start_time)
+            else:
+                event = self._decode(line)
             if self._predicate(event):
                 return event
 
 
+class EventView:
+    """A lightweight view of a stored event record, which decodes attributes on first access.
+
+    Most consumers of an event stream look at only one or two attributes of each event. The
+    topic and originator_id are usually extracted directly from the record text, and other
+    attributes are decoded individually when first accessed. For compatibility with stored event
+    dictionaries, views can also be indexed by 'topic' and 'attributes', although obtaining all
+    of the attributes requires the whole record to be decoded.
+    """
+
+    __slots__ = ('_record', '_topic', '_originator_id', '_raw_attributes', '_decoded_attributes')
+
+    def __init__(self, record):
+        """Create a view of a JSON record.
+
+        Args:
+            record: A JSON record string, as written by an EventStore.
+        """
+        self._record = record
+        self._topic = None
+        self._originator_id = None
+        self._raw_attributes = None
+        self._decoded_attributes = {}
+
+    @classmethod
+    def from_bytes(cls, line):
+        return cls(line.decode('utf-8'))
+
+    def __repr__(self):
+        return "EventView({!r})".format(self._record.rstrip('\n'))
+
+    def __getitem__(self, key):
+        if key == 'topic':
+            return self.topic
+        if key == 'attributes':
+            return self.attributes
+        raise KeyError(key)
+
+    def __getstate__(self):
+        return self._record
+
+    def __setstate__(self, record):
+        self.__init__(record)
+
+    @property
+    def topic(self):
+        """The event topic."""
+        if self._topic is None:
+            # Keys are sorted, so the top-level topic is the final key in the record
+            self._topic = self._extract_string('"topic":"', self._record.rfind('"topic":"'))
+            if self._topic is None:
+                self._topic = json.loads(self._record)['topic']
+        return self._topic
+
+    @property
+    def originator_id(self):
+        """The id of the entity which originated the event."""
+        if self._originator_id is None:
+            start = self._record.find('"originator_id":"')
+            # A second occurrence could only be a key within a nested object
+            if start >= 0 and self._record.find('"originator_id":"', start + 1) < 0:
+                self._originator_id = self._extract_string('"originator_id":"', start)
+            if self._originator_id is None:
+                self._originator_id = self.attribute('originator_id')
+        return self._originator_id
+
+    def _extract_string(self, key, start):
+        if start < 0:
+            return None
+        start += len(key)
+        end = self._record.find('"', start)
+        if end < 0:
+            return None
+        value = self._record[start:end]
+        return None if '\\' in value else value
+
+    def attribute(self, name):
+        """Obtain a single decoded attribute.
+
+        Raises:
+            KeyError: If the event has no such attribute.
+        """
+        try:
+            return self._decoded_attributes[name]
+        except KeyError:
+            if self._raw_attributes is None:
+                self._raw_attributes = json.loads(self._record)['attributes']
+            value = self._decoded_attributes[name] = decode_value(self._raw_attributes[name])
+            return value
+
+    @property
+    def attributes(self):
+        """A dictionary of all the decoded attributes."""
+        if self._raw_attributes is None:
+            self._raw_attributes = json.loads(self._record)['attributes']
+        return {name: self.attribute(name) for name in self._raw_attributes}
+
+    def to_event(self):
+        """Obtain the full event object represented by this view."""
+        module_name, _, class_name = self.topic.partition('#')
+        cls = resolve_class(module_name, class_name)
+        return cls(**self.attributes)
+
+
+class SubscriptionError(Exception):
+    """Raised when a subscription can no longer follow its event store."""
+    pass
+
+
+class Subscription:
+    """A catch-up subscription which follows an event store as records are appended.
+
+    Records are delivered in log order as (position, event) pairs, where position is the byte
+    offset immediately following the record. A consumer which has processed a record can
+    checkpoint its position and later resume a new subscription from it.
+
+    Polling is cheap: the store file is only read if its size or modification time has changed,
+    and then only the newly appended bytes are read.
+    """
+
+    def __init__(self, store_path, position, predicate, poll_interval, lazy=False):
+        self._store_path = store_path
+        self._predicate = predicate
+        self._poll_interval = poll_interval
+        self._position = position
+        self._partial_record = b''
+        self._store_file = None
+        self._identity = None
+        self._last_status = None
+        self._closed = False
+        self._decode = EventView.from_bytes if lazy else EventDecoder().decode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def position(self):
+        """The byte offset immediately following the last delivered (or filtered out) record."""
+        return self._position
+
+    def poll(self):
+        """Read any records appended since the last poll, without blocking.
+
+        Returns:
+            A list of (position, event) pairs, in log order, which may be empty.
+
+        Raises:
+            SubscriptionError: If the store has been truncated or replaced by another file.
+        """
+        if self._closed:
+            return []
+        try:
+            status = os.stat(self._store_path)
+        except FileNotFoundError:
+            return []
+        if self._last_status == (status.st_size, status.st_mtime_ns):
+            return []
+        identity = _file_identity(status)
+        if self._store_file is None:
+            self._store_file = open(self._store_path, 'rb')
+            self._identity = identity
+        elif identity != self._identity:
+            raise SubscriptionError("Event store {!r} has been replaced".format(self._store_path))
+        read_position = self._position + len(self._partial_record)
+        if status.st_size < read_position:
+            raise SubscriptionError("Event store {!r} has been truncated to {} bytes, "
+                                    "before position {}".format(self._store_path, status.st_size, read_position))
+        self._last_status = (status.st_size, status.st_mtime_ns)
+        self._store_file.seek(read_position)
+        data = self._partial_record + self._store_file.read(status.st_size - read_position)
+        complete_length = data.rfind(b'\n') + 1
+        self._partial_record = data[complete_length:]
+
+        records = []
+        position = self._position
+        for line in data[:complete_length].splitlines(keepends=True):
+            position += len(line)
+            event = self._decode(line)
+            if self._predicate(event):
+                records.append((position, event))
+        self._position = position
+        return records
+
+    def __iter__(self):
+        """Follow the store, blocking until records are available, until closed.
+
+        Yields:
+            (position, event) pairs in log order.
+        """
+        while not self._closed:
+            records = self.poll()
+            if not records:
+                time.sleep(self._poll_interval)
+            for record in records:
+                yield record
+
+    def close(self):
+        """Stop following the store."""
+        self._closed = True
+        if self._store_file is not None:
+            self._store_file.close()
+            self._store_file = None
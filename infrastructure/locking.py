@@ -0,0 +1,39 @@
+from contextlib import ExitStack, contextmanager
+import threading
+
+
+class StripedLock:
+    """A fixed set of re-entrant locks shared between keys by hashing, known as lock striping.
+
+    Commands against the same aggregate are serialized by holding the lock for its id,
+    while commands against different aggregates usually proceed in parallel. The memory
+    required is fixed, regardless of the number of aggregates.
+    """
+
+    def __init__(self, stripes=64):
+        """Create a StripedLock.
+
+        Args:
+            stripes: The number of underlying locks.
+        """
+        if stripes < 1:
+            raise ValueError("stripes {!r} is not positive".format(stripes))
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def _stripe(self, key):
+        return hash(key) % len(self._locks)
+
+    @contextmanager
+    def locked(self, *keys):
+        """Hold the locks for one or more keys for the duration of a block.
+
+        Locks are always acquired in the same order, so that concurrent blocks locking
+        overlapping sets of keys cannot deadlock.
+
+        Args:
+            *keys: The hashable keys, such as aggregate ids, to be locked.
+        """
+        with ExitStack() as stack:
+            for stripe in sorted({self._stripe(key) for key in keys}):
+                stack.enter_context(self._locks[stripe])
+            yield
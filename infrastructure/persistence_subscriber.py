@@ -1,10 +1,29 @@
+from kanban.domain.model.entity import Entity
 from kanban.domain.model.events import DomainEvent, subscribe, unsubscribe
+from kanban.domain.model.workitem import WorkItem
 
 
 class PersistenceSubscriber:
 
-    def __init__(self, event_store):
+    def __init__(self, event_store, check_versions=False, blob_store=None, blob_threshold=4096):
+        """Store all published domain events in an event store.
+
+        Args:
+            event_store: The EventStore in which to store events.
+
+            check_versions: If True, each event is appended only if its originator has not
+                been modified in the store since the originator was loaded, otherwise
+                ConcurrencyError is raised from the publishing call.
+
+            blob_store: An optional BlobStore. If supplied, WorkItem content of at least
+                blob_threshold bytes is stored there, and the stored events refer to it.
+
+            blob_threshold: The size in bytes of the smallest content stored as a blob.
+        """
         self._event_store = event_store
+        self._check_versions = check_versions
+        self._blob_store = blob_store
+        self._blob_threshold = blob_threshold
         subscribe(PersistenceSubscriber._all_events, self.store_event)
         self._event_store = event_store
 
@@ -13,9 +32,44 @@ class PersistenceSubscriber:
         return topic.__module__ + '#' + topic.__class__.__qualname__
 
     def store_event(self, event):
-        topic = self.qualified_name(event)
-        attributes = event.__dict__
-        self._event_store.append(topic=topic, **attributes)
+        expected_versions = None
+        if self._check_versions:
+            expected_versions = {event.originator_id: self._expected_version(event)}
+        self._event_store.append_events([self._externalized(event)], expected_versions)
+
+    def store_events(self, events):
+        """Store a series of events as a single contiguous batch."""
+        events = [event for event in events if self._all_events(event)]
+        expected_versions = None
+        if self._check_versions:
+            expected_versions = {}
+            for event in events:
+                expected_versions.setdefault(event.originator_id, self._expected_version(event))
+        self._event_store.append_events([self._externalized(event) for event in events], expected_versions)
+
+    def _externalized(self, event):
+        """The event to be stored, with any large work item content replaced by a blob reference."""
+        if self._blob_store is None:
+            return event
+        if isinstance(event, WorkItem.Created):
+            name = 'content'
+        elif isinstance(event, Entity.AttributeChanged) and event.name == '_content':
+            name = 'value'
+        else:
+            return event
+        content = getattr(event, name)
+        if not isinstance(content, str) or len(content) < self._blob_threshold / 4:
+            return event
+        data = content.encode('utf-8')
+        if len(data) < self._blob_threshold:
+            return event
+        attributes = dict(event.__dict__)
+        attributes[name] = self._blob_store.reference(content)
+        return type(event)(**attributes)
+
+    @staticmethod
+    def _expected_version(event):
+        return None if isinstance(event, Entity.Created) else event.originator_version
 
     @staticmethod
     def _all_events(event):
@@ -1,6 +1,10 @@
 import datetime
+import functools
 import importlib
+import inspect
 import json
+from json.encoder import encode_basestring_ascii
+import uuid
 from singledispatch import singledispatch
 from utility.utilities import resolve_attr
 
@@ -8,12 +12,8 @@ from utility.utilities import resolve_attr
 class ObjectJSONEncoder(json.JSONEncoder):
 
     def default(self, obj):
-        try:
-            return super().default(obj)
-        except TypeError as e:
-            if "not JSON serializable" not in str(e):
-                raise
-            return to_jsonable(obj)
+        # JSONEncoder.default() unconditionally raises TypeError, so go straight to the fallback
+        return to_jsonable(obj)
 
 
 @singledispatch
@@ -35,6 +35,95 @@ def _(obj):
     return { 'ISO8601_datetime': obj.isoformat() }
 
 
+@to_jsonable.register(uuid.UUID)
+def _(obj):
+    return { '__uuid__': obj.hex }
+
+
+class EventEncoder:
+    """A fast encoder for event records.
+
+    Produces exactly the same JSON as encoding dict(topic=topic, attributes=attributes) using
+    ObjectJSONEncoder with compact separators and sorted keys, but without the generic machinery
+    of the json module. A serializer is compiled once for each event class and set of attribute
+    names, holding the pre-encoded topic and attribute keys in sorted order. Attribute values are
+    encoded by functions selected by their exact type, with fast paths for strings, numbers,
+    dates, datetimes and UUIDs. Any other values are encoded by ObjectJSONEncoder.
+    """
+
+    def __init__(self):
+        self._topics = {}
+        self._serializers = {}
+
+    def event_topic(self, event):
+        """The topic of an event: its module and qualified class name."""
+        event_class = type(event)
+        try:
+            return self._topics[event_class]
+        except KeyError:
+            topic = self._topics[event_class] = event_class.__module__ + '#' + event_class.__qualname__
+            return topic
+
+    def encode_event(self, event):
+        """Encode an event object as a JSON record, without a trailing newline."""
+        return self.encode(self.event_topic(event), event.__dict__)
+
+    def encode(self, topic, attributes):
+        """Encode a topic and a dictionary of attributes as a JSON record, without a trailing newline."""
+        key = (topic, tuple(attributes))
+        try:
+            prefix, keys, suffix = self._serializers[key]
+        except KeyError:
+            prefix, keys, suffix = self._serializers[key] = self._compile(topic, attributes)
+        buffer = [prefix]
+        append = buffer.append
+        for name, encoded_name in keys:
+            value = attributes[name]
+            append(encoded_name)
+            append(_value_encoders.get(type(value), _encode_default)(value))
+        append(suffix)
+        return ''.join(buffer)
+
+    @staticmethod
+    def _compile(topic, attributes):
+        names = sorted(attributes)
+        keys = tuple((name, (',' if index else '') + encode_basestring_ascii(name) + ':')
+                     for index, name in enumerate(names))
+        return '{"attributes":{', keys, '},"topic":' + encode_basestring_ascii(topic) + '}'
+
+
+def _encode_float(value):
+    if value != value:
+        return 'NaN'
+    if value == float('inf'):
+        return 'Infinity'
+    if value == -float('inf'):
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+def _encode_sequence(value):
+    return '[' + ','.join(_value_encoders.get(type(item), _encode_default)(item) for item in value) + ']'
+
+
+def _encode_default(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True, cls=ObjectJSONEncoder)
+
+
+_value_encoders = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    list: _encode_sequence,
+    tuple: _encode_sequence,
+    datetime.date: lambda value: '{"ISO8601_date":"' + value.isoformat() + '"}',
+    datetime.datetime: lambda value: '{"ISO8601_datetime":"' + value.isoformat() + '"}',
+    uuid.UUID: lambda value: '{"__uuid__":"' + value.hex + '"}',
+}
+
+
 class ObjectJSONDecoder(json.JSONDecoder):
 
     def __init__(self):
@@ -48,28 +137,108 @@ class ObjectJSONDecoder(json.JSONDecoder):
             return ObjectJSONDecoder._decode_date(d)
         elif 'ISO8601_datetime' in d:
             return ObjectJSONDecoder._decode_datetime(d)
+        elif '__uuid__' in d and len(d) == 1:
+            return uuid.UUID(d['__uuid__'])
         return d
 
     @staticmethod
     def _decode_class(d):
         class_name = d.pop('__class__')
         module_name = d.pop('__module__')
-        module = importlib.import_module(module_name)
-        cls = resolve_attr(module, class_name)
-        try:
-            obj = cls(**d)
-        except Exception:
-            obj = cls()
-            obj.__dict__.update(d)
+        cls = resolve_class(module_name, class_name)
+        if _accepts_attributes(cls, d):
+            return cls(**d)
+        obj = cls.__new__(cls)
+        obj.__dict__.update(d)
         return obj
 
     @staticmethod
     def _decode_date(d):
-        return datetime.datetime.strptime(d['ISO8601_date'], '%Y-%m-%d').date()
+        return datetime.date.fromisoformat(d['ISO8601_date'])
 
     @staticmethod
     def _decode_datetime(d):
-        return datetime.datetime.strptime(d['ISO8601_date'], '%Y-%m-%dT%H:%M:%S.%f%Z')
-
-
-
+        return datetime.datetime.fromisoformat(d['ISO8601_datetime'])
+
+
+def _accepts_attributes(cls, attributes):
+    """Determine whether the constructor of a class accepts a dictionary of attributes as keyword arguments.
+
+    Errors raised within the constructor are not taken to mean that it does not accept the
+    attributes, so that they are not masked.
+    """
+    signature = _constructor_signature(cls)
+    if signature is None:
+        return True
+    try:
+        signature.bind(**attributes)
+    except TypeError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _constructor_signature(cls):
+    """The signature of the constructor of a class, or None if it cannot be determined."""
+    try:
+        return inspect.signature(cls)
+    except (TypeError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_class(module_name, class_name):
+    """Obtain a class from its module name and qualified class name, caching the result."""
+    module = importlib.import_module(module_name)
+    return resolve_attr(module, class_name)
+
+
+class EventDecoder:
+    """A fast decoder for event records.
+
+    Records are parsed without an object_hook, so the bulk of each record is decoded entirely
+    by the json module's C scanner. Records containing no JSON objects other than the record
+    itself and its attributes, which is most of them, need no conversion at all. Otherwise only
+    attribute values which are JSON objects or arrays can require conversion, so only those are
+    inspected and converted, bottom-up, exactly as ObjectJSONDecoder would convert them.
+    """
+
+    def decode(self, line):
+        """Decode a JSON record into a stored event dictionary.
+
+        Args:
+            line: A JSON record, as a str or as UTF-8 encoded bytes.
+
+        Returns:
+            A dictionary with 'topic' and 'attributes' keys.
+        """
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        stored_event = json.loads(line)
+        if line.count('{') == 2:
+            # No nested objects, so nothing to convert
+            return stored_event
+        attributes = stored_event['attributes']
+        for name, value in attributes.items():
+            value_type = type(value)
+            if value_type is dict or value_type is list:
+                attributes[name] = decode_value(value)
+        return stored_event
+
+
+def decode_value(value):
+    """Convert a value parsed without an object_hook, in place, as ObjectJSONDecoder would have decoded it."""
+    value_type = type(value)
+    if value_type is list:
+        for index, item in enumerate(value):
+            item_type = type(item)
+            if item_type is dict or item_type is list:
+                value[index] = decode_value(item)
+        return value
+    if value_type is not dict:
+        return value
+    for name, item in value.items():
+        item_type = type(item)
+        if item_type is dict or item_type is list:
+            value[name] = decode_value(item)
+    return ObjectJSONDecoder.from_jsonable(value)
@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+
+from kanban.domain.model.events import deferred_publication, publication_deferred, publish, deliver
+
+
+@contextmanager
+def unit_of_work(persistence_subscriber):
+    """Persist all events published within a block atomically, as a single batch.
+
+    Events published within the block are collected rather than delivered. When the block
+    completes normally the events are appended to the event store as one contiguous batch
+    with a single write, and only then are they delivered to the remaining subscribers.
+    If the block raises an exception the collected events are discarded, and any aggregates
+    modified within the block no longer reflect the store, so should be reloaded.
+
+    Units of work may be nested, in which case the events of the inner unit are persisted
+    by the outermost unit.
+
+        with unit_of_work(persistence_subscriber):
+            board = start_project("Project", "A new project")
+            board.add_new_column("To do", 10)
+            board.add_new_column("Doing", 3)
+            board.add_new_column("Done", None)
+
+    Args:
+        persistence_subscriber: The PersistenceSubscriber which would otherwise store each
+            event as it is published.
+
+    Yields:
+        The list into which published events are collected.
+    """
+    with deferred_publication() as events:
+        yield events
+
+    if publication_deferred():
+        for event in events:
+            publish(event)
+        return
+
+    persistence_subscriber.store_events(events)
+    for event in events:
+        deliver(event, excluded_subscribers={persistence_subscriber.store_event})
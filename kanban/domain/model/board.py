@@ -4,11 +4,13 @@ import uuid
 
 from singledispatch import singledispatch
 
+from utility.id_sequences import CompactIdList, InternedIdList
 from utility.itertools import exactly_one
 
 from kanban.domain.exceptions import ConstraintError
 from kanban.domain.model.events import DomainEvent, publish
 from kanban.domain.model.entity import Entity, DiscardedEntityError
+from kanban.domain.model.queries import Equals
 
 
 # ======================================================================================================================
@@ -19,6 +21,8 @@ class Board(Entity):
     """A Kanban board which can track the progress of work items through a step-wise process.
     """
 
+    __slots__ = ('_name', '_description', '_columns', '_work_item_id_sequence')
+
     class Created(Entity.Created):
         pass
 
@@ -56,6 +60,8 @@ class Board(Entity):
         self._name = event.name
         self._description = event.description
         self._columns = []
+        # The type of sequence in which each Column stores the ids of its work items
+        self._work_item_id_sequence = list
 
     def __repr__(self):
         return "{d}Board(id={b._id}, name={b._name!r}, description={b._description!r}, columns=[0..{n}])".format(
@@ -422,6 +428,8 @@ class Board(Entity):
 
 class Column(Entity):
 
+    __slots__ = ('_board', '_name', '_wip_limit', '_work_item_ids')
+
     def __init__(self, event, board):
         "DO NOT CALL DIRECTLY"
         super().__init__(event.column_id, event.column_version)
@@ -429,7 +437,7 @@ class Column(Entity):
         self._board = board
         self._name = event.column_name
         self._wip_limit = event.wip_limit
-        self._work_item_ids = []
+        self._work_item_ids = board._work_item_id_sequence()
 
     def __repr__(self):
         return ("{d}Column(id={c._id}, board_id={c._board.id!r} name={c._name!r}, "
@@ -532,6 +540,47 @@ class Column(Entity):
         mutate(self, event)
 
 
+# ======================================================================================================================
+# Work item id storage - how columns hold the ids of their work items
+#
+
+_work_item_id_sequences = dict(list=list, interned=InternedIdList, compact=CompactIdList)
+
+
+def mutator(work_item_id_storage='list'):
+    """Obtain a mutator which creates Boards whose Columns store work item ids in a given way.
+
+    The storage is a property of each Board, fixed when the Board is created from its Created
+    event, so Boards with different storage may coexist. Boards created by start_project(), or
+    by mutate(), store ids in lists.
+
+    Args:
+        work_item_id_storage: 'list' to store ids in a list, as decoded (the default);
+            'interned' to intern each id, so that it shares storage with other interned copies
+            of the same id; or 'compact' to pack hexadecimal ids into 16 bytes each, trading
+            memory for the cost of converting ids back to strings when they are retrieved.
+
+    Returns:
+        A function which applies an event to a Board, or to None for a Created event, as for
+        mutate().
+
+    Raises:
+        ValueError: If work_item_id_storage is not one of the above.
+    """
+    try:
+        work_item_id_sequence = _work_item_id_sequences[work_item_id_storage]
+    except KeyError:
+        raise ValueError("Unknown work item id storage {!r}".format(work_item_id_storage))
+
+    def mutate_with_storage(obj, event):
+        board = _when(event, obj)
+        if obj is None:
+            board._work_item_id_sequence = work_item_id_sequence
+        return board
+
+    return mutate_with_storage
+
+
 # ======================================================================================================================
 # Factories - the aggregate root factory
 #
@@ -571,6 +620,16 @@ def _(event, entity):
     entity._increment_version()
     return entity
 
+
+@_when.register(Entity.AttributesChanged)
+def _(event, entity):
+    entity._validate_event_originator(event)
+    for name, value in event.values.items():
+        setattr(entity, name, value)
+    entity._version += event.changes
+    return entity
+
+
 @_when.register(Board.Created)
 def _(event, unused=None):
     """Create a new aggregate root"""
@@ -684,7 +743,7 @@ class Repository(metaclass=ABCMeta):
 
     def boards_with_name(self, name, board_ids=None):
         try:
-            return self.boards_where(lambda board: board.name == name, board_ids)
+            return self.boards_where(Equals('name', name), board_ids)
         except ValueError as e:
             raise ValueError("No Board with name {}".format(name)) from e
 
@@ -705,7 +764,8 @@ class Repository(metaclass=ABCMeta):
         Args:
             predicate: A unary callable against which candidate Boards will be
                 tested. Only those Boards for which the function returns True
-                will be in the result collection.
+                will be in the result collection. Structured queries from
+                kanban.domain.model.queries may be narrowed by an index.
 
             board_ids: An optional iterable series of Board ids. If
                 not None, only those Boards whose ids are in this series will
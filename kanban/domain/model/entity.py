@@ -24,6 +24,33 @@ class Entity:
     class AttributeChanged(DomainEvent):
         pass
 
+    class AttributesChanged(DomainEvent):
+        """Records the net effect of a run of AttributeChanged events, as written by log compaction.
+
+        The values attribute maps attribute names to their final values, and the changes
+        attribute gives the number of AttributeChanged events, and so of versions, replaced.
+        """
+
+        def expand(self):
+            """Obtain an AttributeChanged event for each of the values.
+
+            This allows consumers which only handle AttributeChanged events to apply this event.
+            The events carry successive originator versions from that of this event, but since
+            several changes to one attribute are expanded to a single event, they may account for
+            fewer versions than changes.
+
+            Returns:
+                A list of AttributeChanged events.
+            """
+            return [Entity.AttributeChanged(originator_id=self.originator_id,
+                                            originator_version=self.originator_version + offset,
+                                            timestamp=self.timestamp,
+                                            name=name,
+                                            value=value)
+                    for offset, (name, value) in enumerate(self.values.items())]
+
+    __slots__ = ('_id', '_version', '_discarded')
+
     def __init__(self, id, version):
         self._id = id
         self._version = version
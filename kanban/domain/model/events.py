@@ -1,4 +1,8 @@
+from contextlib import contextmanager
 import itertools
+import threading
+import time
+from utility import instrumentation
 from utility.time import utc_now
 
 _now = object()
@@ -37,7 +41,12 @@ class DomainEvent:
             "{0}={1!r}".format(*item) for item in self.__dict__.items()) + ')'
 
 
+# The registry is copied on write and replaced as a whole, so that publishing, which reads
+# whichever registry is current, is safe while other threads (or subscribers) modify it.
 _event_handlers = {}
+_event_handlers_lock = threading.Lock()
+
+_thread_state = threading.local()
 
 
 def subscribe(event_predicate, subscriber):
@@ -47,9 +56,11 @@ def subscribe(event_predicate, subscriber):
         event_predicate: A callable predicate which is used to identify the events to which to subscribe.
         subscriber: A unary callable function which handles the passed event.
     """
-    if event_predicate not in _event_handlers:
-        _event_handlers[event_predicate] = set()
-    _event_handlers[event_predicate].add(subscriber)
+    global _event_handlers
+    with _event_handlers_lock:
+        event_handlers = dict(_event_handlers)
+        event_handlers[event_predicate] = event_handlers.get(event_predicate, frozenset()) | {subscriber}
+        _event_handlers = event_handlers
 
 
 def unsubscribe(event_predicate, subscriber):
@@ -59,24 +70,100 @@ def unsubscribe(event_predicate, subscriber):
         event_predicate: The callable predicate which was used to identify the events to which to subscribe.
         subscriber: The subscriber to disconnect.
     """
-    if event_predicate in _event_handlers:
-        _event_handlers[event_predicate].discard(subscriber)
+    global _event_handlers
+    with _event_handlers_lock:
+        if event_predicate in _event_handlers:
+            event_handlers = dict(_event_handlers)
+            event_handlers[event_predicate] = event_handlers[event_predicate] - {subscriber}
+            _event_handlers = event_handlers
+
+
+def _deferred_events():
+    """The stack of lists collecting deferred events for the current thread."""
+    try:
+        return _thread_state.deferred_events
+    except AttributeError:
+        _thread_state.deferred_events = []
+        return _thread_state.deferred_events
 
 
 def publish(event):
     """Send an event to all subscribers.
 
     Each subscriber will receive each event only once, even if it has been subscribed multiple
-    times, possibly with different predicates.
+    times, possibly with different predicates. If publication is currently deferred, the event
+    is instead collected by the innermost deferred_publication() block in the current thread.
+
+    Args:
+        event: The object to be tested against by all registered predicate functions and sent to
+            all matching subscribers.
+    """
+    deferred_events = _deferred_events()
+    if deferred_events:
+        deferred_events[-1].append(event)
+    else:
+        deliver(event)
+
+
+def deliver(event, excluded_subscribers=()):
+    """Send an event to all subscribers immediately, even if publication is deferred.
 
     Args:
         event: The object to be tested against by all registered predicate functions and sent to
             all matching subscribers.
+        excluded_subscribers: An optional collection of subscribers which will not receive the event.
     """
     matching_handlers = set()
     for event_predicate, handlers in _event_handlers.items():
         if event_predicate(event):
             matching_handlers.update(handlers)
 
-    for handler in matching_handlers:
+    matching_handlers.difference_update(excluded_subscribers)
+    if instrumentation.enabled:
+        _deliver_timed(event, matching_handlers)
+    else:
+        for handler in matching_handlers:
+            handler(event)
+
+
+def _deliver_timed(event, handlers):
+    """Send an event to handlers, recording the time taken by each, and by the whole fan-out."""
+    topic = instrumentation.event_topic(event)
+    fan_out_start_time = time.perf_counter()
+    for handler in handlers:
+        start_time = time.perf_counter()
         handler(event)
+        instrumentation.record('subscriber ' + _subscriber_name(handler), topic, time.perf_counter() - start_time)
+    instrumentation.record('publish', topic, time.perf_counter() - fan_out_start_time)
+
+
+def _subscriber_name(handler):
+    owner = getattr(handler, '__self__', None)
+    if owner is not None:
+        return type(owner).__qualname__ + '.' + handler.__name__
+    return getattr(handler, '__qualname__', repr(handler))
+
+
+@contextmanager
+def deferred_publication():
+    """Defer the publication of events within a block.
+
+    Events published by the current thread within the block are collected, in order, rather
+    than being sent to subscribers. It is the responsibility of the caller to deliver the
+    collected events, or to discard them.
+
+    Yields:
+        The list into which published events are collected.
+    """
+    events = []
+    deferred_events = _deferred_events()
+    deferred_events.append(events)
+    try:
+        yield events
+    finally:
+        deferred_events.pop()
+
+
+def publication_deferred():
+    """Determine whether publication is currently deferred in the current thread."""
+    return bool(_deferred_events())
@@ -26,6 +26,7 @@ class LeadTimeProjection(metaclass=ABCMeta):
         super().__init__(**kwargs)
         self._work_item_start_times = {}
         self._lead_times = {}
+        self._retirement_times = {}
 
         self._load_events()
         subscribe(self._event_filter, self._handler)
@@ -45,6 +46,10 @@ class LeadTimeProjection(metaclass=ABCMeta):
         """A dynamic view onto collection of lead times."""
         return self._lead_times.values()
 
+    def retirement_times(self):
+        """A dynamic view onto the collection of times, in seconds since the epoch, at which work items were retired."""
+        return self._retirement_times.values()
+
     def close(self):
         """No longer keep this projection up-to-date."""
         unsubscribe(self._event_filter, self._handler)
@@ -96,6 +101,7 @@ def _(event, projection):
                                "with id {}".format(event.work_item_id))
     lead_time = event.timestamp - projection._work_item_start_times[event.work_item_id]
     projection._lead_times[event.work_item_id] = lead_time
+    projection._retirement_times[event.work_item_id] = event.timestamp
     del projection._work_item_start_times[event.work_item_id]
     return projection
 
@@ -0,0 +1,159 @@
+"""Structured queries over entities.
+
+A structured query describes the entities it selects in terms which a repository can
+understand, so that a repository with suitable indexes can narrow the candidate entities before
+reconstituting any of them. Every query is also a unary predicate, so it can be passed wherever
+a predicate is accepted, and evaluated directly against entities.
+
+    from kanban.domain.model.queries import AllOf, Equals, InRange
+
+    work_item_repo.work_items_where(AllOf(Equals('name', "Fix bug"),
+                                          InRange('due_date', upper=datetime.date.today()),
+                                          lambda work_item: 'urgent' in work_item.content))
+
+Plain callables combined with structured queries in an AllOf are evaluated against those
+entities which satisfy the structured queries.
+"""
+
+
+# ======================================================================================================================
+# Queries
+#
+
+class Query:
+    """The base class of all structured queries."""
+
+    def __call__(self, entity):
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __eq__(self, rhs):
+        if type(self) is not type(rhs):
+            return NotImplemented
+        return self.__dict__ == rhs.__dict__
+
+    def __ne__(self, rhs):
+        return not (self == rhs)
+
+    def __hash__(self):
+        return hash((type(self),) + tuple(sorted(self.__dict__.items(), key=lambda item: item[0])))
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__,
+                               ", ".join("{}={!r}".format(*item) for item in self.__dict__.items()))
+
+
+class Equals(Query):
+    """Selects entities with an attribute equal to a value."""
+
+    def __init__(self, attribute, value):
+        """
+        Args:
+            attribute: The name of a public attribute, such as 'name'.
+
+            value: The required value.
+        """
+        self.attribute = attribute
+        self.value = value
+
+    def __call__(self, entity):
+        return getattr(entity, self.attribute) == self.value
+
+
+class OneOf(Query):
+    """Selects entities with an attribute equal to any one of a set of values."""
+
+    def __init__(self, attribute, values):
+        """
+        Args:
+            attribute: The name of a public attribute, such as 'name'.
+
+            values: An iterable series of acceptable values.
+        """
+        self.attribute = attribute
+        self.values = frozenset(values)
+
+    def __call__(self, entity):
+        return getattr(entity, self.attribute) in self.values
+
+
+class InRange(Query):
+    """Selects entities with an attribute within an inclusive range.
+
+    Entities for which the attribute is None are never selected.
+    """
+
+    def __init__(self, attribute, lower=None, upper=None):
+        """
+        Args:
+            attribute: The name of a public attribute, such as 'due_date'.
+
+            lower: An optional lower bound. If None the range is unbounded below.
+
+            upper: An optional upper bound. If None the range is unbounded above.
+        """
+        self.attribute = attribute
+        self.lower = lower
+        self.upper = upper
+
+    def __call__(self, entity):
+        value = getattr(entity, self.attribute)
+        return (value is not None
+                and (self.lower is None or self.lower <= value)
+                and (self.upper is None or value <= self.upper))
+
+
+class OnBoard(Query):
+    """Selects work items currently scheduled on a Board.
+
+    Membership is recorded by the Board rather than by the WorkItem, so this query can only be
+    evaluated by a repository which indexes board membership.
+    """
+
+    def __init__(self, board_id):
+        self.board_id = board_id
+
+    def __call__(self, work_item):
+        raise TypeError("{!r} cannot be evaluated against a WorkItem alone".format(self))
+
+
+class HasWorkItem(Query):
+    """Selects Boards on which a work item is currently scheduled."""
+
+    def __init__(self, work_item_id):
+        self.work_item_id = work_item_id
+
+    def __call__(self, board):
+        return any(self.work_item_id in column.work_item_ids() for column in board.columns())
+
+
+class AllOf:
+    """Selects entities which satisfy all of a number of structured queries and predicates."""
+
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def __call__(self, entity):
+        return all(predicate(entity) for predicate in self.predicates)
+
+    def __and__(self, other):
+        return AllOf(*self.predicates, other)
+
+    def __repr__(self):
+        return "AllOf({})".format(", ".join(map(repr, self.predicates)))
+
+
+def conjuncts(predicate):
+    """Flatten a predicate into the series of predicates which must all be satisfied.
+
+    Args:
+        predicate: A structured query, an AllOf, or any other unary callable.
+
+    Returns:
+        A list of predicates, none of which is an AllOf.
+    """
+    if isinstance(predicate, AllOf):
+        return [conjunct for inner in predicate.predicates for conjunct in conjuncts(inner)]
+    return [predicate]
@@ -4,10 +4,12 @@ import uuid
 
 from singledispatch import singledispatch
 
+from utility.deferred import Deferred
 from utility.itertools import exactly_one
 
 from kanban.domain.model.events import publish
 from kanban.domain.model.entity import Entity
+from kanban.domain.model.queries import Equals
 
 
 # ======================================================================================================================
@@ -19,6 +21,8 @@ class WorkItem(Entity):
     class Created(Entity.Created):
         pass
 
+    __slots__ = ('_name', '_due_date', '_content')
+
     def __init__(self, event):
         """DO NOT CALL DIRECTLY.
         """
@@ -81,7 +85,10 @@ class WorkItem(Entity):
 
     @property
     def content(self):
+        """The content, which is fetched when first read if it is stored separately."""
         self._check_not_discarded()
+        if isinstance(self._content, Deferred):
+            self._content = self._content.resolve()
         return self._content
 
     @content.setter
@@ -139,6 +146,15 @@ def _(event, entity):
     return entity
 
 
+@_when.register(Entity.AttributesChanged)
+def _(event, entity):
+    entity._validate_event_originator(event)
+    for name, value in event.values.items():
+        setattr(entity, name, value)
+    entity._version += event.changes
+    return entity
+
+
 @_when.register(WorkItem.Created)
 def _(event, unused=None):
     assert unused is None
@@ -156,8 +172,7 @@ class Repository(metaclass=ABCMeta):
         return self.work_items_where(lambda work_item: True, work_item_ids)
 
     def work_items_with_name(self, name, work_item_ids=None):
-        return self.work_items_where(lambda work_item: work_item.name == name,
-                                     work_item_ids)
+        return self.work_items_where(Equals('name', name), work_item_ids)
 
     def work_item_with_id(self, work_item_id):
         try:
@@ -176,7 +191,8 @@ class Repository(metaclass=ABCMeta):
         Args:
             predicate: A unary callable against which candidate WorkItems will
                 be tested. Only those WorkItems for which the function returns
-                True will be in the result collection.
+                True will be in the result collection. Structured queries from
+                kanban.domain.model.queries may be narrowed by an index.
 
             work_item_ids: An optional iterable series of WorkItem ids. If
                 not None, only those WorkItems whose ids are in this series will
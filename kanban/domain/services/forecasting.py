@@ -0,0 +1,250 @@
+"""Domain services for forecasting when work will be completed.
+
+Forecasts are made by Monte Carlo simulation of a Board's historical daily throughput: each trial
+repeatedly samples, with replacement, the number of work items retired on a past day, until
+the remaining work items have been completed. The distribution of the number of days taken over
+many trials gives the likely completion dates.
+
+When numpy is available, trials are simulated in batches as array computations. Otherwise the
+exact distribution of the number of days is computed, by carrying the distribution of the number
+of work items completed forward a day at a time, and the trials are sampled from it, so that the
+cost depends on the number of days and of remaining work items rather than on the number of
+trials. The two produce different samples for the same seed, but each is reproducible.
+"""
+
+from bisect import bisect_left
+from collections import Counter
+import datetime
+from itertools import repeat
+import math
+from operator import add, mul
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from utility.time import utc_now
+
+
+DEFAULT_PERCENTILES = (50, 85, 95)
+
+# The largest number of daily samples simulated at once by numpy, which bounds memory use
+_MAX_BATCH_SAMPLES = 1 << 22
+
+
+class Forecast:
+    """The forecast completion of a number of work items."""
+
+    def __init__(self, remaining_items, trials, start_date, percentile_days):
+        """
+        Args:
+            remaining_items: The number of work items to be completed.
+
+            trials: The number of trials simulated.
+
+            start_date: The date from which days are counted.
+
+            percentile_days: A mapping from percentiles to the number of days within which
+                that percentage of trials completed the work items.
+        """
+        self._remaining_items = remaining_items
+        self._trials = trials
+        self._start_date = start_date
+        self._percentile_days = dict(percentile_days)
+
+    def __repr__(self):
+        return "{}(remaining_items={!r}, trials={!r}, start_date={!r}, percentile_days={!r})".format(
+            type(self).__name__, self._remaining_items, self._trials, self._start_date, self._percentile_days)
+
+    def __eq__(self, rhs):
+        if not isinstance(rhs, Forecast):
+            return NotImplemented
+        return ((self._remaining_items, self._trials, self._start_date, self._percentile_days) ==
+                (rhs._remaining_items, rhs._trials, rhs._start_date, rhs._percentile_days))
+
+    def __ne__(self, rhs):
+        return not (self == rhs)
+
+    @property
+    def remaining_items(self):
+        return self._remaining_items
+
+    @property
+    def trials(self):
+        return self._trials
+
+    @property
+    def start_date(self):
+        return self._start_date
+
+    @property
+    def percentile_days(self):
+        """A mapping from percentiles to numbers of days."""
+        return dict(self._percentile_days)
+
+    @property
+    def completion_dates(self):
+        """A mapping from percentiles to the dates by which the work items will have been completed."""
+        return {percentile: self._start_date + datetime.timedelta(days=days)
+                for percentile, days in self._percentile_days.items()}
+
+
+def daily_throughput(lead_time_projection, start_date=None, end_date=None):
+    """Obtain the number of work items retired on each day.
+
+    Args:
+        lead_time_projection: A LeadTimeProjection for a Board.
+
+        start_date: An optional date, in UTC, of the first day. By default, the day on which
+            the first work item was retired.
+
+        end_date: An optional date, in UTC, of the last day. By default, today.
+
+    Returns:
+        A list of the number of work items retired on each day from start_date to end_date
+        inclusive, including days on which none were retired. The list is empty if no work
+        items have been retired.
+    """
+    retirement_dates = [_utc_date(timestamp) for timestamp in lead_time_projection.retirement_times()]
+    if not retirement_dates:
+        return []
+    if start_date is None:
+        start_date = min(retirement_dates)
+    if end_date is None:
+        end_date = _utc_date(utc_now())
+    throughput = [0] * max(0, (end_date - start_date).days + 1)
+    for retirement_date in retirement_dates:
+        day = (retirement_date - start_date).days
+        if 0 <= day < len(throughput):
+            throughput[day] += 1
+    return throughput
+
+
+def forecast_completion(throughput, remaining_items, trials=10000, percentiles=DEFAULT_PERCENTILES,
+                        start_date=None, seed=None):
+    """Forecast when a number of work items will be completed.
+
+    Args:
+        throughput: A sequence of the numbers of work items completed on each of a series of
+            past days, as returned by daily_throughput().
+
+        remaining_items: The number of work items to be completed.
+
+        trials: The number of trials to simulate.
+
+        percentiles: The percentiles of the distribution of completion days to report.
+
+        start_date: The date from which days are counted, so that work completed on the first
+            simulated day completes on the following date. By default, today in UTC.
+
+        seed: An optional seed, making the forecast reproducible.
+
+    Returns:
+        A Forecast.
+
+    Raises:
+        ValueError: If there are no trials, or if the throughput contains no completed work.
+    """
+    if trials < 1:
+        raise ValueError("At least one trial is required")
+    if not any(throughput):
+        raise ValueError("Cannot forecast without any historical throughput")
+    if start_date is None:
+        start_date = _utc_date(utc_now())
+    if remaining_items <= 0:
+        days = [0] * trials
+    elif numpy is not None:
+        days = _simulate_numpy(throughput, remaining_items, trials, seed)
+    else:
+        days = _simulate_python(throughput, remaining_items, trials, seed)
+    days = sorted(days)
+    percentile_days = {percentile: int(days[max(0, math.ceil(percentile / 100 * trials) - 1)])
+                       for percentile in percentiles}
+    return Forecast(remaining_items, trials, start_date, percentile_days)
+
+
+def forecast_board_completions(lead_time_projections, remaining_items, trials=10000,
+                               percentiles=DEFAULT_PERCENTILES, start_date=None, seed=None):
+    """Forecast the completion of work on many Boards.
+
+    Args:
+        lead_time_projections: An iterable series of LeadTimeProjections, one for each Board.
+
+        remaining_items: A mapping from Board ids to the number of work items to be completed
+            on each Board.
+
+        trials, percentiles, start_date: As for forecast_completion().
+
+        seed: An optional seed, from which a seed for each Board is derived, in order.
+
+    Returns:
+        A dictionary mapping Board ids to Forecasts. Boards without any historical throughput
+        are omitted.
+    """
+    seeds = random.Random(seed)
+    forecasts = {}
+    for projection in lead_time_projections:
+        board_seed = seeds.getrandbits(64)
+        throughput = daily_throughput(projection)
+        if not any(throughput):
+            continue
+        forecasts[projection.board_id] = forecast_completion(throughput, remaining_items[projection.board_id],
+                                                             trials, percentiles, start_date, board_seed)
+    return forecasts
+
+
+def _simulate_numpy(throughput, remaining_items, trials, seed):
+    """The number of days taken by each trial, simulating batches of trials as arrays."""
+    generator = numpy.random.default_rng(seed)
+    samples = numpy.asarray(throughput, dtype=numpy.int32)
+    # Enough days for most trials to complete in one step, with the stragglers simulated further
+    horizon = max(1, math.ceil(1.25 * remaining_items / samples.mean()))
+    batch_size = max(1, min(trials, _MAX_BATCH_SAMPLES // horizon))
+    days = numpy.empty(trials, dtype=numpy.int64)
+    for batch_start in range(0, trials, batch_size):
+        pending = numpy.arange(batch_start, min(trials, batch_start + batch_size))
+        completed = numpy.zeros(len(pending), dtype=numpy.int32)
+        elapsed_days = 0
+        while len(pending):
+            draws = samples[generator.integers(0, len(samples), size=(len(pending), horizon), dtype=numpy.int32)]
+            cumulative = numpy.cumsum(draws, axis=1, dtype=numpy.int32)
+            cumulative += completed[:, numpy.newaxis]
+            finished = cumulative[:, -1] >= remaining_items
+            days[pending[finished]] = elapsed_days + 1 + (cumulative[finished] < remaining_items).sum(axis=1)
+            completed = cumulative[~finished, -1]
+            pending = pending[~finished]
+            elapsed_days += horizon
+    return days
+
+
+def _simulate_python(throughput, remaining_items, trials, seed):
+    """The number of days taken by each trial, sampled from the exact distribution of the number of days."""
+    generator = random.Random(seed)
+    # Each trial is sampled by inversion: it takes the fewest days by which the probability of
+    # not having completed the work items is at most a uniformly distributed threshold in (0, 1].
+    # Probabilities and thresholds are negated, so that they ascend as the days pass.
+    negated_thresholds = [generator.random() - 1.0 for _ in range(trials)]
+    largest_negated_threshold = max(negated_thresholds)
+    probabilities = [(amount, frequency / len(throughput))
+                     for amount, frequency in Counter(throughput).items() if amount < remaining_items]
+    largest_amount = max((amount for amount, _ in probabilities), default=0)
+    # The probability of having completed each number of work items fewer than remaining_items,
+    # of which only the first reachable are held
+    incomplete = [1.0]
+    negated_not_completed = []
+    while not negated_not_completed or negated_not_completed[-1] < largest_negated_threshold:
+        reachable = min(remaining_items, len(incomplete) + largest_amount)
+        following = [0.0] * reachable
+        for amount, probability in probabilities:
+            end = min(reachable, amount + len(incomplete))
+            following[amount:end] = map(add, following[amount:end],
+                                        map(mul, incomplete[:end - amount], repeat(probability)))
+        incomplete = following
+        negated_not_completed.append(-sum(incomplete))
+    return [bisect_left(negated_not_completed, negated_threshold) + 1 for negated_threshold in negated_thresholds]
+
+
+def _utc_date(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).date()
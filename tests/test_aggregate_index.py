@@ -0,0 +1,217 @@
+"""Tests of the aggregate index, against plain replays of the event log."""
+
+import copy
+import os
+import tempfile
+import unittest
+
+from infrastructure.compaction import compact
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_sourced_projections.aggregate_index import AggregateIndex
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model import board
+from kanban.domain.model.board import start_project
+from kanban.domain.model.workitem import register_new_work_item
+
+
+def replay(event_store, originator_id, as_of_version=None, as_of_timestamp=None):
+    """Reconstitute a Board by applying its events from the start of the log."""
+    state = None
+    with event_store.open_event_stream() as stored_events:
+        for stored_event in stored_events:
+            event = deserialize_event(stored_event)
+            if event.originator_id != originator_id:
+                continue
+            if as_of_timestamp is not None and event.timestamp > as_of_timestamp:
+                break
+            previous_state = copy.deepcopy(state)
+            state = board.mutate(state, event)
+            if as_of_version is not None and state._version > as_of_version:
+                return previous_state
+    return state
+
+
+def record_positions(event_store):
+    """The position of each record in the log, with the record."""
+    position = 0
+    with event_store.open_event_stream() as stored_events, open(event_store.store_path, 'rb') as store_file:
+        for stored_event, line in zip(stored_events, store_file):
+            yield position, stored_event
+            position += len(line)
+
+
+def board_state(board_or_none):
+    if board_or_none is None:
+        return None
+    if board_or_none.discarded:
+        return 'discarded', board_or_none._version
+    return (board_or_none.id, board_or_none.version, board_or_none.name, board_or_none.description,
+            [(column.id, column.name, column.wip_limit, list(column.work_item_ids()))
+             for column in board_or_none.columns()])
+
+
+class AggregateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.to_do = self.board.add_new_column("To do", None)
+            self.doing = self.board.add_new_column("Doing", 2)
+            self.other_board = start_project("Other", "Another board")
+            self.work_items = [register_new_work_item("Work item {}".format(index)) for index in range(4)]
+        with unit_of_work(self.persistence_subscriber):
+            for work_item in self.work_items:
+                self.board.schedule_work_item(work_item)
+            self.board.name = "Renamed"
+            self.board.description = "Described"
+            self.board.name = "Renamed again"
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[0])
+            self.done = self.board.add_new_column("Done", None)
+            self.other_board.discard()
+        self.index = self.open_index(self.event_store)
+
+    def open_index(self, event_store, **kwargs):
+        index = AggregateIndex(event_store, **kwargs)
+        self.addCleanup(index.close)
+        return index
+
+    def modify(self):
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[0])
+            review = self.board.insert_new_column_before(self.done, "Review", 1)
+            self.board.advance_work_item(self.work_items[1])
+            self.board.retire_work_item(self.work_items[0])
+            self.board.abandon_work_item(self.work_items[2])
+            self.board.remove_column(review)
+            self.doing.wip_limit = 3
+
+    def assertMatchesReplay(self, index, event_store):
+        board_ids = {self.board._id, self.other_board._id}
+        self.assertEqual(index.entity_ids('Board'), board_ids)
+        self.assertEqual(index.entity_ids('WorkItem'), {work_item._id for work_item in self.work_items})
+        self.assertEqual(index.position, event_store.end_position())
+        records = list(record_positions(event_store))
+        for board_id in board_ids:
+            current = replay(event_store, board_id)
+            self.assertEqual(index.version(board_id), current._version)
+            board_records = [(position, record) for position, record in records
+                             if record['attributes']['originator_id'] == board_id]
+            self.assertEqual(index.positions(board_id), [position for position, _ in board_records])
+            for version in range(-1, current._version + 2):
+                with self.subTest(board_id=board_id, version=version):
+                    expected = replay(event_store, board_id, as_of_version=version)
+                    self.assertEqual(board_state(index.reconstitute(board_id, board.mutate, as_of_version=version)),
+                                     board_state(expected))
+                    self.assertEqual(index.positions(board_id, as_of_version=version)
+                                     + index.positions(board_id, after_version=version),
+                                     index.positions(board_id))
+            for _, record in board_records:
+                timestamp = record['attributes']['timestamp']
+                with self.subTest(board_id=board_id, timestamp=timestamp):
+                    self.assertEqual(
+                        board_state(index.reconstitute(board_id, board.mutate, as_of_timestamp=timestamp)),
+                        board_state(replay(event_store, board_id, as_of_timestamp=timestamp)))
+        self.assertIsNone(index.version('absent'))
+        self.assertEqual(index.positions('absent'), [])
+        self.assertIsNone(index.reconstitute('absent', board.mutate))
+
+    def test_follows_the_log(self):
+        self.assertMatchesReplay(self.index, self.event_store)
+        self.modify()
+        self.assertMatchesReplay(self.index, self.event_store)
+
+    def test_snapshots_do_not_change_reconstituted_states(self):
+        index = self.open_index(self.event_store, snapshot_interval=2, max_snapshots=3)
+        self.modify()
+        # The second pass starts from the snapshots retained by the first
+        self.assertMatchesReplay(index, self.event_store)
+        self.assertMatchesReplay(index, self.event_store)
+        self.assertLessEqual(len(index._snapshots), 3)
+
+    def test_versions_within_collapsed_attribute_changes(self):
+        compacted_path = os.path.join(self.directory, 'compacted.events')
+        counts = compact(self.event_store.store_path, compacted_path, os.path.join(self.directory, 'archive.events'),
+                         collapse_attribute_changes=True)
+        self.assertGreater(counts['collapsed'], 0)
+        compacted_store = EventStore(compacted_path)
+        index = self.open_index(compacted_store)
+        version = replay(compacted_store, self.board._id)._version
+        self.assertEqual(index.version(self.board._id), version)
+        for as_of_version in range(version + 1):
+            with self.subTest(version=as_of_version):
+                self.assertEqual(
+                    board_state(index.reconstitute(self.board._id, board.mutate, as_of_version=as_of_version)),
+                    board_state(replay(compacted_store, self.board._id, as_of_version=as_of_version)))
+
+    def test_historical_repositories_match_replay(self):
+        self.modify()
+        for version in range(self.board.version + 1):
+            with self.subTest(version=version):
+                repository = BoardRepository(self.event_store, as_of_version=version, aggregate_index=self.index)
+                expected = (replay(self.event_store, board_id, as_of_version=version)
+                            for board_id in (self.board.id, self.other_board._id))
+                self.assertEqual({board_or_none.id: board_state(board_or_none)
+                                  for board_or_none in repository.all_boards()},
+                                 {board_or_none.id: board_state(board_or_none)
+                                  for board_or_none in expected
+                                  if board_or_none is not None and not board_or_none.discarded})
+
+    def assertWorkItemPositionsMatchLog(self, index, event_store):
+        records = list(record_positions(event_store))
+        repository = WorkItemRepository(event_store, aggregate_index=index)
+        for work_item in self.work_items:
+            with self.subTest(work_item=work_item.id):
+                work_item_records = [(position, record) for position, record in records
+                                     if work_item.id in (record['attributes']['originator_id'],
+                                                         record['attributes'].get('work_item_id'))]
+                self.assertEqual(index.work_item_positions(work_item.id),
+                                 [position for position, _ in work_item_records])
+                self.assertEqual([vars(event) for event in repository.work_item_history(work_item.id)],
+                                 [vars(deserialize_event(record)) for _, record in work_item_records])
+        self.assertEqual(index.work_item_positions('absent'), [])
+
+    def test_work_item_positions_follow_the_log(self):
+        self.assertWorkItemPositionsMatchLog(self.index, self.event_store)
+        self.modify()
+        with unit_of_work(self.persistence_subscriber):
+            self.work_items[1].name = "Renamed work item"
+        self.assertWorkItemPositionsMatchLog(self.index, self.event_store)
+
+    def test_work_item_positions_are_rebuilt_when_the_log_is_truncated(self):
+        end_position = self.event_store.end_position()
+        self.modify()
+        self.assertWorkItemPositionsMatchLog(self.index, self.event_store)
+        os.truncate(self.event_store.store_path, end_position)
+        self.assertWorkItemPositionsMatchLog(self.index, self.event_store)
+
+    def test_rebuilds_when_the_log_is_replaced(self):
+        self.assertMatchesReplay(self.index, self.event_store)
+        replacement_path = os.path.join(self.directory, 'replacement.events')
+        with open(self.event_store.store_path, 'rb') as store_file, open(replacement_path, 'wb') as replacement:
+            replacement.write(store_file.read())
+        os.replace(replacement_path, self.event_store.store_path)
+        self.modify()
+        self.assertMatchesReplay(self.index, self.event_store)
+
+    def test_rebuilds_when_the_log_is_truncated(self):
+        end_position = self.event_store.end_position()
+        self.modify()
+        self.assertMatchesReplay(self.index, self.event_store)
+        os.truncate(self.event_store.store_path, end_position)
+        self.assertMatchesReplay(self.index, self.event_store)
+        self.assertEqual(self.index.version(self.board.id), replay(self.event_store, self.board.id).version)
+
+
+if __name__ == '__main__':
+    unittest.main()
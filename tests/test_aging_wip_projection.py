@@ -0,0 +1,147 @@
+"""Tests of the projection of the age of the work in progress."""
+
+import os
+import tempfile
+import unittest
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_sourced_projections.aging_wip_projection import AgingWorkInProgressProjection
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import Board, start_project
+from kanban.domain.model.workitem import register_new_work_item
+
+
+class AgingWorkInProgressProjectionTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.to_do = self.board.add_new_column("To do", None)
+            self.doing = self.board.add_new_column("Doing", None)
+            self.done = self.board.add_new_column("Done", None)
+            self.work_items = [register_new_work_item("Work item {}".format(index)) for index in range(6)]
+            for work_item in self.work_items:
+                self.board.schedule_work_item(work_item)
+        self.projection = AgingWorkInProgressProjection(self.event_store)
+        self.addCleanup(self.projection.close)
+
+    def entry_times(self):
+        """The time at which each work item entered its current column, from the event log."""
+        subscription = self.event_store.subscribe(0)
+        try:
+            entry_times = {}
+            for _, stored_event in subscription.poll():
+                event = deserialize_event(stored_event)
+                if isinstance(event, (Board.WorkItemScheduled, Board.WorkItemAdvanced)):
+                    entry_times[event.work_item_id] = event.timestamp
+                elif isinstance(event, (Board.WorkItemRetired, Board.WorkItemAbandoned)):
+                    del entry_times[event.work_item_id]
+            return entry_times
+        finally:
+            subscription.close()
+
+    def assertMatchesReplay(self):
+        """Check the projection against the Boards replayed from the event log."""
+        boards = {board.id: board for board in BoardRepository(self.event_store).all_boards()}
+        entry_times = self.entry_times()
+        now = max(entry_times.values(), default=0) + 1000
+        for board_id, board in boards.items():
+            self.assertEqual(self.projection.column_ids(board_id), [column.id for column in board.columns()])
+            report = self.projection.aging_report(board_id, count=len(entry_times), percentiles=(50, 100), now=now)
+            self.assertEqual([row['name'] for row in report], list(board.column_names()))
+            for column, row in zip(board.columns(), report):
+                expected = sorted((now - entry_times[work_item_id], work_item_id)
+                                  for work_item_id in column.work_item_ids())
+                self.assertEqual(row['work_items'], len(expected))
+                self.assertEqual(sorted((age, work_item_id) for work_item_id, age in row['oldest']), expected)
+                self.assertEqual([age for _, age in row['oldest']], sorted((age for age, _ in expected), reverse=True))
+                self.assertEqual(row['age_percentiles'][100], expected[-1][0] if expected else None)
+                self.assertEqual(row['age_percentiles'][50],
+                                 expected[(len(expected) + 1) // 2 - 1][0] if expected else None)
+        for work_item_id, entry_time in entry_times.items():
+            self.assertEqual(self.projection.entry_time(work_item_id), entry_time)
+
+    def test_scheduled_work_items_enter_the_first_column(self):
+        self.assertMatchesReplay()
+        self.assertEqual(len(self.projection.oldest_work_items(self.to_do.id, 10)), len(self.work_items))
+
+    def test_advance_abandon_and_retire(self):
+        self.assertMatchesReplay()
+        first, second, third, fourth = self.work_items[:4]
+        with unit_of_work(self.persistence_subscriber):
+            for work_item in (first, second, third):
+                self.board.advance_work_item(work_item)
+            self.board.advance_work_item(first)
+        self.assertMatchesReplay()
+        with unit_of_work(self.persistence_subscriber):
+            self.board.retire_work_item(first)
+            self.board.abandon_work_item(second)
+            self.board.abandon_work_item(fourth)
+        self.assertMatchesReplay()
+        self.assertIsNone(self.projection.entry_time(first.id))
+        self.assertIsNone(self.projection.entry_time(second.id))
+        self.assertEqual([work_item_id for work_item_id, _ in self.projection.oldest_work_items(self.doing.id, 10)],
+                         [third.id])
+
+    def test_inserted_and_removed_columns(self):
+        with unit_of_work(self.persistence_subscriber):
+            review = self.board.insert_new_column_before(self.done, "Review", None)
+            self.board.advance_work_item(self.work_items[0])
+            self.board.advance_work_item(self.work_items[0])
+        self.assertMatchesReplay()
+        self.assertEqual(self.projection.column_ids(self.board.id),
+                         [self.to_do.id, self.doing.id, review.id, self.done.id])
+        self.assertEqual(self.projection.oldest_work_items(review.id, 10, now=0)[0][0], self.work_items[0].id)
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[0])
+            self.board.remove_column(review)
+        self.assertMatchesReplay()
+        with unit_of_work(self.persistence_subscriber):
+            self.to_do.name = "Backlog"
+        self.assertEqual([row['name'] for row in self.projection.aging_report(self.board.id)],
+                         ["Backlog", "Doing", "Done"])
+        with self.assertRaises(ValueError):
+            self.projection.oldest_work_items(review._id, 10)
+
+    def test_discarded_board(self):
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[0])
+        self.assertMatchesReplay()
+        board_id, column_ids = self.board.id, [self.to_do.id, self.doing.id, self.done.id]
+        with unit_of_work(self.persistence_subscriber):
+            self.board.discard()
+        self.assertEqual(self.projection.column_ids(board_id), [])
+        self.assertEqual(self.projection.aging_report(board_id), [])
+        for column_id in column_ids:
+            with self.assertRaises(ValueError):
+                self.projection.age_percentile(column_id, 50)
+        for work_item in self.work_items:
+            self.assertIsNone(self.projection.entry_time(work_item.id))
+
+    def test_a_replaced_event_log_is_reprojected(self):
+        self.assertMatchesReplay()
+        replacement_path = os.path.join(self.directory, 'replacement.events')
+        persistence_subscriber = PersistenceSubscriber(EventStore(replacement_path))
+        try:
+            with unit_of_work(persistence_subscriber):
+                replacement_board = start_project("Replacement", "A replacement board")
+                column = replacement_board.add_new_column("Only", None)
+        finally:
+            persistence_subscriber.close()
+        os.replace(replacement_path, self.event_store.store_path)
+        self.assertEqual(self.projection.column_ids(self.board.id), [])
+        self.assertEqual(self.projection.column_ids(replacement_board.id), [column.id])
+        self.assertIsNone(self.projection.entry_time(self.work_items[0].id))
+
+
+if __name__ == '__main__':
+    unittest.main()
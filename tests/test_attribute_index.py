@@ -0,0 +1,134 @@
+"""Tests of the attribute index, against the aggregates replayed from the event log."""
+
+import datetime
+import os
+import tempfile
+import unittest
+
+from infrastructure.event_sourced_projections.attribute_index import AttributeIndex, shared_attribute_index
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import start_project
+from kanban.domain.model.queries import Equals, HasWorkItem, InRange, OnBoard, OneOf
+from kanban.domain.model.workitem import register_new_work_item
+
+
+class AttributeIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.board.add_new_column("Doing", None)
+            self.board.add_new_column("Done", None)
+            self.other_board = start_project("Other", "Another board")
+            self.other_board.add_new_column("Only", None)
+            self.work_items = [register_new_work_item("Work item {}".format(index % 3),
+                                                      due_date=datetime.date(2024, 1, 10 - index) if index else None)
+                               for index in range(6)]
+            for work_item in self.work_items[:3]:
+                self.board.schedule_work_item(work_item)
+            self.other_board.schedule_work_item(self.work_items[3])
+        self.index = AttributeIndex(self.event_store)
+        self.addCleanup(self.index.close)
+
+    def modify(self):
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[0])
+            self.board.retire_work_item(self.work_items[0])
+            self.board.abandon_work_item(self.work_items[1])
+            self.board.schedule_work_item(self.work_items[4])
+            self.board.name = "Renamed board"
+            self.work_items[2].name = "Renamed work item"
+            self.work_items[5].due_date = datetime.date(2024, 1, 7)
+            self.work_items[3].due_date = None
+            self.other_board.discard()
+
+    def assertMatchesReplay(self):
+        boards = list(BoardRepository(self.event_store).all_boards())
+        work_items = list(WorkItemRepository(self.event_store).all_work_items())
+        self.assertEqual(self.index.extant_ids('Board'), {board.id for board in boards})
+        self.assertEqual(self.index.extant_ids('WorkItem'), {work_item.id for work_item in work_items})
+
+        board_names = {"Board", "Other", "Renamed board"}
+        board_queries = [Equals('name', name) for name in board_names]
+        board_queries += [OneOf('name', board_names), OneOf('name', {"Board", "Absent"})]
+        for query in board_queries:
+            with self.subTest(query=query):
+                self.assertEqual(self.index.narrow('Board', query),
+                                 ({board.id for board in boards if query(board)}, None))
+        for work_item in self.work_items:
+            with self.subTest(work_item=work_item._id):
+                self.assertEqual(self.index.narrow('Board', HasWorkItem(work_item._id)),
+                                 ({board.id for board in boards if HasWorkItem(work_item._id)(board)}, None))
+
+        work_item_names = {"Work item 0", "Work item 1", "Work item 2", "Renamed work item"}
+        dates = [None, datetime.date(2024, 1, 6), datetime.date(2024, 1, 7), datetime.date(2024, 1, 9)]
+        work_item_queries = [Equals('name', name) for name in work_item_names]
+        work_item_queries += [OneOf('name', work_item_names), Equals('due_date', None),
+                              Equals('due_date', datetime.date(2024, 1, 7))]
+        work_item_queries += [InRange('due_date', lower, upper) for lower in dates for upper in dates]
+        for query in work_item_queries:
+            with self.subTest(query=query):
+                self.assertEqual(self.index.narrow('WorkItem', query),
+                                 ({work_item.id for work_item in work_items if query(work_item)}, None))
+        for board in boards:
+            with self.subTest(board=board.id):
+                self.assertEqual(self.index.narrow('WorkItem', OnBoard(board.id)),
+                                 ({work_item_id for column in board.columns()
+                                   for work_item_id in column.work_item_ids()}, None))
+
+    def test_follows_the_log(self):
+        self.assertMatchesReplay()
+        self.modify()
+        self.assertMatchesReplay()
+
+    def test_residual_predicates_are_returned(self):
+        def described(board):
+            return board.description == "A board"
+
+        self.assertEqual(self.index.narrow('Board', Equals('name', "Board") & described),
+                         ({self.board.id}, described))
+        self.assertEqual(self.index.narrow('Board', described), (None, described))
+        unindexed = Equals('content', "Absent")
+        self.assertEqual(self.index.narrow('WorkItem', unindexed), (None, unindexed))
+
+    def test_rebuilds_when_the_log_is_replaced(self):
+        self.assertMatchesReplay()
+        replacement_path = os.path.join(self.directory, 'replacement.events')
+        persistence_subscriber = PersistenceSubscriber(EventStore(replacement_path))
+        try:
+            with unit_of_work(persistence_subscriber):
+                replacement_board = start_project("Replacement", "A replacement board")
+        finally:
+            persistence_subscriber.close()
+        os.replace(replacement_path, self.event_store.store_path)
+        self.assertEqual(self.index.extant_ids('Board'), {replacement_board.id})
+        self.assertEqual(self.index.extant_ids('WorkItem'), set())
+        self.assertMatchesReplay()
+
+    def test_rebuilds_when_the_log_is_truncated(self):
+        end_position = self.event_store.end_position()
+        self.modify()
+        self.assertMatchesReplay()
+        os.truncate(self.event_store.store_path, end_position)
+        self.assertMatchesReplay()
+        self.assertEqual(self.index.narrow('Board', Equals('name', "Board")), ({self.board.id}, None))
+
+    def test_the_shared_index_is_shared_by_the_users_of_a_log(self):
+        shared_index = shared_attribute_index(self.event_store)
+        self.assertIs(shared_attribute_index(EventStore(self.event_store.store_path)), shared_index)
+        self.assertIsNot(shared_attribute_index(EventStore(os.path.join(self.directory, 'other.events'))),
+                         shared_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
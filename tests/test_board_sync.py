@@ -0,0 +1,187 @@
+"""Tests of the delta synchronization of Boards, against plain replays of the event log."""
+
+import asyncio
+import copy
+import os
+import tempfile
+import threading
+import unittest
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_sourced_projections.aggregate_index import AggregateIndex
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from application.board_sync import BoardSync
+from kanban.domain.model import board
+from kanban.domain.model.board import start_project
+from kanban.domain.model.workitem import register_new_work_item
+
+
+def replay(event_store, board_id, as_of_version=None):
+    """Reconstitute a Board by applying its events from the start of the log."""
+    state = None
+    with event_store.open_event_stream() as stored_events:
+        for stored_event in stored_events:
+            event = deserialize_event(stored_event)
+            if event.originator_id != board_id:
+                continue
+            previous_state = copy.deepcopy(state)
+            state = board.mutate(state, event)
+            if as_of_version is not None and state._version > as_of_version:
+                return previous_state
+    return state
+
+
+def client_state(board_or_none):
+    """The state of a Board as held by a client, in the terms of a diff."""
+    if board_or_none is None:
+        return None
+    if board_or_none.discarded:
+        return dict(discarded=True)
+    return dict(name=board_or_none.name,
+                description=board_or_none.description,
+                columns={column.id: dict(name=column.name, wip_limit=column.wip_limit,
+                                         work_item_ids=list(column.work_item_ids()))
+                         for column in board_or_none.columns()},
+                column_ids=[column.id for column in board_or_none.columns()])
+
+
+def apply_diff(state, diff):
+    """Apply a diff to the state held by a client."""
+    if 'discarded' in diff:
+        return dict(discarded=True)
+    state = copy.deepcopy(state) or dict(columns={}, column_ids=[])
+    for attribute in ('name', 'description', 'column_ids'):
+        if attribute in diff:
+            state[attribute] = diff[attribute]
+    for column_id in diff.get('removed_column_ids', ()):
+        del state['columns'][column_id]
+    for column in diff.get('columns', ()):
+        column = dict(column)
+        state['columns'][column.pop('id')] = column
+    return state
+
+
+class BoardSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.to_do = self.board.add_new_column("To do", None)
+            self.doing = self.board.add_new_column("Doing", 2)
+            self.done = self.board.add_new_column("Done", None)
+            self.work_items = [register_new_work_item("Work item {}".format(index)) for index in range(4)]
+        with unit_of_work(self.persistence_subscriber):
+            for work_item in self.work_items:
+                self.board.schedule_work_item(work_item)
+            self.board.advance_work_item(self.work_items[0])
+            self.board.name = "Renamed"
+        with unit_of_work(self.persistence_subscriber):
+            self.review = self.board.insert_new_column_before(self.done, "Review", 1)
+            self.board.advance_work_item(self.work_items[0])
+            self.board.advance_work_item(self.work_items[1])
+            self.board.abandon_work_item(self.work_items[2])
+            self.board.description = "Described"
+            self.doing.wip_limit = 3
+        self.index = AggregateIndex(self.event_store)
+        self.addCleanup(self.index.close)
+        self.board_sync = BoardSync(self.event_store, aggregate_index=self.index, poll_interval=0.05)
+        self.addCleanup(self.board_sync.close)
+
+    def client_versions(self):
+        return [None] + list(range(self.board_sync.version(self.board._id) + 1))
+
+    def assertMatchesReplay(self):
+        board_id = self.board._id
+        current = replay(self.event_store, board_id)
+        self.assertEqual(self.board_sync.version(board_id), current._version)
+        for client_version in self.client_versions():
+            with self.subTest(client_version=client_version):
+                held = None if client_version is None else replay(self.event_store, board_id, client_version)
+                version, events = self.board_sync.events_since(board_id, client_version)
+                self.assertEqual(version, current._version)
+                state = copy.deepcopy(held)
+                for event in events:
+                    state = board.mutate(state, event)
+                self.assertEqual(client_state(state), client_state(current))
+
+                diff = self.board_sync.diff_since(board_id, client_version)
+                if client_version == current._version:
+                    self.assertIsNone(diff)
+                    continue
+                self.assertEqual((diff['board_id'], diff['from_version'], diff['version']),
+                                 (board_id, client_version, current._version))
+                self.assertEqual(apply_diff(client_state(held), diff), client_state(current))
+
+    def test_events_and_diffs_since_every_version(self):
+        self.assertMatchesReplay()
+
+    def test_follows_the_log(self):
+        self.assertMatchesReplay()
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[0])
+            self.board.retire_work_item(self.work_items[0])
+            self.board.remove_column(self.review)
+        self.assertMatchesReplay()
+        with unit_of_work(self.persistence_subscriber):
+            self.board.discard()
+        self.assertMatchesReplay()
+
+    def test_rebuilds_when_the_log_is_truncated(self):
+        end_position = self.event_store.end_position()
+        with unit_of_work(self.persistence_subscriber):
+            self.board.name = "Truncated"
+        self.assertMatchesReplay()
+        os.truncate(self.event_store.store_path, end_position)
+        self.assertMatchesReplay()
+        self.assertEqual(self.board_sync.diff_since(self.board.id, None)['name'], "Renamed")
+
+    def test_no_board(self):
+        self.assertIsNone(self.board_sync.version('absent'))
+        self.assertEqual(self.board_sync.events_since('absent', None), (None, []))
+        with self.assertRaises(ValueError):
+            self.board_sync.diff_since('absent', None)
+
+    def test_waiting_times_out(self):
+        version = self.board_sync.version(self.board.id)
+        self.assertEqual(self.board_sync.wait_for_events(self.board.id, version, timeout=0.1), (version, []))
+
+    def test_waiting_is_ended_by_a_published_event(self):
+        version = self.board_sync.version(self.board.id)
+        # A long poll interval, so that only notification can end the wait in time
+        board_sync = BoardSync(self.event_store, aggregate_index=self.index, poll_interval=60)
+        self.addCleanup(board_sync.close)
+        timer = threading.Timer(0.1, setattr, (self.board, 'name', "Renamed while waiting"))
+        timer.start()
+        self.addCleanup(timer.join)
+        new_version, events = board_sync.wait_for_events(self.board.id, version, timeout=10)
+        self.assertEqual(new_version, version + 1)
+        self.assertEqual([event.value for event in events], ["Renamed while waiting"])
+
+    def test_following_yields_new_events(self):
+        version = self.board_sync.version(self.board.id)
+
+        async def follow():
+            loop = asyncio.get_running_loop()
+            followed = []
+            updates = self.board_sync.follow(self.board.id, version - 1)
+            try:
+                async for new_version, events in updates:
+                    followed.append((new_version, len(events)))
+                    if len(followed) == 2:
+                        return followed
+                    loop.call_later(0.05, setattr, self.board, 'name', "Renamed while following")
+            finally:
+                await updates.aclose()
+
+        self.assertEqual(asyncio.run(asyncio.wait_for(follow(), 10)), [(version, 1), (version + 1, 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
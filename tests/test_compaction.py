@@ -0,0 +1,142 @@
+"""Tests of the offline compaction of an event log."""
+
+import os
+import tempfile
+import unittest
+
+from infrastructure.blob_store import BlobStore
+from infrastructure.compaction import compact
+from infrastructure.event_sourced_projections.sqlite_read_model import SQLiteReadModel
+from infrastructure.event_sourced_projections.text_index import TextIndex
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import Board, start_project
+from kanban.domain.model.entity import Entity
+from kanban.domain.model.workitem import WorkItem, register_new_work_item
+
+
+class CompactionTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.store_path = os.path.join(directory.name, 'kanban.events')
+        self.compacted_path = os.path.join(directory.name, 'compacted.events')
+        self.archive_path = os.path.join(directory.name, 'archive.events')
+
+        persistence_subscriber = PersistenceSubscriber(EventStore(self.store_path), check_versions=True)
+        try:
+            with unit_of_work(persistence_subscriber):
+                self.board = start_project("Board", "A board")
+                self.board.add_new_column("Doing", None)
+                self.board.add_new_column("Done", None)
+                self.discarded_board = start_project("Discarded", "A discarded board")
+                self.work_item = register_new_work_item("Work item", content="Initial content")
+                self.unscheduled_work_item = register_new_work_item("Unscheduled")
+            with unit_of_work(persistence_subscriber):
+                # A run of changes to the work item, interrupted only by events of the Board
+                self.work_item.name = "Renamed"
+                self.board.schedule_work_item(self.work_item)
+                self.work_item.name = "Renamed again"
+                self.work_item.content = "Final content"
+                self.board.advance_work_item(self.work_item)
+                self.board.description = "First description"
+                self.board.description = "Final description"
+                self.unscheduled_work_item.due_date = None
+                self.discarded_board.name = "Renamed discarded"
+                self.discarded_board.discard()
+        finally:
+            persistence_subscriber.close()
+
+    def compact(self):
+        return compact(self.store_path, self.compacted_path, self.archive_path, collapse_attribute_changes=True)
+
+    def test_collapses_runs_and_archives_discarded_boards(self):
+        counts = self.compact()
+        self.assertEqual(counts['archived'], 3)
+        self.assertEqual(counts['collapsed'], 5)
+        self.assertEqual(counts['snapshots'], 2)
+        self.assertEqual(counts['read'], counts['kept'] + counts['archived'])
+
+    def test_replayed_boards_and_work_items_are_unchanged(self):
+        self.compact()
+        original_store, compacted_store = EventStore(self.store_path), EventStore(self.compacted_path)
+        self.assertEqual(_board_states(BoardRepository(compacted_store).all_boards()),
+                         _board_states([self.board]))
+        self.assertEqual(_board_states(BoardRepository(original_store).all_boards([self.board.id])),
+                         _board_states([self.board]))
+        self.assertEqual(_work_item_states(WorkItemRepository(compacted_store).all_work_items()),
+                         _work_item_states(WorkItemRepository(original_store).all_work_items()))
+
+    def test_versions_allow_appends_to_the_compacted_log(self):
+        self.compact()
+        event_store = EventStore(self.compacted_path)
+        board = next(iter(BoardRepository(event_store).all_boards()))
+        work_items = list(WorkItemRepository(event_store).all_work_items())
+        persistence_subscriber = PersistenceSubscriber(event_store, check_versions=True)
+        try:
+            with unit_of_work(persistence_subscriber):
+                board.name = "Renamed after compaction"
+                board.retire_work_item(self.work_item)
+                for work_item in work_items:
+                    work_item.name = "Renamed after compaction"
+        finally:
+            persistence_subscriber.close()
+
+        board = next(iter(BoardRepository(event_store).all_boards()))
+        self.assertEqual(board.name, "Renamed after compaction")
+        self.assertEqual(board.version, self.board.version + 2)
+        self.assertEqual({work_item.name for work_item in WorkItemRepository(event_store).all_work_items()},
+                         {"Renamed after compaction"})
+
+    def test_collapsed_events_stand_where_runs_ended(self):
+        self.compact()
+        history = WorkItemRepository(EventStore(self.compacted_path)).work_item_history(self.work_item.id)
+        self.assertEqual([type(event) for event in history],
+                         [WorkItem.Created, Board.WorkItemScheduled, Entity.AttributesChanged, Board.WorkItemAdvanced])
+        self.assertEqual(history[2].values, {'_name': "Renamed again", '_content': "Final content"})
+        self.assertEqual(history[2].changes, 3)
+
+    def test_collapsed_runs_of_content_stored_in_a_blob_store_can_be_read(self):
+        blob_store = BlobStore(os.path.join(self.directory, 'blobs'))
+        event_store = EventStore(self.store_path)
+        persistence_subscriber = PersistenceSubscriber(event_store, blob_store=blob_store, blob_threshold=100)
+        try:
+            with unit_of_work(persistence_subscriber):
+                self.work_item.content = "zebra " * 50
+                self.work_item.content = "quagga " * 50
+        finally:
+            persistence_subscriber.close()
+        counts = self.compact()
+        self.assertEqual(counts['snapshots'], 2)
+
+        compacted_store = EventStore(self.compacted_path)
+        work_items = {work_item.id: work_item
+                      for work_item in WorkItemRepository(compacted_store, blob_store=blob_store).all_work_items()}
+        self.assertEqual(work_items[self.work_item.id].content, "quagga " * 50)
+        self.assertEqual(TextIndex(compacted_store, blob_store=blob_store).search("quagga"), [self.work_item.id])
+        self.assertEqual(TextIndex(compacted_store, blob_store=blob_store).search("zebra"), [])
+        read_model = SQLiteReadModel(compacted_store, blob_store=blob_store)
+        try:
+            self.assertEqual(read_model.work_items_with_name("Renamed again"), [self.work_item.id])
+        finally:
+            read_model.close()
+
+
+def _board_states(boards):
+    return {board.id: (board.name, board.description, board.version,
+                       [(column.name, list(column.work_item_ids())) for column in board.columns()])
+            for board in boards}
+
+
+def _work_item_states(work_items):
+    return {work_item.id: (work_item.name, work_item.due_date, work_item.content, work_item.version)
+            for work_item in work_items}
+
+
+if __name__ == '__main__':
+    unittest.main()
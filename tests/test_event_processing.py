@@ -0,0 +1,60 @@
+"""Tests of replaying events from an event store."""
+
+import os
+import tempfile
+import unittest
+
+from infrastructure.event_processing import LiveAggregateLimitError
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import start_project
+
+
+class StreamingReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        persistence_subscriber = PersistenceSubscriber(self.event_store)
+        try:
+            with unit_of_work(persistence_subscriber):
+                self.small_board = start_project("Small", "A small board")
+                self.large_board = start_project("Large", "A large board")
+                # The events of the large board are interleaved with those of the small board
+                for index in range(20):
+                    self.large_board.description = "A large board " + "x" * 1000 + str(index)
+                self.small_board.description = "Still small"
+        finally:
+            persistence_subscriber.close()
+        self.board_ids = [self.small_board.id, self.large_board.id]
+
+    def replayed_boards(self, **kwargs):
+        repository = BoardRepository(self.event_store, streaming=True, **kwargs)
+        return {board.id: (board.name, board.description, board.version) for board in repository.all_boards()}
+
+    def expected_boards(self):
+        return {board.id: (board.name, board.description, board.version)
+                for board in (self.small_board, self.large_board)}
+
+    def test_streaming_replay_matches_buffered_replay(self):
+        self.assertEqual(self.replayed_boards(), self.expected_boards())
+
+    def test_limits_which_are_not_exceeded_allow_replay(self):
+        self.assertEqual(self.replayed_boards(max_live_aggregates=2, max_live_bytes=100000), self.expected_boards())
+
+    def test_too_many_live_aggregates_are_refused(self):
+        with self.assertRaises(LiveAggregateLimitError):
+            self.replayed_boards(max_live_aggregates=1)
+
+    def test_one_aggregate_built_from_too_many_bytes_is_refused(self):
+        # Only two aggregates are ever live, but one of them is built from about 20kB of records
+        self.assertEqual(len(self.replayed_boards(max_live_aggregates=2, max_live_bytes=30000)), 2)
+        with self.assertRaises(LiveAggregateLimitError):
+            self.replayed_boards(max_live_aggregates=2, max_live_bytes=10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
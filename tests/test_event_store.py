@@ -0,0 +1,141 @@
+"""Tests of optimistic concurrency control in the event store."""
+
+import os
+import tempfile
+import unittest
+
+from infrastructure.compaction import compact
+from infrastructure.concurrency import execute_with_retry
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_store import ATTRIBUTES_CHANGED_TOPIC, ConcurrencyError, EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import start_project
+
+
+ATTRIBUTE_CHANGED_TOPIC = 'kanban.domain.model.entity#Entity.AttributeChanged'
+
+
+class ConcurrencyTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store, check_versions=True)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.board.add_new_column("Doing", None)
+
+    def load_board(self, event_store=None):
+        return next(iter(BoardRepository(event_store or self.event_store).all_boards([self.board.id])))
+
+    def test_a_stale_aggregate_cannot_be_modified(self):
+        stale_board = self.load_board()
+        with unit_of_work(self.persistence_subscriber):
+            self.load_board().add_new_column("Done", None)
+        end_position = self.event_store.end_position()
+        with self.assertRaises(ConcurrencyError):
+            with unit_of_work(self.persistence_subscriber):
+                stale_board.add_new_column("Review", None)
+        self.assertEqual(self.event_store.end_position(), end_position)
+        self.assertEqual(list(self.load_board().column_names()), ["Doing", "Done"])
+
+    def test_a_conflicting_batch_is_not_appended(self):
+        other_board_id = start_project("Other", "Another board").id
+        end_position = self.event_store.end_position()
+        records = [(ATTRIBUTE_CHANGED_TOPIC,
+                    dict(originator_id=other_board_id, originator_version=0, name='_name', value="Other")),
+                   (ATTRIBUTE_CHANGED_TOPIC,
+                    dict(originator_id=self.board.id, originator_version=0, name='_name', value="Stale"))]
+        with self.assertRaises(ConcurrencyError):
+            self.event_store.append_batch(records, {other_board_id: 0, self.board.id: 0})
+        with self.assertRaises(ConcurrencyError):
+            self.event_store.append_batch(records[:1], {self.board.id: None})
+        self.assertEqual(self.event_store.end_position(), end_position)
+
+    def test_the_expected_version_is_distinct_from_event_attributes(self):
+        self.event_store.append(ATTRIBUTE_CHANGED_TOPIC, _expected_version=self.board.version,
+                                originator_id=self.board.id, originator_version=self.board.version,
+                                name='_name', value="Renamed", expected_version="An attribute")
+        with self.assertRaises(ConcurrencyError):
+            self.event_store.append(ATTRIBUTE_CHANGED_TOPIC, _expected_version=self.board.version,
+                                    originator_id=self.board.id, originator_version=self.board.version,
+                                    name='_name', value="Stale")
+        with self.event_store.open_event_stream() as events:
+            last_event = list(events)[-1]
+        self.assertEqual(last_event['attributes']['expected_version'], "An attribute")
+
+    def test_a_conflicting_command_is_retried_against_the_reloaded_aggregate(self):
+        stale_board = self.load_board()
+        with unit_of_work(self.persistence_subscriber):
+            self.load_board().add_new_column("Done", None)
+        loaded = [stale_board]
+        executed = []
+
+        def load():
+            return loaded.pop() if loaded else self.load_board()
+
+        def command(board):
+            executed.append(board)
+            return board.add_new_column("Review", None)
+
+        column = execute_with_retry(self.persistence_subscriber, load, command)
+        self.assertEqual(len(executed), 2)
+        self.assertIs(executed[0], stale_board)
+        self.assertEqual(column.name, "Review")
+        self.assertEqual(list(self.load_board().column_names()), ["Doing", "Done", "Review"])
+
+    def test_retries_are_limited(self):
+        stale_version = self.board.version
+        with unit_of_work(self.persistence_subscriber):
+            self.load_board().add_new_column("Done", None)
+        stale_repository = BoardRepository(self.event_store, as_of_version=stale_version)
+        executed = []
+
+        def command(board):
+            executed.append(board)
+            board.add_new_column("Review {}".format(len(executed)), None)
+
+        with self.assertRaises(ConcurrencyError):
+            execute_with_retry(self.persistence_subscriber,
+                               lambda: next(iter(stale_repository.all_boards([self.board.id]))),
+                               command, attempts=2)
+        self.assertEqual(len(executed), 2)
+        with self.assertRaises(ValueError):
+            execute_with_retry(self.persistence_subscriber, self.load_board, command, attempts=0)
+        self.assertEqual(len(executed), 2)
+
+    def test_versions_account_for_collapsed_attribute_changes(self):
+        with unit_of_work(self.persistence_subscriber):
+            self.board.name = "Renamed"
+            self.board.description = "Described"
+            self.board.name = "Renamed again"
+        compacted_path = os.path.join(self.directory, 'compacted.events')
+        compact(self.event_store.store_path, compacted_path, os.path.join(self.directory, 'archive.events'),
+                collapse_attribute_changes=True)
+        compacted_store = EventStore(compacted_path)
+        with compacted_store.open_event_stream() as events:
+            self.assertEqual([event['topic'] for event in events][-1], ATTRIBUTES_CHANGED_TOPIC)
+
+        board = self.load_board(compacted_store)
+        self.assertEqual(board.version, self.board.version)
+        with self.assertRaises(ConcurrencyError):
+            compacted_store.append(ATTRIBUTE_CHANGED_TOPIC, _expected_version=board.version - 1,
+                                   originator_id=board.id, originator_version=board.version - 1,
+                                   name='_name', value="Stale")
+        persistence_subscriber = PersistenceSubscriber(compacted_store, check_versions=True)
+        self.addCleanup(persistence_subscriber.close)
+        self.persistence_subscriber.close()
+        with unit_of_work(persistence_subscriber):
+            board.name = "Renamed after compaction"
+        self.assertEqual(self.load_board(compacted_store).name, "Renamed after compaction")
+        with self.assertRaises(ConcurrencyError):
+            with unit_of_work(persistence_subscriber):
+                self.board.name = "Stale"
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Tests of Monte Carlo completion forecasting."""
+
+import datetime
+import math
+import unittest
+
+from kanban.domain.services import forecasting
+
+
+def _negative_binomial_percentile_days(remaining_items, percentile):
+    """The exact percentile of the days to complete work items, when each day completes one with probability 1/2."""
+    days = remaining_items
+    while True:
+        probability = sum(math.comb(days, completed) for completed in range(remaining_items, days + 1)) / 2 ** days
+        if probability >= percentile / 100:
+            return days
+        days += 1
+
+
+class SimulationTestMixin:
+    """Tests of a simulation of the number of days taken by each trial."""
+
+    trials = 20000
+
+    def simulate(self, throughput, remaining_items, trials, seed):
+        raise NotImplementedError
+
+    def test_constant_throughput_takes_a_fixed_number_of_days(self):
+        days = self.simulate([2], 9, 100, seed=1)
+        self.assertEqual(set(int(day) for day in days), {5})
+
+    def test_throughput_completing_everything_in_one_day_takes_one_day(self):
+        days = self.simulate([5, 7], 3, 100, seed=1)
+        self.assertEqual(set(int(day) for day in days), {1})
+
+    def test_percentiles_match_the_negative_binomial_distribution(self):
+        days = sorted(self.simulate([0, 1], 20, self.trials, seed=7))
+        for percentile in (5, 50, 85, 95):
+            expected = _negative_binomial_percentile_days(20, percentile)
+            sampled = days[math.ceil(percentile / 100 * self.trials) - 1]
+            self.assertLessEqual(abs(sampled - expected), 1, percentile)
+
+    def test_mean_matches_the_negative_binomial_distribution(self):
+        days = self.simulate([0, 1], 20, self.trials, seed=11)
+        # Twenty successes at probability 1/2 take 40 days on average, with standard deviation sqrt(40)
+        self.assertAlmostEqual(sum(days) / self.trials, 40, delta=5 * math.sqrt(40 / self.trials))
+
+    def test_same_seed_gives_same_days(self):
+        self.assertEqual(list(self.simulate([0, 1, 3], 30, 500, seed=3)),
+                         list(self.simulate([0, 1, 3], 30, 500, seed=3)))
+
+
+class PythonSimulationTest(SimulationTestMixin, unittest.TestCase):
+
+    def simulate(self, throughput, remaining_items, trials, seed):
+        return forecasting._simulate_python(throughput, remaining_items, trials, seed)
+
+
+@unittest.skipIf(forecasting.numpy is None, "numpy is not installed")
+class NumpySimulationTest(SimulationTestMixin, unittest.TestCase):
+
+    def simulate(self, throughput, remaining_items, trials, seed):
+        return forecasting._simulate_numpy(throughput, remaining_items, trials, seed)
+
+
+class ForecastCompletionTest(unittest.TestCase):
+
+    def test_forecast_reports_percentiles_as_days_and_dates(self):
+        start_date = datetime.date(2024, 1, 1)
+        forecast = forecasting.forecast_completion([2], 9, trials=100, percentiles=(50, 95),
+                                                   start_date=start_date, seed=1)
+        self.assertEqual(forecast.percentile_days, {50: 5, 95: 5})
+        self.assertEqual(forecast.completion_dates, {50: datetime.date(2024, 1, 6), 95: datetime.date(2024, 1, 6)})
+
+    def test_nothing_remaining_takes_no_days(self):
+        forecast = forecasting.forecast_completion([1], 0, trials=10, seed=1)
+        self.assertEqual(set(forecast.percentile_days.values()), {0})
+
+    def test_forecast_requires_throughput(self):
+        with self.assertRaises(ValueError):
+            forecasting.forecast_completion([0, 0], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
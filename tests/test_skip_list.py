@@ -0,0 +1,64 @@
+"""Tests of the IndexableSkipList."""
+
+import bisect
+import random
+import unittest
+
+from utility.skip_list import IndexableSkipList
+
+
+class IndexableSkipListTest(unittest.TestCase):
+
+    def assertMatches(self, skip_list, expected):
+        self.assertEqual(len(skip_list), len(expected))
+        self.assertEqual(list(skip_list), expected)
+        for index, value in enumerate(expected):
+            self.assertEqual(skip_list[index], value)
+            self.assertEqual(skip_list[index - len(expected)], value)
+
+    def test_random_additions_and_removals_match_a_sorted_list(self):
+        for seed in range(200):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                skip_list = IndexableSkipList()
+                expected = []
+                for _ in range(rng.randrange(1, 120)):
+                    if expected and rng.random() < 0.4:
+                        value = rng.choice(expected)
+                        skip_list.remove(value)
+                        expected.remove(value)
+                    else:
+                        # A narrow range of values, so that there are many equal values
+                        value = rng.randrange(30)
+                        skip_list.add(value)
+                        bisect.insort_right(expected, value)
+                    if rng.random() < 0.2:
+                        self.assertMatches(skip_list, expected)
+                self.assertMatches(skip_list, expected)
+
+    def test_equal_values_are_held_in_the_order_added(self):
+        # 1, 1.0 and True are equal, but distinguishable by type
+        skip_list = IndexableSkipList([1.0, 2, True, 0, 1])
+        self.assertEqual([type(value) for value in skip_list], [int, float, bool, int, int])
+        self.assertEqual(list(skip_list), [0, 1, 1, 1, 2])
+
+    def test_initial_values_are_sorted(self):
+        self.assertEqual(list(IndexableSkipList([3, 1, 2])), [1, 2, 3])
+
+    def test_removing_an_absent_value_raises_value_error(self):
+        skip_list = IndexableSkipList([1, 2])
+        with self.assertRaises(ValueError):
+            skip_list.remove(3)
+        self.assertMatches(skip_list, [1, 2])
+
+    def test_indexing_out_of_range_raises_index_error(self):
+        skip_list = IndexableSkipList([1, 2])
+        for index in (2, -3):
+            with self.assertRaises(IndexError):
+                skip_list[index]
+        with self.assertRaises(IndexError):
+            IndexableSkipList()[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
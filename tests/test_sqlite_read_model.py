@@ -0,0 +1,139 @@
+"""Tests of the SQLite read model, against the aggregates replayed from the event log."""
+
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from infrastructure.event_sourced_projections.sqlite_read_model import SQLiteReadModel
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.board import start_project
+from kanban.domain.model.workitem import register_new_work_item
+
+
+class SQLiteReadModelTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.database_path = os.path.join(directory.name, 'kanban.sqlite')
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.to_do = self.board.add_new_column("To do", None)
+            self.doing = self.board.add_new_column("Doing", None)
+            self.done = self.board.add_new_column("Done", None)
+            self.other_board = start_project("Other", "Another board")
+            self.other_board.add_new_column("Only", None)
+            self.work_items = [register_new_work_item("Work item {}".format(index),
+                                                      due_date=datetime.date(2024, 1, 10 - index))
+                               for index in range(5)]
+            for work_item in self.work_items[:4]:
+                self.board.schedule_work_item(work_item)
+            self.board.advance_work_item(self.work_items[1])
+
+    def open_read_model(self):
+        read_model = SQLiteReadModel(self.event_store, self.database_path)
+        self.addCleanup(read_model.close)
+        return read_model
+
+    def modify(self):
+        with unit_of_work(self.persistence_subscriber):
+            self.board.advance_work_item(self.work_items[1])
+            self.board.advance_work_item(self.work_items[2])
+            self.board.retire_work_item(self.work_items[1])
+            self.board.abandon_work_item(self.work_items[0])
+            self.board.insert_new_column_before(self.done, "Review", None)
+            self.board.advance_work_item(self.work_items[2])
+            self.board.name = "Renamed board"
+            self.work_items[3].name = "Renamed work item"
+            self.work_items[4].due_date = datetime.date(2023, 12, 31)
+            self.other_board.discard()
+
+    def assertMatchesReplay(self, read_model):
+        boards = list(BoardRepository(self.event_store).all_boards())
+        work_items = list(WorkItemRepository(self.event_store).all_work_items())
+        for name in {board.name for board in boards} | {"Board", "Other"}:
+            self.assertEqual(sorted(read_model.boards_with_name(name)),
+                             sorted(board.id for board in boards if board.name == name))
+        locations = {}
+        for board in boards:
+            self.assertEqual(read_model.columns_of_board(board.id), [column.id for column in board.columns()])
+            self.assertEqual(read_model.work_item_counts(board.id),
+                             [(column.name, column.number_of_work_items) for column in board.columns()])
+            for column in board.columns():
+                work_item_ids = list(column.work_item_ids())
+                self.assertEqual(read_model.work_items_in_column(column.id), work_item_ids)
+                for priority, work_item_id in enumerate(work_item_ids):
+                    locations[work_item_id] = (board.id, column.id, priority)
+        for work_item in work_items:
+            self.assertEqual(read_model.work_items_with_name(work_item.name),
+                             sorted(other.id for other in work_items if other.name == work_item.name))
+            self.assertEqual(read_model.location_of_work_item(work_item.id), locations.get(work_item.id))
+        self.assertEqual(read_model.work_items_due_between(),
+                         [work_item.id for work_item in sorted(work_items, key=lambda w: (w.due_date, w.id))])
+        earliest, latest = datetime.date(2024, 1, 7), datetime.date(2024, 1, 9)
+        self.assertEqual(read_model.work_items_due_between(earliest, latest),
+                         [work_item.id for work_item in sorted(work_items, key=lambda w: (w.due_date, w.id))
+                          if earliest <= work_item.due_date <= latest])
+        self.assertEqual(read_model.position, self.event_store.end_position())
+
+    def test_follows_the_log(self):
+        read_model = self.open_read_model()
+        self.assertMatchesReplay(read_model)
+        self.modify()
+        self.assertMatchesReplay(read_model)
+
+    def test_reopens_incrementally(self):
+        read_model = SQLiteReadModel(self.event_store, self.database_path)
+        position = read_model.position
+        read_model.close()
+        self.modify()
+        with mock.patch.object(SQLiteReadModel, 'rebuild', autospec=True,
+                               side_effect=SQLiteReadModel.rebuild) as rebuild:
+            read_model = self.open_read_model()
+            self.assertMatchesReplay(read_model)
+        rebuild.assert_not_called()
+        self.assertGreater(read_model.position, position)
+
+    def test_rebuilds_when_the_log_is_replaced(self):
+        read_model = SQLiteReadModel(self.event_store, self.database_path)
+        read_model.close()
+        replacement_path = os.path.join(self.directory, 'replacement.events')
+        with open(self.event_store.store_path, 'rb') as store_file, open(replacement_path, 'wb') as replacement:
+            replacement.write(store_file.read())
+        os.replace(replacement_path, self.event_store.store_path)
+        self.modify()
+        with mock.patch.object(SQLiteReadModel, 'rebuild', autospec=True,
+                               side_effect=SQLiteReadModel.rebuild) as rebuild:
+            read_model = self.open_read_model()
+            self.assertMatchesReplay(read_model)
+        rebuild.assert_called_once()
+
+    def test_rebuilds_when_the_log_is_truncated(self):
+        read_model = self.open_read_model()
+        end_position = self.event_store.end_position()
+        self.modify()
+        self.assertMatchesReplay(read_model)
+        # Truncate the log in place, then append different events in place of those removed
+        os.truncate(self.event_store.store_path, end_position)
+        with mock.patch.object(SQLiteReadModel, 'rebuild', autospec=True,
+                               side_effect=SQLiteReadModel.rebuild) as rebuild:
+            with unit_of_work(self.persistence_subscriber):
+                self.board = next(iter(BoardRepository(self.event_store).all_boards([self.board.id])))
+                self.board.name = "Truncated"
+            self.assertMatchesReplay(read_model)
+        rebuild.assert_called_once()
+        self.assertEqual(read_model.boards_with_name("Truncated"), [self.board.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Tests of the full-text index, against the work items replayed from the event log."""
+
+from collections import Counter
+import math
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from infrastructure.event_sourced_projections.text_index import B, K1, NAME_WEIGHT, TextIndex, tokenize
+from infrastructure.event_sourced_repos.work_item_repository import WorkItemRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model.workitem import register_new_work_item
+
+
+QUERIES = ["export", "report export", "weekly", "the quarterly report", "absent", ""]
+
+
+class TextIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.index_path = os.path.join(directory.name, 'work_items.index')
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.work_items = [
+                register_new_work_item("Export report", content="Export the weekly report as CSV"),
+                register_new_work_item("Weekly review", content="Review the report of the week"),
+                register_new_work_item("Quarterly report", content=None),
+                register_new_work_item("Fix export", content="The export fails for empty reports"),
+            ]
+
+    def open_text_index(self):
+        text_index = TextIndex(self.event_store, self.index_path)
+        self.addCleanup(text_index.close)
+        return text_index
+
+    def modify(self):
+        with unit_of_work(self.persistence_subscriber):
+            self.work_items[0].content = "Export the monthly summary"
+            self.work_items[1].name = "Weekly export"
+            self.work_items[2].content = "Summarise the quarter in a report"
+            self.work_items.append(register_new_work_item("Report export", content="Export export export"))
+
+    def assertMatchesReplay(self, text_index):
+        work_items = list(WorkItemRepository(self.event_store).all_work_items())
+        expected_terms = {}
+        for work_item in work_items:
+            name_terms = Counter(tokenize(work_item.name))
+            terms = Counter({term: NAME_WEIGHT * frequency for term, frequency in name_terms.items()})
+            terms.update(tokenize(work_item.content))
+            expected_terms[work_item.id] = terms
+            self.assertEqual(text_index.terms(work_item.id), dict(terms))
+        average_length = sum(sum(terms.values()) for terms in expected_terms.values()) / len(expected_terms)
+        for query in QUERIES:
+            scores = Counter()
+            for term in set(tokenize(query)):
+                matching = [work_item_id for work_item_id, terms in expected_terms.items() if terms[term]]
+                idf = math.log(1 + (len(expected_terms) - len(matching) + 0.5) / (len(matching) + 0.5))
+                for work_item_id in matching:
+                    frequency = expected_terms[work_item_id][term]
+                    length = sum(expected_terms[work_item_id].values())
+                    scores[work_item_id] += idf * frequency * (K1 + 1) / (
+                        frequency + K1 * (1 - B + B * length / average_length))
+            expected = sorted(scores, key=lambda work_item_id: (-round(scores[work_item_id], 9), work_item_id))
+            with self.subTest(query=query):
+                self.assertEqual(text_index.search(query), expected)
+                self.assertEqual(text_index.search(query, limit=2), expected[:2])
+        self.assertEqual(text_index.position, self.event_store.end_position())
+
+    def subscribed_positions(self, open_text_index):
+        """Open a text index, returning it and the positions from which it followed the log."""
+        with mock.patch.object(EventStore, 'subscribe', autospec=True, side_effect=EventStore.subscribe) as subscribe:
+            text_index = open_text_index()
+            text_index.update()
+        return text_index, [call[0][1] for call in subscribe.call_args_list]
+
+    def test_follows_the_log(self):
+        text_index = self.open_text_index()
+        self.assertMatchesReplay(text_index)
+        self.modify()
+        self.assertMatchesReplay(text_index)
+
+    def test_reopens_incrementally(self):
+        text_index = TextIndex(self.event_store, self.index_path)
+        text_index.save()
+        position = text_index.position
+        text_index.close()
+        self.modify()
+        text_index, positions = self.subscribed_positions(self.open_text_index)
+        self.assertEqual(positions, [position])
+        self.assertMatchesReplay(text_index)
+
+    def test_rebuilds_when_the_log_is_replaced(self):
+        text_index = TextIndex(self.event_store, self.index_path)
+        text_index.save()
+        text_index.close()
+        replacement_path = os.path.join(self.directory, 'replacement.events')
+        with open(self.event_store.store_path, 'rb') as store_file, open(replacement_path, 'wb') as replacement:
+            replacement.write(store_file.read())
+        os.replace(replacement_path, self.event_store.store_path)
+        self.modify()
+        text_index, positions = self.subscribed_positions(self.open_text_index)
+        self.assertEqual(positions, [0])
+        self.assertMatchesReplay(text_index)
+
+    def test_rebuilds_when_the_log_is_truncated(self):
+        end_position = self.event_store.end_position()
+        self.modify()
+        text_index = TextIndex(self.event_store, self.index_path)
+        text_index.save()
+        text_index.close()
+        os.truncate(self.event_store.store_path, end_position)
+        text_index, positions = self.subscribed_positions(self.open_text_index)
+        self.assertEqual(positions[-1], 0)
+        self.assertMatchesReplay(text_index)
+
+    def test_rebuilds_from_a_corrupt_file(self):
+        with open(self.index_path, 'wb') as index_file:
+            index_file.write(b'KTI1 is not compressed')
+        text_index, positions = self.subscribed_positions(self.open_text_index)
+        self.assertEqual(positions, [0])
+        self.assertMatchesReplay(text_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Tests of the storage of work item ids in the Columns of Boards."""
+
+import os
+import tempfile
+import unittest
+
+from infrastructure.event_processing import deserialize_event
+from infrastructure.event_sourced_repos.board_repository import BoardRepository
+from infrastructure.event_store import EventStore
+from infrastructure.persistence_subscriber import PersistenceSubscriber
+from infrastructure.unit_of_work import unit_of_work
+from kanban.domain.model import board
+from kanban.domain.model.board import start_project
+from kanban.domain.model.workitem import register_new_work_item
+from utility.id_sequences import CompactIdList, InternedIdList
+
+
+SEQUENCE_TYPES = dict(list=list, interned=InternedIdList, compact=CompactIdList)
+
+
+def column_contents(board_or_none):
+    return [(column.id, list(column.work_item_ids())) for column in board_or_none.columns()]
+
+
+class WorkItemIdStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.event_store = EventStore(os.path.join(directory.name, 'kanban.events'))
+        self.persistence_subscriber = PersistenceSubscriber(self.event_store)
+        self.addCleanup(self.persistence_subscriber.close)
+        with unit_of_work(self.persistence_subscriber):
+            self.board = start_project("Board", "A board")
+            self.board.add_new_column("To do", None)
+            self.board.add_new_column("Doing", None)
+            self.work_items = [register_new_work_item("Work item {}".format(index)) for index in range(4)]
+            for work_item in self.work_items:
+                self.board.schedule_work_item(work_item)
+            self.board.advance_work_item(self.work_items[1])
+
+    def load_board(self, **kwargs):
+        return next(iter(BoardRepository(self.event_store, **kwargs).all_boards()))
+
+    def test_new_boards_store_ids_in_lists(self):
+        for column in self.board.columns():
+            self.assertIs(type(column._work_item_ids), list)
+        for column in self.load_board().columns():
+            self.assertIs(type(column._work_item_ids), list)
+
+    def test_repositories_with_different_storage_coexist(self):
+        boards = {storage: self.load_board(work_item_id_storage=storage) for storage in SEQUENCE_TYPES}
+        # A Board loaded later does not affect the storage of those loaded earlier
+        for storage, sequence_type in SEQUENCE_TYPES.items():
+            with self.subTest(storage=storage):
+                loaded_board = boards[storage]
+                for column in loaded_board.columns():
+                    self.assertIs(type(column._work_item_ids), sequence_type)
+                self.assertEqual(column_contents(loaded_board), column_contents(self.board))
+
+    def test_boards_with_compact_storage_can_be_modified(self):
+        compact_board = self.load_board(work_item_id_storage='compact')
+        with unit_of_work(self.persistence_subscriber):
+            compact_board.insert_new_column_before(compact_board.column_with_name("Doing"), "Ready", None)
+            compact_board.advance_work_item(self.work_items[0])
+            compact_board.abandon_work_item(self.work_items[2])
+            compact_board.advance_work_item(self.work_items[0])
+        for column in compact_board.columns():
+            self.assertIsInstance(column._work_item_ids, CompactIdList)
+        self.assertEqual(column_contents(compact_board), column_contents(self.load_board()))
+
+    def test_mutators_create_boards_with_storage(self):
+        with self.event_store.open_event_stream() as stored_events:
+            events = [deserialize_event(stored_event) for stored_event in stored_events
+                      if stored_event['attributes']['originator_id'] == self.board.id]
+        mutate = board.mutator('interned')
+        interned_board = None
+        for event in events:
+            interned_board = mutate(interned_board, event)
+        # The storage is a property of the Board, so applies when it is mutated by other means
+        interned_board = board.mutate(interned_board, board.Board.NewColumnAdded(
+            originator_id=interned_board.id, originator_version=interned_board.version,
+            column_id='c' * 32, column_version=0, column_name="Done", wip_limit=None))
+        for column in interned_board.columns():
+            self.assertIsInstance(column._work_item_ids, InternedIdList)
+        self.assertEqual(column_contents(interned_board)[:2], column_contents(self.board))
+
+    def test_unknown_storage_is_refused(self):
+        with self.assertRaises(ValueError):
+            board.mutator('tuple')
+        with self.assertRaises(ValueError):
+            BoardRepository(self.event_store, work_item_id_storage='tuple')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,14 @@
+class Deferred:
+    """A value which is only obtained when it is first needed.
+
+    Subclasses implement resolve() to obtain the value.
+    """
+
+    def resolve(self):
+        """Obtain the value."""
+        raise NotImplementedError
+
+
+def resolved(value):
+    """Obtain a value, resolving it first if it is Deferred."""
+    return value.resolve() if isinstance(value, Deferred) else value
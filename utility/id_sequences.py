@@ -0,0 +1,140 @@
+"""Memory efficient sequences of string identifiers.
+
+Both support the list operations used to maintain ordered collections of ids: append(),
+remove(), index(), indexing, deletion by index, len(), iteration and membership tests.
+"""
+
+import sys
+
+
+class InternedIdList(list):
+    """A list of string ids, each of which is interned when added.
+
+    Equal ids decoded from different events are otherwise distinct string objects. Interning
+    them means that an id held here shares storage with every other interned copy of it.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, ids=()):
+        super().__init__(map(sys.intern, ids))
+
+    def append(self, id):
+        super().append(sys.intern(id))
+
+    def insert(self, index, id):
+        super().insert(index, sys.intern(id))
+
+
+class CompactIdList:
+    """A list of string ids, storing 32 character lowercase hexadecimal ids in 16 bytes each.
+
+    Such ids, as produced by uuid.uuid4().hex, are packed into a single bytearray. Ids are
+    converted back to strings when they are retrieved, so retrieval allocates a new string.
+    Should an id which is not of that form be added, the list reverts to holding strings.
+    """
+
+    __slots__ = ('_data', '_strings')
+
+    _ID_BYTES = 16
+
+    def __init__(self, ids=()):
+        self._data = bytearray()
+        self._strings = None
+        for id in ids:
+            self.append(id)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+    @classmethod
+    def _pack(cls, id):
+        """The bytes representation of an id, or None if it cannot be represented compactly."""
+        if not isinstance(id, str) or len(id) != 2 * cls._ID_BYTES or id != id.lower():
+            return None
+        try:
+            packed = bytes.fromhex(id)
+        except ValueError:
+            return None
+        return packed if len(packed) == cls._ID_BYTES else None
+
+    def _revert_to_strings(self):
+        self._strings = list(self)
+        self._data = None
+
+    def _offset(self, index):
+        return range(len(self))[index] * self._ID_BYTES
+
+    def __len__(self):
+        if self._strings is not None:
+            return len(self._strings)
+        return len(self._data) // self._ID_BYTES
+
+    def __iter__(self):
+        if self._strings is not None:
+            return iter(self._strings)
+        return self._iter_packed()
+
+    def _iter_packed(self):
+        data = self._data
+        offset = 0
+        while offset < len(data):
+            yield data[offset:offset + self._ID_BYTES].hex()
+            offset += self._ID_BYTES
+
+    def __getitem__(self, index):
+        if self._strings is not None:
+            return self._strings[index]
+        offset = self._offset(index)
+        return self._data[offset:offset + self._ID_BYTES].hex()
+
+    def __delitem__(self, index):
+        if self._strings is not None:
+            del self._strings[index]
+            return
+        offset = self._offset(index)
+        del self._data[offset:offset + self._ID_BYTES]
+
+    def __contains__(self, id):
+        try:
+            self.index(id)
+        except ValueError:
+            return False
+        return True
+
+    def append(self, id):
+        if self._strings is None:
+            packed = self._pack(id)
+            if packed is not None:
+                self._data += packed
+                return
+            self._revert_to_strings()
+        self._strings.append(id)
+
+    def index(self, id):
+        """The index of the first occurrence of an id.
+
+        Raises:
+            ValueError: If the id is not present.
+        """
+        if self._strings is not None:
+            return self._strings.index(id)
+        packed = self._pack(id)
+        if packed is not None:
+            start = 0
+            while True:
+                offset = self._data.find(packed, start)
+                if offset < 0:
+                    break
+                if offset % self._ID_BYTES == 0:
+                    return offset // self._ID_BYTES
+                start = offset + 1
+        raise ValueError("{!r} is not in {}".format(id, type(self).__name__))
+
+    def remove(self, id):
+        """Remove the first occurrence of an id.
+
+        Raises:
+            ValueError: If the id is not present.
+        """
+        del self[self.index(id)]
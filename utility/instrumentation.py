@@ -0,0 +1,209 @@
+"""Opt-in instrumentation of hot paths.
+
+When enabled, instrumented code records a count, the cumulative time and a latency histogram
+for each stage of processing (such as decoding, deserializing, mutating, publishing and
+appending) and for each key within a stage (usually an event topic). When disabled, which is
+the default, instrumented code pays only for a check of the module-level enabled flag.
+
+    from utility import instrumentation
+
+    instrumentation.enable()
+    ...
+    print(instrumentation.report_text())
+
+Metrics can also be dumped periodically with a MetricsReporter.
+"""
+
+import json
+import threading
+import time
+
+
+enabled = False
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+# Histogram bucket i counts latencies below 2**i microseconds (and at least 2**(i-1) for i > 0)
+_NUMBER_OF_BUCKETS = 32
+
+
+def enable():
+    """Start recording metrics."""
+    global enabled
+    enabled = True
+
+
+def disable():
+    """Stop recording metrics. Metrics already recorded are retained."""
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Discard all recorded metrics."""
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def event_topic(event):
+    """The topic of an event object, as it would be stored."""
+    return type(event).__module__ + '#' + type(event).__qualname__
+
+
+def record(stage, key, seconds, count=1):
+    """Record the time taken to process one or more items.
+
+    Args:
+        stage: The name of the processing stage, such as 'decode'.
+
+        key: A key distinguishing items within the stage, such as an event topic.
+
+        seconds: The elapsed time.
+
+        count: The number of items processed in that time.
+    """
+    with _metrics_lock:
+        try:
+            metric = _metrics[stage, key]
+        except KeyError:
+            metric = _metrics[stage, key] = _Metric()
+        metric.add(seconds, count)
+
+
+class timer:
+    """A context manager which records the time taken by a block, if instrumentation is enabled.
+
+        with instrumentation.timer('query', 'boards_with_name'):
+            ...
+    """
+
+    __slots__ = ('_stage', '_key', '_start_time')
+
+    def __init__(self, stage, key):
+        self._stage = stage
+        self._key = key
+        self._start_time = None
+
+    def __enter__(self):
+        if enabled:
+            self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._start_time is not None:
+            record(self._stage, self._key, time.perf_counter() - self._start_time)
+
+
+def snapshot():
+    """Obtain the recorded metrics.
+
+    Returns:
+        A dictionary mapping each stage to a dictionary mapping each key to a dictionary with
+        the count, total_seconds, mean_seconds, approximate p50_seconds and p99_seconds, and the
+        latency histogram as a dictionary mapping bucket upper bounds in microseconds to counts.
+    """
+    with _metrics_lock:
+        items = [(stage, key, metric.copy()) for (stage, key), metric in _metrics.items()]
+    result = {}
+    for stage, key, metric in sorted(items, key=lambda item: (item[0], str(item[1]))):
+        result.setdefault(stage, {})[str(key)] = metric.as_dict()
+    return result
+
+
+def report_json():
+    """Obtain the recorded metrics as a JSON string."""
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def report_text():
+    """Obtain the recorded metrics as a human readable table."""
+    lines = ["{:<32} {:<64} {:>10} {:>12} {:>10} {:>10} {:>10}".format(
+        "stage", "key", "count", "total (s)", "mean (us)", "p50 (us)", "p99 (us)")]
+    for stage, keys in snapshot().items():
+        for key, metric in keys.items():
+            lines.append("{:<32} {:<64} {:>10} {:>12.6f} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                stage, key, metric['count'], metric['total_seconds'], metric['mean_seconds'] * 1e6,
+                metric['p50_seconds'] * 1e6, metric['p99_seconds'] * 1e6))
+    return '\n'.join(lines)
+
+
+class _Metric:
+
+    __slots__ = ('count', 'total_seconds', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.buckets = [0] * _NUMBER_OF_BUCKETS
+
+    def add(self, seconds, count):
+        self.count += count
+        self.total_seconds += seconds
+        bucket = int(seconds / count * 1e6).bit_length()
+        self.buckets[min(bucket, _NUMBER_OF_BUCKETS - 1)] += count
+
+    def copy(self):
+        metric = _Metric()
+        metric.count = self.count
+        metric.total_seconds = self.total_seconds
+        metric.buckets = list(self.buckets)
+        return metric
+
+    def percentile(self, fraction):
+        """The upper bound, in seconds, of the bucket containing the given fraction of items."""
+        threshold = fraction * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.buckets):
+            cumulative += count
+            if count and cumulative >= threshold:
+                return (1 << bucket) / 1e6
+        return 0.0
+
+    def as_dict(self):
+        return dict(count=self.count,
+                    total_seconds=self.total_seconds,
+                    mean_seconds=self.total_seconds / self.count if self.count else 0.0,
+                    p50_seconds=self.percentile(0.5),
+                    p99_seconds=self.percentile(0.99),
+                    histogram={str(1 << bucket): count for bucket, count in enumerate(self.buckets) if count})
+
+
+class MetricsReporter:
+    """Periodically writes the recorded metrics to a stream, from a background thread."""
+
+    def __init__(self, stream, interval=60.0, format='text'):
+        """Create a MetricsReporter.
+
+        Args:
+            stream: A writable text stream, such as sys.stderr or an open file.
+
+            interval: The time in seconds between reports.
+
+            format: Either 'text' or 'json'.
+        """
+        if format not in ('text', 'json'):
+            raise ValueError("Unknown metrics format {!r}".format(format))
+        self._stream = stream
+        self._interval = interval
+        self._report = report_text if format == 'text' else report_json
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='MetricsReporter', daemon=True)
+
+    def start(self):
+        """Start reporting."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop reporting, after writing a final report."""
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            self._write()
+        self._write()
+
+    def _write(self):
+        self._stream.write(self._report() + '\n')
+        self._stream.flush()
@@ -0,0 +1,132 @@
+"""A sorted collection which can also be indexed by rank.
+
+The IndexableSkipList is a skip list in which each link records the number of items it
+spans, so that the item of any rank can be found by the same descent as is used to find an
+item by value. Adding, removing and indexing all take O(log n) expected time.
+"""
+
+import random
+
+
+_MAX_LEVELS = 32
+
+
+class _Node:
+
+    __slots__ = ('value', 'next', 'width')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        # The number of items from this node to the next at each level, counting the next
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """A collection of mutually comparable values, kept in ascending order.
+
+    Supports add(), remove(), indexing by rank (including negative ranks), len() and iteration
+    in ascending order. Equal values are held in the order in which they were added.
+    """
+
+    __slots__ = ('_head', '_levels', '_size', '_random')
+
+    def __init__(self, values=()):
+        self._head = _Node(None, _MAX_LEVELS)
+        self._levels = 1
+        self._size = 0
+        # The levels of nodes need not be unpredictable, only independent of the values
+        self._random = random.Random(0)
+        for value in values:
+            self.add(value)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.value
+            node = node.next[0]
+
+    def __getitem__(self, index):
+        """Obtain the value of a rank, counting from zero.
+
+        Raises:
+            IndexError: If there is no such rank.
+        """
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("{} index out of range".format(type(self).__name__))
+        node = self._head
+        remaining = index + 1
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def add(self, value):
+        """Add a value, after any equal values."""
+        levels = self._random_levels()
+        head = self._head
+        if levels > self._levels:
+            for level in range(self._levels, levels):
+                head.width[level] = self._size + 1
+            self._levels = levels
+        # The last node at each level preceding the new node, and the number of items stepped over there
+        preceding = [head] * self._levels
+        steps = [0] * self._levels
+        node = head
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and not value < node.next[level].value:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            preceding[level] = node
+
+        new_node = _Node(value, levels)
+        distance = 0
+        for level in range(levels):
+            node = preceding[level]
+            new_node.next[level] = node.next[level]
+            node.next[level] = new_node
+            new_node.width[level] = node.width[level] - distance
+            node.width[level] = distance + 1
+            distance += steps[level]
+        for level in range(levels, self._levels):
+            preceding[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, value):
+        """Remove the first value equal to a value.
+
+        Raises:
+            ValueError: If there is no such value.
+        """
+        preceding = [self._head] * self._levels
+        node = self._head
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.next[level].value < value:
+                node = node.next[level]
+            preceding[level] = node
+        removed_node = preceding[0].next[0]
+        if removed_node is None or removed_node.value != value:
+            raise ValueError("{!r} is not in the {}".format(value, type(self).__name__))
+
+        for level in range(len(removed_node.next)):
+            node = preceding[level]
+            node.width[level] += removed_node.width[level] - 1
+            node.next[level] = removed_node.next[level]
+        for level in range(len(removed_node.next), self._levels):
+            preceding[level].width[level] -= 1
+        self._size -= 1
+
+    def _random_levels(self):
+        levels = 1
+        while levels < _MAX_LEVELS and self._random.random() < 0.5:
+            levels += 1
+        return levels